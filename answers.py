@@ -0,0 +1,137 @@
+# answers.py
+#
+# Answer matching. Everything that can be worked out from the riddle alone
+# (normalised text, singular forms, accepted synonyms, how many typos to
+# allow) is prepared once when the catalogue loads, so checking a reply is a
+# set lookup and, only if that misses, a bounded edit-distance check that
+# gives up as soon as the typo budget is exceeded.
+#
+# The typos allowed are a missing or extra letter and two swapped neighbours.
+# Replacing a letter is not one of them: a single substitution turns too many
+# answers into other real words (gold for cold, tower for towel, liver for
+# river), so it costs two edits, which only long answers can afford. The
+# budget is per word and every word of the answer has to be there: "letter"
+# is not "letter e".
+
+import re
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+# Words that carry no meaning in a reply: "An echo", "it's the echo", "its lid".
+_FILLER = {"a", "an", "the", "its", "it", "is", "s", "my", "your", "answer", "i", "think"}
+
+# Extra accepted answers per normalised answer; a riddle may also list its own
+# under an "accept" key in riddles.json.
+SYNONYMS = {
+    "e": ["letter e"],
+    "letter e": ["e"],
+    "phone": ["telephone", "mobile phone", "cell phone", "cellphone"],
+    "garbage truck": ["rubbish truck", "trash truck", "dustbin lorry"],
+    "day and night": ["night and day"],
+    "catcher and umpire": ["umpire and catcher"],
+    "nails": ["nail"],
+    "footsteps": ["footstep", "steps"],
+    "stairs": ["staircase", "steps"],
+    "tomorrow": ["the future"],
+    "post office": ["postoffice"],
+}
+
+
+def normalise(text):
+    """Lower-case, drop punctuation and filler words, collapse spaces."""
+    words = [w for w in _PUNCT_RE.sub(" ", (text or "").lower()).split() if w not in _FILLER]
+    return " ".join(words)
+
+
+# Words whose trailing "s" is not a plural ("news" is not "new").
+_KEEP_S = {
+    "news", "lens", "gas", "bus", "atlas", "canvas", "bias", "chaos", "series", "species",
+    "glasses", "physics", "mathematics", "politics", "measles", "thanks",
+}
+
+
+def _singular(word):
+    if word in _KEEP_S:
+        return word
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith(("ches", "shes", "sses", "xes", "zes", "oes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def canonical(text):
+    """normalise() plus singular forms, the shape both answers and replies are compared in."""
+    return " ".join(_singular(w) for w in normalise(text).split())
+
+
+def _typo_budget(length):
+    if length <= 3:
+        return 0
+    if length <= 6:
+        return 1
+    return 2
+
+
+def prepare(answer, accept=()):
+    """Precompute the matcher for one riddle's answer."""
+    forms = {canonical(answer)}
+    for alt in list(accept) + SYNONYMS.get(normalise(answer), []):
+        forms.add(canonical(alt))
+    forms.discard("")
+    forms = tuple(sorted(forms))
+    return {
+        "forms": frozenset(forms),
+        "fuzzy": tuple(tuple((word, _typo_budget(len(word))) for word in form.split()) for form in forms),
+    }
+
+
+def within_distance(a, b, limit):
+    """True if a and b are at most `limit` edits apart, counting insertions,
+    deletions and adjacent transpositions one each (OSA distance without
+    substitutions: replacing a letter counts as a deletion plus an insertion).
+
+    Rows are abandoned as soon as every cell exceeds the limit, so clearly
+    different strings are rejected after a few characters.
+    """
+    la, lb = len(a), len(b)
+    if abs(la - lb) > limit:
+        return False
+    if limit == 0:
+        return a == b
+    prev2 = None
+    prev = list(range(lb + 1))
+    for i in range(1, la + 1):
+        cur = [i] + [0] * lb
+        ca = a[i - 1]
+        row_min = i
+        for j in range(1, lb + 1):
+            cost = 0 if ca == b[j - 1] else 2
+            value = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if prev2 is not None and j > 1 and ca == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, prev2[j - 2] + 1)
+            cur[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return False
+        prev2, prev = prev, cur
+    return prev[lb] <= limit
+
+
+def matches(matcher, reply):
+    """Does a player's reply count as the answer?"""
+    guess = canonical(reply)
+    if not guess:
+        return False
+    if guess in matcher["forms"]:
+        return True
+    words = guess.split()
+    for form in matcher["fuzzy"]:
+        if len(form) == len(words) and any(budget for _, budget in form) and all(
+            within_distance(word, target, budget) for word, (target, budget) in zip(words, form)
+        ):
+            return True
+    return False
@@ -1,215 +1,223 @@
 import os
+import hmac
 import json
 import logging
-from datetime import datetime, timedelta
 from flask import Flask, request, jsonify
-import requests
-import hmac
-import hashlib
 import uuid
 
+import config
+import daily
+import database
+import eventlog
+import filestore
+import leaderboard
+import metrics
+import payments
+import pipeline
+import referrals
+import rewards
+import riddles
+import snapshot
+import telegram_client
+import throttle
+import user_store
+from webhook import webhook_bp
+from config import (
+    COIN_PACKS,
+    DASHBOARD_TOKEN,
+    ENTRY_FEES,
+    DATA_DIR,
+    HINT_COST,
+    MAX_DAILY_RIDDLES,
+    MONETAG_KEY,
+    POINTS_CORRECT_ANSWER,
+    POINTS_HINT_PENALTY,
+    PRIZES,
+    PROFILER_TOKEN,
+    SATURDAY_RIDDLES_COUNT,
+    STORAGE_BACKEND,
+    UNLOCK_ALL_FEES,
+)
+
 app = Flask(__name__)
+app.register_blueprint(webhook_bp)
 
 # --------------------
 # Config & Globals
 # --------------------
 
-DATA_DIR = "data"
 USERS_FILE = os.path.join(DATA_DIR, "users.json")
 SCORES_FILE = os.path.join(DATA_DIR, "scores.json")
-RIDDLES_DIR = os.path.join(DATA_DIR, "riddles")
-
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-TELEGRAM_API_URL = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
-
-PAYSTACK_SECRET_KEY = os.getenv("PAYSTACK_SECRET_KEY")
-PAYSTACK_BASE_URL = "https://api.paystack.co"
-
-MONETAG_KEY = os.getenv("MONETAG_KEY")
-
-ENTRY_FEES = {
-    "free": 0,
-    "vip": 2000,
-    "premium": 500,
-}
-
-UNLOCK_ALL_FEES = {
-    "vip": 200,
-    "premium": 100,
-}
-
-PRIZES = {
-    "vip": {
-        "1": 10000,
-        "2": 5000,
-        "3": 3000,
-        "4-10": 1000,  # airtime
-    },
-    "premium": {
-        "1": 5000,
-        "2": 3000,
-        "3": 1000,
-        "4-10": 500,  # airtime
-    },
-    "free": {
-        "no_cash_prize": True,
-    },
-}
-
-COIN_PACKS = {
-    50: 200,
-    100: 350,
-    200: 600,
-    500: 1200,
-}
-
-HINT_COST = 10
-POINTS_CORRECT_ANSWER = 10
-POINTS_HINT_PENALTY = 3
-
-MAX_DAILY_RIDDLES = 7
-SATURDAY_RIDDLES_COUNT = 10
+
+# Tokens, keys, prices, prizes and gameplay limits are defined in config.py
+# so background jobs (payments, payouts, broadcasts) can use them without
+# importing Flask. Heavy client modules (requests, paystack) load on first use.
 
 logging.basicConfig(level=logging.INFO)
 
+for warning in config.validate():
+    logging.warning(warning)
+
+# Parse the riddle catalogue once per worker, before the first request. A
+# broken file is logged rather than stopping the import; requests retry it.
+try:
+    riddles.get_catalogue()
+except (OSError, ValueError):
+    logging.exception("Could not load the riddle catalogue from %s", riddles.RIDDLES_FILE)
+
 # --------------------
 # Utility Functions
 # --------------------
 
+@metrics.timed("storage_io_seconds", op="load_json")
 def load_json(filename):
-    if not os.path.exists(filename):
-        return {}
-    with open(filename, "r") as f:
-        return json.load(f)
+    return filestore.read_json(filename)
 
+# Atomic replace; read-modify-write callers go through filestore.update_json
+# so concurrent workers cannot drop each other's changes.
+@metrics.timed("storage_io_seconds", op="save_json")
 def save_json(filename, data):
-    with open(filename, "w") as f:
-        json.dump(data, f, indent=2)
+    filestore.write_json(filename, data)
 
 def send_message(chat_id, text, reply_markup=None):
-    data = {
-        "chat_id": chat_id,
-        "text": text,
-        "parse_mode": "Markdown",
-    }
-    if reply_markup:
-        data["reply_markup"] = json.dumps(reply_markup)
-    requests.post(f"{TELEGRAM_API_URL}/sendMessage", data=data)
+    telegram_client.send_message(chat_id, text, reply_markup)
 
 def edit_message(chat_id, message_id, text, reply_markup=None):
-    data = {
-        "chat_id": chat_id,
-        "message_id": message_id,
-        "text": text,
-        "parse_mode": "Markdown",
-    }
-    if reply_markup:
-        data["reply_markup"] = json.dumps(reply_markup)
-    requests.post(f"{TELEGRAM_API_URL}/editMessageText", data=data)
+    telegram_client.edit_message(chat_id, message_id, text, reply_markup)
 
 def get_user_data(user_id):
-    users = load_json(USERS_FILE)
-    return users.get(str(user_id))
+    return user_store.get_user(user_id)
 
 def update_user_data(user_id, user_data):
-    users = load_json(USERS_FILE)
-    users[str(user_id)] = user_data
-    save_json(USERS_FILE, users)
+    user_store.set_user(user_id, user_data)
 
 def get_scores():
+    if STORAGE_BACKEND == "sqlite":
+        return database.get_scores()
     return load_json(SCORES_FILE)
 
 def update_scores(scores):
-    save_json(SCORES_FILE, scores)
+    if STORAGE_BACKEND == "sqlite":
+        database.save_scores(scores)
+    else:
+        with filestore.locked(SCORES_FILE):
+            save_json(SCORES_FILE, scores)
+    leaderboard.rebuild_index(scores)
+
+def update_score(section, user_id, username, points):
+    if STORAGE_BACKEND == "sqlite":
+        database.update_score(section, user_id, username, points)
+    else:
+        def apply(scores):
+            scores.setdefault(section, {})[str(user_id)] = {"username": username, "points": points}
+        filestore.update_json(SCORES_FILE, apply)
+    if not leaderboard.index_is_stale():
+        leaderboard.record_score(section, user_id, username, points)
+
+# Gameplay events go to the append-only event log (eventlog.py); its
+# materialiser adds answer points to the stored scores and the leaderboard a
+# few seconds later, so an answer no longer rewrites the scores file.
+def record_answer(user_id, username, section, riddle_id, points):
+    eventlog.append("answer", user_id, section, riddle_id, points, username)
+
+def record_hint(user_id, section, riddle_id):
+    eventlog.append("hint", user_id, section, riddle_id)
+
+def record_skip(user_id, section, riddle_id):
+    eventlog.append("skip", user_id, section, riddle_id)
 
 def get_riddles(section):
-    riddles_file = os.path.join(RIDDLES_DIR, f"{section}.json")
-    return load_json(riddles_file)
+    return riddles.section_riddles(section)
 
 def verify_paystack_signature(request):
-    signature = request.headers.get('X-Paystack-Signature')
-    body = request.get_data()
-    computed_signature = hmac.new(
-        PAYSTACK_SECRET_KEY.encode('utf-8'),
-        body,
-        hashlib.sha512
-    ).hexdigest()
-    return hmac.compare_digest(computed_signature, signature)
+    return payments.verify_signature(request.get_data(), request.headers.get('X-Paystack-Signature'))
 
 def generate_paystack_payment_link(email, amount, reference, metadata):
-    headers = {
-        "Authorization": f"Bearer {PAYSTACK_SECRET_KEY}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "email": email,
-        "amount": amount,
-        "reference": reference,
-        "metadata": metadata,
-        "callback_url": os.getenv("PAYSTACK_CALLBACK_URL"),
-    }
-    response = requests.post(f"{PAYSTACK_BASE_URL}/transaction/initialize", json=data, headers=headers)
-    res_json = response.json()
-    if res_json.get("status") and res_json.get("data"):
-        return res_json["data"]["authorization_url"], res_json["data"]["reference"]
+    # Imported on first use so workers that never take a payment skip it.
+    import paystack
+
+    result = paystack.initialize_payment(
+        email, amount, metadata, reference=reference, callback_url=os.getenv("PAYSTACK_CALLBACK_URL")
+    )
+    if result:
+        return result["authorization_url"], result["reference"]
     return None, None
 
-def format_leaderboard_text(scores, section):
-    if not scores or section not in scores:
-        return "No scores yet."
-    sorted_scores = sorted(scores[section].items(), key=lambda x: x[1]["points"], reverse=True)
-    text = f"*Leaderboard for {section.capitalize()} Section:*\n\n"
-    for i, (user_id, data) in enumerate(sorted_scores[:10], 1):
-        username = data.get("username", "Anonymous")
-        points = data.get("points", 0)
-        text += f"{i}. {username}: {points} points\n"
+def format_leaderboard_text(section, user_id=None):
+    if leaderboard.index_is_stale():
+        leaderboard.rebuild_index(get_scores())
+    text = leaderboard.leaderboard_text(section)
+    if user_id is not None:
+        rank = leaderboard.user_rank(section, user_id)
+        if rank:
+            text += f"\nYour rank: #{rank[0]} ({rank[1]} points)"
     return text
 
 def reset_daily_data_if_needed(user_data):
-    today_str = datetime.utcnow().strftime("%Y-%m-%d")
-    if user_data.get("last_active_day") != today_str:
-        user_data["last_active_day"] = today_str
-        user_data["daily_riddles_done"] = 0
-        user_data["daily_scores"] = {"free": 0, "vip": 0, "premium": 0, "saturday": 0}
-        user_data["hints_used_today"] = 0
-        user_data["unlocked_all"] = False
+    # Only needed right before writing a record; for reads use daily.get_daily(),
+    # which treats counters from an earlier day as zero without a write.
+    daily.roll_over(user_data)
     return user_data
 
-def is_saturday():
-    # UTC Saturday
-    return datetime.utcnow().weekday() == 5
-
-def show_monetag_ad(chat_id):
-    if not MONETAG_KEY:
-        ad_text = (
-            "🔔 *Sponsored Ad*\n"
-            "Enjoy Daily Riddle Wars! Support us by checking this ad.\n"
-            "Support us by visiting our sponsor."
-        )
-        send_message(chat_id, ad_text)
-        return
-
-    ad_text = (
+# Ad payloads never change, so the keyboard is serialised once here.
+if MONETAG_KEY:
+    AD_TEXT = (
         "🔔 *Sponsored Ad*\n"
         "Enjoy Daily Riddle Wars! Support us by checking this ad.\n"
         "Click the button below to support us!"
     )
-
-    keyboard = {
+    AD_KEYBOARD = json.dumps({
         "inline_keyboard": [
             [{"text": "Visit Sponsor", "url": MONETAG_KEY}]
         ]
-    }
+    })
+else:
+    AD_TEXT = (
+        "🔔 *Sponsored Ad*\n"
+        "Enjoy Daily Riddle Wars! Support us by checking this ad.\n"
+        "Support us by visiting our sponsor."
+    )
+    AD_KEYBOARD = None
 
-    send_message(chat_id, ad_text, reply_markup=keyboard)
+def show_monetag_ad(chat_id):
+    send_message(chat_id, AD_TEXT, reply_markup=AD_KEYBOARD)
 
 # --------------------
 # Command Handlers
 # --------------------
 
-def handle_start(user_id, chat_id, username):
-    users = load_json(USERS_FILE)
-    user = users.get(str(user_id))
+# Everything in the welcome message except the greeting is the same for every
+# player, so it and the section keyboard are built and serialised once.
+WELCOME_BODY = (
+    "Choose a section to play:\n\n"
+    "*Free Section*\n"
+    "- Play up to 7 riddles daily for free\n"
+    "- No cash prizes, just fun and leaderboard\n\n"
+    "*VIP Section* (Entry Fee: ₦2000)\n"
+    "- Play 7 riddles daily or unlock all 50 for ₦200\n"
+    "- Prizes: 1st ₦10,000, 2nd ₦5,000, 3rd ₦3,000, 4th-10th ₦1,000 airtime\n\n"
+    "*Premium Section* (Entry Fee: ₦500)\n"
+    "- Play 7 riddles daily or unlock all 50 for ₦100\n"
+    "- Prizes: 1st ₦5,000, 2nd ₦3,000, 3rd ₦1,000, 4th-10th ₦500 airtime\n\n"
+    "*Saturday Challenge*\n"
+    "- 10 hard riddles every Saturday for paid VIP/Premium players\n"
+    "- Special leaderboard and prizes\n\n"
+    "Use /buycoins to buy coins for hints (each hint costs 10 coins, and reduces points by 3).\n"
+    "Use /leaderboard to see the leaderboard.\n"
+    "Use /help for more info.\n\n"
+    "Please select your section now:"
+)
+WELCOME_KEYBOARD = json.dumps({
+    "inline_keyboard": [
+        [{"text": "Free Section (No Fee)", "callback_data": "choose_free"}],
+        [{"text": "VIP Section (₦2000 Entry)", "callback_data": "choose_vip"}],
+        [{"text": "Premium Section (₦500 Entry)", "callback_data": "choose_premium"}],
+        [{"text": "Saturday Challenge Info", "callback_data": "show_saturday_info"}],
+    ]
+})
+
+def handle_start(user_id, chat_id, username, referrer_id=None):
+    user = user_store.get_user(user_id)
     if not user:
         user = {
             "id": user_id,
@@ -218,9 +226,10 @@ def handle_start(user_id, chat_id, username):
             "hints": 0,
             "section": None,
             "daily_riddles_done": 0,
-            "last_active_day": datetime.utcnow().strftime("%Y-%m-%d"),
+            "last_active_day": daily.today_key(),
             "daily_scores": {"free": 0, "vip": 0, "premium": 0, "saturday": 0},
             "streak": 0,
+            "streak_day": 0,
             "referrals": [],
             "referred_by": None,
             "has_paid_entry": False,
@@ -233,38 +242,13 @@ def handle_start(user_id, chat_id, username):
             "unlocked_all": False,
             "answered_riddles_count": 0,
         }
-        users[str(user_id)] = user
-        save_json(USERS_FILE, users)
-
-    welcome_text = (
-        f"👋 *Welcome to Daily Riddle Wars, {username or 'Player'}!*\n\n"
-        "Choose a section to play:\n\n"
-        "*Free Section*\n"
-        "- Play up to 7 riddles daily for free\n"
-        "- No cash prizes, just fun and leaderboard\n\n"
-        "*VIP Section* (Entry Fee: ₦2000)\n"
-        "- Play 7 riddles daily or unlock all 50 for ₦200\n"
-        "- Prizes: 1st ₦10,000, 2nd ₦5,000, 3rd ₦3,000, 4th-10th ₦1,000 airtime\n\n"
-        "*Premium Section* (Entry Fee: ₦500)\n"
-        "- Play 7 riddles daily or unlock all 50 for ₦100\n"
-        "- Prizes: 1st ₦5,000, 2nd ₦3,000, 3rd ₦1,000, 4th-10th ₦500 airtime\n\n"
-        "*Saturday Challenge*\n"
-        "- 10 hard riddles every Saturday for paid VIP/Premium players\n"
-        "- Special leaderboard and prizes\n\n"
-        "Use /buycoins to buy coins for hints (each hint costs 10 coins, and reduces points by 3).\n"
-        "Use /leaderboard to see the leaderboard.\n"
-        "Use /help for more info.\n\n"
-        "Please select your section now:"
-    )
-    keyboard = {
-        "inline_keyboard": [
-            [{"text": "Free Section (No Fee)", "callback_data": "choose_free"}],
-            [{"text": "VIP Section (₦2000 Entry)", "callback_data": "choose_vip"}],
-            [{"text": "Premium Section (₦500 Entry)", "callback_data": "choose_premium"}],
-            [{"text": "Saturday Challenge Info", "callback_data": "show_saturday_info"}],
-        ]
-    }
-    send_message(chat_id, welcome_text, keyboard)
+        user_store.set_user(user_id, user)
+        # Invite links are t.me/<bot>?start=<referrer id>; only new players count.
+        if referrer_id is not None:
+            referrals.record(user_id, referrer_id)
+
+    welcome_text = f"👋 *Welcome to Daily Riddle Wars, {username or 'Player'}!*\n\n" + WELCOME_BODY
+    send_message(chat_id, welcome_text, WELCOME_KEYBOARD)
 
 # The rest of your handler functions such as handle_section_choice, handle_payentry, handle_checkpayment,
 # handle_play, handle_answer etc. would go here exactly as before, unchanged except to call show_monetag_ad(chat_id)
@@ -280,9 +264,45 @@ def handle_start(user_id, chat_id, username):
 def index():
     return "Daily Riddle Wars Bot is running!"
 
-@app.route("/webhook", methods=["POST"])
-def webhook():
-    data = request.get_json()
+COMMANDS = {"/start": "start", "/play": "play", "/checkpayment": "checkpayment", "/leaderboard": "leaderboard"}
+CALLBACKS = {"unlock_all_riddles", "show_saturday_info", "use_hint", "skip_riddle"}
+
+def update_handler_name(data):
+    """Metric label for the handler an update is routed to (kept low-cardinality)."""
+    if "message" in data:
+        text = data["message"].get("text", "")
+        return COMMANDS.get(text.split(" ", 1)[0], "command_other" if text.startswith("/") else "answer")
+    if "callback_query" in data:
+        data_cb = data["callback_query"].get("data", "")
+        if data_cb.startswith("choose_"):
+            return "callback_choose"
+        return "callback_" + data_cb if data_cb in CALLBACKS else "callback_other"
+    return "other"
+
+def process_update(data):
+    """Run the handlers for one Telegram update (called from pipeline workers)."""
+    with metrics.timed("telegram_update_seconds", handler=update_handler_name(data)):
+        dispatch_update(data)
+    with metrics.timed("telegram_update_seconds", handler="check_in"):
+        check_in(data)
+
+def check_in(data):
+    # The first update of a user's day pays the login reward and streak bonus.
+    for kind in ("message", "callback_query"):
+        if kind in data:
+            sender = data[kind]["from"]
+            chat = (data[kind] if kind == "message" else data[kind]["message"])["chat"]
+            break
+    else:
+        return
+    reward = rewards.check_in(sender["id"])
+    if reward:
+        text = f"🎁 Daily login: +{reward['login']} coins. Streak: {reward['streak']} day(s)."
+        if reward["bonus"]:
+            text += f"\n🔥 {reward['streak']}-day streak bonus: +{reward['bonus']} coins!"
+        send_message(chat["id"], text)
+
+def dispatch_update(data):
     if "message" in data:
         message = data["message"]
         chat_id = message["chat"]["id"]
@@ -292,10 +312,16 @@ def webhook():
 
         if text == "/start":
             handle_start(user_id, chat_id, username)
+        elif text.startswith("/start ") and text[7:].strip().isdigit():
+            handle_start(user_id, chat_id, username, int(text[7:].strip()))
         elif text == "/play":
             handle_play(user_id, chat_id)
         elif text == "/checkpayment":
             handle_checkpayment(user_id, chat_id)
+        elif text == "/leaderboard":
+            user = get_user_data(user_id)
+            section = (user or {}).get("section") or "free"
+            send_message(chat_id, format_leaderboard_text(section, user_id))
         # Add other command handlers here
         else:
             # If user is answering a riddle
@@ -329,8 +355,103 @@ def webhook():
         else:
             send_message(chat_id, "Unknown action.")
 
+@app.route("/webhook", methods=["POST"])
+def webhook():
+    data = request.get_json(silent=True)
+    if not pipeline.is_valid_update(data):
+        # Nothing we can act on; ack so Telegram does not keep redelivering it.
+        return jsonify({"status": "ignored"})
+    # A redelivered update is acked before it can spend anyone's tokens.
+    if not pipeline.claim(data):
+        return jsonify({"status": "ok"})
+    # Spam is turned away here, before the update costs any storage I/O.
+    verdict, chat_id, retry_after = throttle.check(data)
+    if verdict == "busy":
+        pipeline.forget(data["update_id"])  # Telegram will redeliver it
+        return jsonify({"status": "busy"}), 503, {"Retry-After": str(max(1, round(retry_after)))}
+    if verdict != "ok":
+        if verdict == "cooldown" and chat_id is not None:
+            send_message(chat_id, throttle.cooldown_text(retry_after))
+        return jsonify({"status": "throttled"})
+    pipeline.start(process_update)
+    if pipeline.submit(data, claimed=True) == "full":
+        return jsonify({"status": "busy"}), 503
     return jsonify({"status": "ok"})
 
+@app.route("/metrics/pipeline", methods=["GET"])
+def pipeline_metrics():
+    return jsonify(pipeline.metrics())
+
+# Dashboard reads come from the mmap'd snapshot (snapshot.py), never from the
+# user store, so they cannot slow the bot down.
+MAX_PAGE_SIZE = 200
+
+def dashboard_allowed():
+    if not DASHBOARD_TOKEN:
+        return False  # closed until a token is configured
+    return hmac.compare_digest(request.headers.get("X-Dashboard-Token", ""), DASHBOARD_TOKEN)
+
+def snapshot_building():
+    return jsonify({"status": "building"}), 503, {"Retry-After": "5"}
+
+@app.route("/api/leaderboard/<section>", methods=["GET"])
+def leaderboard_page(section):
+    if not dashboard_allowed():
+        return jsonify({"error": "forbidden"}), 403
+    snap = snapshot.current()
+    if snap is None:
+        return snapshot_building()
+    per_page = max(1, min(request.args.get("per_page", 50, type=int), MAX_PAGE_SIZE))
+    page = max(1, request.args.get("page", 1, type=int))
+    return jsonify({
+        "section": section,
+        "built_at": snap.built_at,
+        "total": snap.section_size(section),
+        "page": page,
+        "per_page": per_page,
+        "entries": snap.page(section, (page - 1) * per_page, per_page),
+    })
+
+@app.route("/api/profile/<int:user_id>", methods=["GET"])
+def profile(user_id):
+    if not dashboard_allowed():
+        return jsonify({"error": "forbidden"}), 403
+    snap = snapshot.current()
+    if snap is None:
+        return snapshot_building()
+    data = snap.profile(user_id)
+    if data is None:
+        return jsonify({"error": "not found"}), 404
+    return jsonify({"built_at": snap.built_at, **data})
+
+# Scrape-time gauges for the queues that live outside metrics.py.
+metrics.gauge("pipeline_queue_depth", lambda: pipeline.metrics()["queue_depth"],
+              "Telegram updates waiting for a worker")
+metrics.gauge("telegram_send_queue_depth", telegram_client.queue_depth,
+              "Outgoing Telegram calls waiting to be sent")
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+# Sampling profiler, switched on at runtime:
+#   POST /debug/profiler?action=start|stop   GET /debug/profiler
+# Disabled unless PROFILER_TOKEN is set; requests must send it as X-Profiler-Token.
+@app.route("/debug/profiler", methods=["GET", "POST"])
+def profiler():
+    token = request.headers.get("X-Profiler-Token", "")
+    if not PROFILER_TOKEN or not hmac.compare_digest(token, PROFILER_TOKEN):
+        return jsonify({"error": "not found"}), 404
+    if request.method == "POST":
+        action = request.args.get("action")
+        if action == "start":
+            metrics.start_profiler(request.args.get("interval", type=float))
+        elif action == "stop":
+            metrics.stop_profiler()
+        else:
+            return jsonify({"error": "action must be start or stop"}), 400
+    return jsonify(metrics.profile_report(request.args.get("limit", 50, type=int)))
+
 # --------------------
 # Main
 # --------------------
@@ -0,0 +1,408 @@
+# asgi.py
+#
+# Asyncio (ASGI 3) entry point, an alternative to serving the Flask app in
+# app.py with gunicorn threads:
+#
+#   uvicorn asgi:app          (or any ASGI server; none is in requirements.txt)
+#
+# It serves the Telegram and Paystack webhooks with the same handlers: an
+# update is validated, de-duplicated and throttled exactly as app.webhook()
+# does, acked at once, and then app.process_update runs on a bounded thread
+# pool (storage and other blocking work stay off the event loop). Updates
+# from one user run one at a time, in order; different users run in parallel.
+# Up to MAX_IN_FLIGHT updates can be pending per process, each one costing a
+# small task rather than a thread.
+#
+# Outgoing Telegram messages are delivered by coroutines instead of
+# telegram_client's sender threads: the same queue, per-chat ordering and
+# rate limits, but up to SEND_CONCURRENCY requests in flight over
+# non-blocking keep-alive connections. Paystack webhooks are recorded on the
+# pool; fulfilment stays on payments.py's background thread.
+#
+# Only the bot-facing routes are here (/, /webhook, /paystack-webhook,
+# /metrics). The dashboard and admin routes remain Flask-only.
+
+import asyncio
+import json
+import logging
+import os
+import ssl
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+import app as bot
+import metrics
+import payments
+import pipeline
+import telegram_client
+import throttle
+import webhook
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_THREADS = int(os.getenv("ASGI_EXECUTOR_THREADS", "16"))
+MAX_IN_FLIGHT = int(os.getenv("ASGI_MAX_IN_FLIGHT", "10000"))  # updates accepted but not finished
+SEND_CONCURRENCY = int(os.getenv("ASGI_SEND_CONCURRENCY", "200"))  # Telegram requests in flight
+SEND_TIMEOUT = 15.0  # seconds per Telegram request
+POOL_IDLE = int(os.getenv("ASGI_POOL_IDLE", "32"))  # idle keep-alive connections kept per host
+MAX_BODY = 1 << 20  # bytes
+
+_executor = None
+_loop = None
+_wake = None  # set when telegram_client may have a job due
+_tasks = set()
+_user_locks = {}  # user key -> [asyncio.Lock, updates waiting or running]
+_in_flight = 0
+
+
+# --------------------
+# Outbound HTTP
+# --------------------
+
+class HTTPClient:
+    """Minimal keep-alive HTTP/1.1 client on asyncio streams: form-encoded
+    POSTs; Content-Length, chunked or close-delimited responses. Enough for
+    the Bot API. At most max_idle idle connections are kept per host; a
+    burst that opened more closes the surplus as it finishes."""
+
+    def __init__(self, max_idle=POOL_IDLE):
+        self.idle = {}  # (scheme, host, port) -> [(reader, writer)]
+        self.max_idle = max_idle
+        self.ssl_context = None
+
+    async def _open(self, scheme, host, port):
+        if scheme == "https" and self.ssl_context is None:
+            self.ssl_context = ssl.create_default_context()
+        return await asyncio.open_connection(host, port, ssl=self.ssl_context if scheme == "https" else None)
+
+    def _reuse(self, key):
+        conns = self.idle.get(key)
+        while conns:
+            reader, writer = conns.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return None
+
+    @staticmethod
+    async def _read_response(reader):
+        """Returns (status, headers, body, whether the connection can be reused)."""
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by server")
+        version, status = status_line.split()[:2]
+        status = int(status)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass  # trailers
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        elif status in (204, 304) or status < 200:
+            body = b""
+        else:
+            # No length: the body runs to the end of the connection.
+            return status, headers, await reader.read(), False
+        keep_alive = headers.get("connection", "").lower() != "close" and version == b"HTTP/1.1"
+        return status, headers, body, keep_alive
+
+    async def post_form(self, url, data, timeout):
+        """POST data form-encoded. Returns (status, body bytes)."""
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme, parts.hostname, port)
+        body = urlencode(data).encode()
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        request = (
+            f"POST {path} HTTP/1.1\r\nHost: {parts.hostname}:{port}\r\n"
+            "Content-Type: application/x-www-form-urlencoded\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n"
+        ).encode() + body
+        # A pooled connection the server has since closed fails on first
+        # use; that one attempt is repeated on a fresh connection.
+        conn = self._reuse(key)
+        for reused in ((True, False) if conn else (False,)):
+            if not reused:
+                conn = await asyncio.wait_for(self._open(*key), timeout)
+            reader, writer = conn
+            try:
+                writer.write(request)
+                status, _, payload, keep_alive = await asyncio.wait_for(self._read_response(reader), timeout)
+                break
+            except (ConnectionError, asyncio.IncompleteReadError) as exc:
+                writer.close()
+                if not reused:
+                    raise ConnectionError(str(exc)) from exc
+            except BaseException:
+                writer.close()
+                raise
+        idle = self.idle.setdefault(key, [])
+        if keep_alive and len(idle) < self.max_idle:
+            idle.append((reader, writer))
+        else:
+            writer.close()
+        return status, payload
+
+
+_http = HTTPClient()
+
+
+async def call_telegram(method, data):
+    """The async twin of telegram_client.call: same global bucket, metrics
+    and retries, without holding a thread while the request is out."""
+    delay = telegram_client.global_bucket.reserve()
+    if delay:
+        await asyncio.sleep(delay)
+    url = f"{telegram_client.TELEGRAM_API_URL}/{method}"
+    for attempt in range(telegram_client.MAX_RETRIES + 1):
+        try:
+            with metrics.timed("telegram_api_seconds", method=method):
+                status, payload = await _http.post_form(url, data, SEND_TIMEOUT)
+            metrics.inc("telegram_api_responses_total", method=method, status=status)
+            if status < 500:
+                try:
+                    return json.loads(payload)
+                except ValueError:
+                    return {"ok": False, "error_code": status, "description": payload[:200].decode("utf-8", "replace")}
+        except (OSError, asyncio.TimeoutError, ValueError) as exc:
+            logger.warning("Telegram %s failed: %s", method, exc)
+        if attempt < telegram_client.MAX_RETRIES:
+            telegram_client.stats["retried"] += 1
+            await asyncio.sleep(0.5 * 2 ** attempt)
+    return {"ok": False, "description": "request failed"}
+
+
+async def _deliver(chat_id, job, slots):
+    try:
+        result = await call_telegram(job["method"], job["data"])
+    except Exception:
+        logger.exception("Telegram %s to %s crashed", job["method"], chat_id)
+        result = {"ok": False}
+    finally:
+        slots.release()
+    telegram_client.complete(chat_id, job, result)
+
+
+async def _send_loop():
+    slots = asyncio.Semaphore(SEND_CONCURRENCY)
+    while True:
+        _wake.clear()
+        chat_id, item = telegram_client.take_job()
+        if chat_id is None:
+            try:
+                await asyncio.wait_for(_wake.wait(), item)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await slots.acquire()
+        _spawn(_deliver(chat_id, item, slots))
+
+
+# --------------------
+# Updates
+# --------------------
+
+def _spawn(coro):
+    task = asyncio.ensure_future(coro)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+def _process(update):
+    try:
+        bot.process_update(update)
+        metrics.inc("asgi_updates_total", result="processed")
+    except Exception:
+        metrics.inc("asgi_updates_total", result="error")
+        logger.exception("Failed to process update %s", update.get("update_id"))
+
+
+async def _run_update(update):
+    global _in_flight
+    key = pipeline.update_user_key(update)
+    entry = _user_locks.get(key)
+    if entry is None:
+        entry = _user_locks[key] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            await _loop.run_in_executor(_executor, _process, update)
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _user_locks[key]
+        _in_flight -= 1
+
+
+def in_flight():
+    return _in_flight
+
+
+def _start():
+    """Set up the pool and the sender on the running loop (once)."""
+    global _executor, _loop, _wake
+    if _loop is not None:
+        return
+    _loop = asyncio.get_running_loop()
+    _executor = ThreadPoolExecutor(EXECUTOR_THREADS, thread_name_prefix="asgi-worker")
+    _wake = asyncio.Event()
+    telegram_client.set_async_sender(lambda: _loop.call_soon_threadsafe(_wake.set))
+    _spawn(_send_loop())
+
+
+async def drain(timeout=30.0):
+    """Wait for accepted updates and queued messages to finish. True if they did."""
+    deadline = _loop.time() + timeout
+    while _in_flight or telegram_client.queue_depth():
+        if _loop.time() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+
+# --------------------
+# Routes
+# --------------------
+
+def _json(status, body, headers=()):
+    return status, json.dumps(body).encode(), [(b"content-type", b"application/json"), *headers]
+
+
+async def _index(request):
+    return 200, b"Daily Riddle Wars Bot is running!", [(b"content-type", b"text/plain; charset=utf-8")]
+
+
+async def _webhook(request):
+    global _in_flight
+    try:
+        data = json.loads(request["body"])
+    except ValueError:
+        data = None
+    if not pipeline.is_valid_update(data):
+        return _json(200, {"status": "ignored"})
+    if not pipeline.claim(data):
+        return _json(200, {"status": "ok"})
+    verdict, chat_id, retry_after = throttle.check(data)
+    if verdict == "busy":
+        pipeline.forget(data["update_id"])
+        return _json(503, {"status": "busy"}, [(b"retry-after", str(max(1, round(retry_after))).encode())])
+    if verdict != "ok":
+        if verdict == "cooldown" and chat_id is not None:
+            bot.send_message(chat_id, throttle.cooldown_text(retry_after))
+        return _json(200, {"status": "throttled"})
+    if _in_flight >= MAX_IN_FLIGHT:
+        pipeline.forget(data["update_id"])  # Telegram will redeliver it
+        return _json(503, {"status": "busy"})
+    _in_flight += 1
+    _spawn(_run_update(data))
+    return _json(200, {"status": "ok"})
+
+
+def _ingest_payment(event):
+    webhook._requeue_once()
+    return payments.ingest(event)
+
+
+async def _paystack_webhook(request):
+    payload = request["body"]
+    if not payments.verify_signature(payload, request["headers"].get("x-paystack-signature")):
+        return _json(403, {"error": "Invalid signature"})
+    try:
+        event = json.loads(payload.decode("utf-8"))
+    except ValueError:
+        return _json(400, {"error": "Invalid payload"})
+    result = await _loop.run_in_executor(_executor, _ingest_payment, event)
+    return _json(200, {"status": "success", "result": result})
+
+
+async def _metrics(request):
+    return 200, metrics.render().encode(), [(b"content-type", b"text/plain; version=0.0.4; charset=utf-8")]
+
+
+ROUTES = {
+    ("GET", "/"): _index,
+    ("POST", "/webhook"): _webhook,
+    ("POST", "/paystack-webhook"): _paystack_webhook,
+    ("GET", "/metrics"): _metrics,
+}
+
+
+async def _read_body(receive):
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return b""  # nobody is waiting for the answer
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            _start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _loop is not None and not await drain():
+                logger.warning("Shutting down with %d updates still in flight", _in_flight)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    _start()
+    route = ROUTES.get((scope["method"], scope["path"]))
+    body = await _read_body(receive)
+    if body is None:
+        status, payload, headers = _json(413, {"error": "Payload too large"})
+    elif route is None:
+        status, payload, headers = _json(404, {"error": "Not found"})
+    else:
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        status, payload, headers = await route({"body": body, "headers": headers})
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [*headers, (b"content-length", str(len(payload)).encode())],
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+
+metrics.gauge("asgi_updates_in_flight", in_flight, "updates accepted by the ASGI app and not yet finished")
+
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        print("Serving asgi:app needs an ASGI server, e.g. `pip install uvicorn` then `uvicorn asgi:app`")
+        sys.exit(1)
+    uvicorn.run("asgi:app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")))
@@ -0,0 +1,87 @@
+# benchmarks/bench_answers.py
+#
+# Runs answers.matches over the whole riddle catalogue with synthetic noisy
+# replies and reports per-check latency and accuracy.
+#
+#   python benchmarks/bench_answers.py [VARIANTS_PER_RIDDLE]
+#
+# Positives are the real answer with the kind of noise players add (case,
+# punctuation, "an"/"the", plurals, one typo). Negatives are other riddles'
+# answers, which must not match.
+
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import answers  # noqa: E402
+import riddles  # noqa: E402
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def typo(rng, text):
+    if len(text) < 4:
+        return text
+    i = rng.randrange(1, len(text) - 1)
+    kind = rng.choice(("sub", "ins", "del", "swap"))
+    if kind == "sub":
+        return text[:i] + rng.choice(LETTERS) + text[i + 1:]
+    if kind == "ins":
+        return text[:i] + rng.choice(LETTERS) + text[i:]
+    if kind == "del":
+        return text[:i] + text[i + 1:]
+    return text[:i - 1] + text[i] + text[i - 1] + text[i + 1:]
+
+
+def noisy(rng, answer):
+    text = answer
+    if rng.random() < 0.5 and len(answer) >= 4 and not answer.endswith("s"):
+        text += "s"
+    if rng.random() < 0.5:
+        text = typo(rng, text)
+    text = rng.choice(("{}", "An {}", "the {}", "{}!", "{}.", "It's {}", "  {}  ")).format(text)
+    return rng.choice((str.upper, str.lower, str.title, lambda s: s))(text)
+
+
+def main():
+    variants = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rng = random.Random(42)
+    catalogue = riddles.get_catalogue()
+    all_riddles = list(catalogue["by_id"].values())
+    answers_pool = sorted({r["normalised_answer"] for r in all_riddles})
+
+    cases = []
+    for riddle in all_riddles:
+        for _ in range(variants):
+            cases.append((riddle["matcher"], noisy(rng, riddle["answer"]), True))
+        for _ in range(variants):
+            other = rng.choice(answers_pool)
+            if other != riddle["normalised_answer"]:
+                cases.append((riddle["matcher"], other, False))
+
+    timings = []
+    tp = fn = fp = tn = 0
+    for matcher, reply, expected in cases:
+        start = time.perf_counter_ns()
+        got = answers.matches(matcher, reply)
+        timings.append(time.perf_counter_ns() - start)
+        if expected:
+            tp, fn = tp + got, fn + (not got)
+        else:
+            fp, tn = fp + got, tn + (not got)
+
+    timings.sort()
+    print(f"{len(cases)} checks over {len(all_riddles)} riddles")
+    print(f"latency: mean {statistics.mean(timings) / 1000:.2f} us, "
+          f"p50 {timings[len(timings) // 2] / 1000:.2f} us, "
+          f"p99 {timings[int(len(timings) * 0.99)] / 1000:.2f} us")
+    print(f"accepted noisy correct answers: {tp / (tp + fn):.1%} ({fn} rejected)")
+    print(f"accepted wrong answers:         {fp / (fp + tn):.2%} ({fp} accepted)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# benchmarks/bench_asgi.py
+#
+# The same synthetic load as loadtest.py (each user's session of updates
+# plus a signed coin purchase) through the Flask app and through the asyncio
+# entry point (asgi.py), against a fake Telegram with a real round-trip
+# latency. Reports webhook ack latency, how long until every update was
+# handled and every reply delivered, and the peak number of app threads.
+#
+# Both apps are driven in-process, without a server: Flask through its test
+# client from C client threads, the ASGI app by calling it directly from C
+# client tasks on one event loop. Each mode runs in a fresh interpreter.
+#
+#   python benchmarks/bench_asgi.py [--users N] [--clients C] [--latency SECONDS]
+#                                   [--senders S] [MODE ...]
+#
+# Modes: flask, asgi. Telegram's 30 messages/second bot limit is lifted so
+# the delivery side of each path shows. Both paths get the same number of
+# Telegram requests in flight (--senders: sender threads for Flask,
+# ASGI_SEND_CONCURRENCY for asgi), so the difference measured is threads
+# versus coroutines, not 4 senders versus 200; raise it to see what each
+# path costs at high concurrency.
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from loadtest import PAYSTACK_SECRET, UpdateFactory, coin_purchase, percentile, user_session  # noqa: E402
+
+MODES = ("flask", "asgi")
+
+
+def requests_for(users):
+    """[(path, body bytes, headers)] per user, in the order loadtest.py sends them."""
+    factory = UpdateFactory()
+    plans = []
+    for i in range(users):
+        user_id = 1000 + i
+        plan = [("/webhook", json.dumps(u).encode(), {"Content-Type": "application/json"})
+                for u in user_session(factory, user_id)]
+        body, signature = coin_purchase(user_id)
+        plan.insert(2, ("/paystack-webhook", body,
+                        {"Content-Type": "application/json", "x-paystack-signature": signature}))
+        plans.append(plan)
+    return plans
+
+
+def setup(latency, senders):
+    from fake_servers import FakePaystack, FakeTelegram
+
+    telegram = FakeTelegram(latency=latency).start()
+    paystack_fake = FakePaystack().start()
+    data_dir = tempfile.mkdtemp(prefix="bench-asgi-")
+    os.environ.update({
+        "DATA_DIR": data_dir,
+        "DB_PATH": os.path.join(data_dir, "app_data.db"),
+        "RIDDLES_FILE": os.path.join(ROOT, "riddles.json"),
+        "TELEGRAM_API_URL": telegram.url,
+        "PAYSTACK_BASE_URL": paystack_fake.url,
+        "PAYSTACK_SECRET_KEY": PAYSTACK_SECRET,
+        "TELEGRAM_GLOBAL_RATE": "100000",
+        "TELEGRAM_PER_CHAT_RATE": "1000",
+        "TELEGRAM_SENDER_THREADS": str(senders),
+        "ASGI_SEND_CONCURRENCY": str(senders),
+        "THROTTLE_GLOBAL_RATE": "100000",
+        "THROTTLE_GLOBAL_BURST": "100000",
+    })
+    os.chdir(data_dir)
+    import logging
+    logging.disable(logging.CRITICAL)
+    return telegram
+
+
+class PeakThreads:
+    """Peak number of the app's own threads (not the fake servers' or the
+    benchmark's client threads)."""
+
+    def __init__(self):
+        self.peak = self._count()
+        self.running = True
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def _watch(self):
+        while self.running:
+            self.peak = max(self.peak, self._count())
+            time.sleep(0.005)
+
+    @staticmethod
+    def _count():
+        return sum(1 for t in threading.enumerate()
+                   if "process_request" not in t.name and not t.name.startswith("bench-"))
+
+
+def run_flask(plans, clients, telegram):
+    import app
+    import payments
+    import pipeline
+    import telegram_client
+
+    pipeline.start(app.process_update)
+    app.user_store.count_users()
+    ack_ms = []
+    lock = threading.Lock()
+
+    def client(index):
+        test_client = app.app.test_client()
+        local = []
+        for plan in plans[index::clients]:
+            for path, body, headers in plan:
+                started = time.perf_counter()
+                test_client.post(path, data=body, headers=headers)
+                local.append((time.perf_counter() - started) * 1000)
+        with lock:
+            ack_ms.extend(local)
+
+    threads_seen = PeakThreads()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(c,), name=f"bench-client-{c}") for c in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    acked = time.perf_counter() - started
+    pipeline.drain(timeout=300)
+    payments.drain()
+    telegram_client.drain(timeout=300)
+    done = time.perf_counter() - started
+    threads_seen.running = False
+    return ack_ms, acked, done, threads_seen.peak
+
+
+def run_asgi(plans, clients, telegram):
+    import asgi
+    import payments
+
+    asgi.bot.user_store.count_users()
+
+    async def call(path, body, headers):
+        scope = {
+            "type": "http", "method": "POST", "path": path,
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        }
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+        async def receive():
+            return messages.pop() if messages else {"type": "http.disconnect"}
+
+        async def send(message):
+            pass
+
+        await asgi.app(scope, receive, send)
+
+    async def main():
+        ack_ms = []
+
+        async def client(index):
+            for plan in plans[index::clients]:
+                for path, body, headers in plan:
+                    started = time.perf_counter()
+                    await call(path, body, headers)
+                    ack_ms.append((time.perf_counter() - started) * 1000)
+
+        threads_seen = PeakThreads()
+        started = time.perf_counter()
+        await asyncio.gather(*(client(c) for c in range(clients)))
+        acked = time.perf_counter() - started
+        await asgi.drain(timeout=300)
+        await asyncio.get_running_loop().run_in_executor(None, payments.drain)
+        await asgi.drain(timeout=300)  # fulfilment may have queued messages
+        done = time.perf_counter() - started
+        threads_seen.running = False
+        return ack_ms, acked, done, threads_seen.peak
+
+    return asyncio.run(main())
+
+
+def run_mode(mode, users, clients, latency, senders):
+    telegram = setup(latency, senders)
+    plans = requests_for(users)
+    runner = run_flask if mode == "flask" else run_asgi
+    ack_ms, acked, done, peak_threads = runner(plans, clients, telegram)
+    return {
+        "mode": mode,
+        "users": users,
+        "clients": clients,
+        "latency_ms": latency * 1000,
+        "senders": senders,
+        "requests": len(ack_ms),
+        "ack_p50_ms": percentile(ack_ms, 0.5),
+        "ack_p99_ms": percentile(ack_ms, 0.99),
+        "ack_rps": len(ack_ms) / acked,
+        "end_to_end_s": done,
+        "telegram_calls": len(telegram.delivered()),
+        "peak_app_threads": peak_threads,
+    }
+
+
+COLUMNS = (
+    ("requests", "{}"), ("ack_p50_ms", "{:.2f}"), ("ack_p99_ms", "{:.2f}"), ("ack_rps", "{:.0f}"),
+    ("end_to_end_s", "{:.2f}"), ("telegram_calls", "{}"), ("peak_app_threads", "{}"),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the Flask and asyncio entry points under the same load.")
+    parser.add_argument("modes", nargs="*", default=list(MODES), help=", ".join(MODES))
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake Telegram round-trip, seconds")
+    parser.add_argument("--senders", type=int, default=16, help="Telegram requests in flight, both modes")
+    parser.add_argument("--json", action="store_true", help="print raw results as JSON")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_mode(args.child, args.users, args.clients, args.latency, args.senders)))
+        return
+
+    unknown = [mode for mode in args.modes if mode not in MODES]
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(unknown)}")
+
+    results = []
+    for mode in args.modes:
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", mode, "--users", str(args.users),
+               "--clients", str(args.clients), "--latency", str(args.latency), "--senders", str(args.senders)]
+        out = subprocess.run(cmd, capture_output=True, text=True)
+        if out.returncode != 0:
+            print(f"{mode}: failed\n{out.stderr}", file=sys.stderr)
+            continue
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print(f"{result['mode']} ({result['users']} users, {result['clients']} clients, "
+              f"{result['senders']} senders, Telegram latency {result['latency_ms']:.0f} ms)")
+        for key, fmt in COLUMNS:
+            print(f"  {key:16} {fmt.format(result[key])}")
+
+
+if __name__ == "__main__":
+    main()
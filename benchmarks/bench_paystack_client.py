@@ -0,0 +1,70 @@
+# benchmarks/bench_paystack_client.py
+#
+# Exercises paystack.py against a local fake Paystack: connection reuse,
+# retries through transient 500s (verify only; initialize is not retried),
+# the circuit breaker, and the verification cache under /checkpayment-style
+# polling.
+#
+#   python benchmarks/bench_paystack_client.py
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_servers import FakePaystack  # noqa: E402
+
+
+def main():
+    fake = FakePaystack(latency=0.005).start()
+    os.environ["PAYSTACK_BASE_URL"] = fake.url
+    os.environ.setdefault("PAYSTACK_SECRET_KEY", "sk_test_bench")
+    import paystack
+
+    paystack.BACKOFF_BASE = 0.01
+
+    start = time.perf_counter()
+    for i in range(100):
+        assert paystack.initialize_payment("a@b.c", 20000, {"user_id": i}, reference=f"init{i}")
+    elapsed = time.perf_counter() - start
+    print(f"initialize: 100 calls in {elapsed * 1e3:.0f} ms ({elapsed * 10:.1f} ms/call, pooled session)")
+
+    fake.fail_next = 2
+    fake.statuses["flaky"] = "success"
+    assert paystack.verify_payment("flaky"), "retry should succeed"
+    print("transient 500s on verify: retried and succeeded")
+
+    fake.fail_next = 1
+    before = len(fake.calls)
+    assert not paystack.initialize_payment("a@b.c", 20000, {}, reference="once"), "POST must not be retried"
+    print(f"500 on initialize: {len(fake.calls) - before} call, not retried (it may have gone through)")
+
+    # Polling the same pending reference hits Paystack at most once per PENDING_TTL.
+    fake.statuses["poll"] = "ongoing"
+    before = len(fake.calls)
+    for _ in range(50):
+        assert paystack.verify_payment("poll") is None
+    print(f"50 polls of a pending payment -> {len(fake.calls) - before} Paystack call(s)")
+
+    fake.statuses["paid"] = "success"
+    before = len(fake.calls)
+    start = time.perf_counter()
+    for _ in range(1000):
+        assert paystack.verify_payment("paid")
+    elapsed = time.perf_counter() - start
+    print(f"1000 verifies of a successful payment -> {len(fake.calls) - before} call(s), "
+          f"{elapsed / 1000 * 1e6:.1f} us/verify")
+
+    fake.fail_next = 10 ** 6
+    start = time.perf_counter()
+    for i in range(paystack.BREAKER_THRESHOLD + 20):
+        paystack.verify_payment(f"down{i}")
+    elapsed = time.perf_counter() - start
+    print(f"Paystack down: {paystack.BREAKER_THRESHOLD + 20} verifies in {elapsed:.2f} s, "
+          f"circuit open={paystack._consecutive_failures >= paystack.BREAKER_THRESHOLD}")
+    fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# benchmarks/bench_startup.py
+#
+# Cold start of a worker: wall time of `import app` in a fresh interpreter
+# (what each new gunicorn worker pays), the slowest imports by cumulative
+# time from `python -X importtime`, and whether the lazily loaded modules
+# stayed unloaded.
+#
+#   python benchmarks/bench_startup.py [RUNS]     (default 10)
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAZY_MODULES = ("requests", "paystack")
+
+PROBE = (
+    "import time, sys; t = time.perf_counter(); import app; "
+    "print(time.perf_counter() - t); "
+    f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+)
+
+
+def run(args, data_dir):
+    env = dict(os.environ, PYTHONPATH=ROOT, DATA_DIR=data_dir,
+               DB_PATH=os.path.join(data_dir, "bench.db"),
+               RIDDLES_FILE=os.path.join(ROOT, "riddles.json"))
+    env.setdefault("TELEGRAM_BOT_TOKEN", "bench")
+    return subprocess.run([sys.executable] + args, cwd=data_dir, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    with tempfile.TemporaryDirectory() as data_dir:
+        times = []
+        loaded = ""
+        for _ in range(runs):
+            lines = run(["-c", PROBE], data_dir).stdout.split("\n")
+            times.append(float(lines[0]) * 1000)
+            loaded = lines[1]
+        print(f"import app: median {statistics.median(times):.1f} ms, "
+              f"min {min(times):.1f} ms over {runs} runs")
+        print(f"lazy modules loaded at import: {loaded or 'none'}")
+
+        trace = run(["-X", "importtime", "-c", "import app"], data_dir).stderr
+        rows = []
+        for line in trace.splitlines():
+            parts = line.split("|")
+            if len(parts) == 3 and parts[1].strip().isdigit():
+                rows.append((int(parts[1]), parts[2].strip()))
+        print("slowest imports (cumulative):")
+        for cumulative, name in sorted(rows, reverse=True)[:10]:
+            print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
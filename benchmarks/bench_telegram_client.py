@@ -0,0 +1,52 @@
+# benchmarks/bench_telegram_client.py
+#
+# Drives telegram_client against a local fake Bot API and reports how fast
+# the webhook side can hand off messages, how fast they are delivered, and
+# whether per-chat ordering, coalescing and 429 handling behave.
+#
+#   python benchmarks/bench_telegram_client.py [CHATS] [MESSAGES_PER_CHAT]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_servers import FakeTelegram  # noqa: E402
+
+
+def main():
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    per_chat = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    fake = FakeTelegram(latency=0.02, rate_limit_every=25, retry_after=1).start()
+    os.environ["TELEGRAM_API_URL"] = fake.url
+    import telegram_client
+
+    start = time.perf_counter()
+    for chat_id in range(chats):
+        for i in range(per_chat):
+            # Some messages carry a keyboard and cannot be merged; runs of
+            # plain ones (like a reply followed by the ad) can.
+            markup = {"inline_keyboard": [[{"text": "ok", "callback_data": "x"}]]} if i % 3 == 1 else None
+            telegram_client.send_message(chat_id, f"msg {i}", reply_markup=markup)
+    enqueue_time = time.perf_counter() - start
+    drained = telegram_client.drain(timeout=120)
+    total_time = time.perf_counter() - start
+    fake.stop()
+
+    by_chat = {}
+    for _, method, data in fake.delivered():
+        by_chat.setdefault(data["chat_id"], []).append(data["text"])
+    sequences = [[int(part.split()[-1]) for t in texts for part in t.split("\n\n")] for texts in by_chat.values()]
+    in_order = all(seq == list(range(per_chat)) for seq in sequences)
+    queued = chats * per_chat
+    print(f"queued {queued} messages to {chats} chats in {enqueue_time * 1e3:.1f} ms "
+          f"({enqueue_time / queued * 1e6:.1f} us/message on the webhook side)")
+    print(f"delivered in {total_time:.2f} s, drained={drained}, "
+          f"HTTP requests={len(fake.requests)}, stats={telegram_client.stats}")
+    print(f"per-chat order preserved: {in_order}")
+
+
+if __name__ == "__main__":
+    main()
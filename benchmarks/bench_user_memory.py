@@ -0,0 +1,82 @@
+# benchmarks/bench_user_memory.py
+#
+# Memory of N resident users as handle_start-style dicts versus
+# models.UserRecord, plus the cost of the dict codec.
+#
+#   python benchmarks/bench_user_memory.py [N]     (default 100000)
+
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import UserRecord  # noqa: E402
+
+
+def make_user(i):
+    # Same shape as app.handle_start builds, plus the keys leaderboard.py reads.
+    return {
+        "id": i,
+        "username": f"player{i}",
+        "coins": i % 300,
+        "hints": 0,
+        "section": ("free", "vip", "premium")[i % 3],
+        "daily_riddles_done": i % 7,
+        "last_active_day": "2026-10-18",
+        "daily_scores": {"free": 0, "vip": (i % 7) * 10, "premium": 0, "saturday": 0},
+        "streak": i % 9,
+        "referrals": [],
+        "referred_by": None,
+        "has_paid_entry": i % 3 != 0,
+        "payment_reference": None,
+        "waiting_for_answer": False,
+        "current_riddle_index": i % 7,
+        "using_hint_for_current": False,
+        "coins_spent_today": 0,
+        "hints_used_today": 0,
+        "unlocked_all": False,
+        "answered_riddles_count": i % 50,
+        "is_vip": i % 3 == 1,
+        "is_premium": i % 3 == 2,
+    }
+
+
+def measure(build, n):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    users = build(n)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return users, current, time.perf_counter() - start
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    # json.loads would intern nothing either, so build fresh objects each time.
+    dicts, dict_bytes, _ = measure(lambda n: {str(i): make_user(i) for i in range(n)}, n)
+    records, rec_bytes, _ = measure(
+        lambda n: {uid: UserRecord.from_dict(d, uid) for uid, d in dicts.items()}, n
+    )
+    # Codec timings without tracemalloc, which slows allocation down a lot.
+    start = time.perf_counter()
+    for uid, d in dicts.items():
+        UserRecord.from_dict(d, uid)
+    decode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for rec in records.values():
+        rec.to_dict()
+    encode_time = time.perf_counter() - start
+
+    print(f"{n} users")
+    print(f"dicts:       {dict_bytes / 2**20:8.1f} MiB  ({dict_bytes / n:6.0f} B/user)")
+    print(f"UserRecord:  {rec_bytes / 2**20:8.1f} MiB  ({rec_bytes / n:6.0f} B/user)  "
+          f"-> {dict_bytes / rec_bytes:.1f}x smaller")
+    print(f"from_dict: {decode_time / n * 1e6:.2f} us/user, to_dict: {encode_time / n * 1e6:.2f} us/user")
+
+
+if __name__ == "__main__":
+    main()
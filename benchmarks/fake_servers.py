@@ -0,0 +1,168 @@
+# benchmarks/fake_servers.py
+#
+# Local stand-ins for the Telegram Bot API so benchmarks can run without
+# network access. Point the bot at one with TELEGRAM_API_URL.
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class FakeTelegram:
+    """Accepts any Bot API call and records it.
+
+    rate_limit_every: answer every Nth request with 429 and retry_after.
+    latency: seconds to sleep before answering, to mimic a real round-trip.
+    """
+
+    def __init__(self, latency=0.0, rate_limit_every=0, retry_after=1):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.requests = []  # (time, method, data, status)
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/botTEST"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Buffer each response and send it in one write; unbuffered
+            # header/body writes hit the 40 ms delayed-ACK stall on keep-alive.
+            wbufsize = 1 << 16
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(length).decode()
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    data = json.loads(raw or "{}")
+                else:
+                    data = {k: v[0] for k, v in parse_qs(raw).items()}
+                method = self.path.rsplit("/", 1)[-1]
+                if fake.latency:
+                    time.sleep(fake.latency)
+                with fake.lock:
+                    n = len(fake.requests) + 1
+                    if fake.rate_limit_every and n % fake.rate_limit_every == 0:
+                        status, body = 429, {"ok": False, "error_code": 429,
+                                             "parameters": {"retry_after": fake.retry_after}}
+                    else:
+                        status, body = 200, {"ok": True, "result": {"message_id": n}}
+                    fake.requests.append((time.monotonic(), method, data, status))
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def delivered(self):
+        return [(t, method, data) for t, method, data, status in self.requests if status == 200]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakePaystack:
+    """Minimal Paystack API: /transaction/initialize and /transaction/verify/<ref>.
+
+    statuses: reference -> transaction status returned by verify ("success" by default).
+    fail_next: number of upcoming requests to answer with 500.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.statuses = {}
+        self.fail_next = 0
+        self.calls = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Buffer each response and send it in one write; unbuffered
+            # header/body writes hit the 40 ms delayed-ACK stall on keep-alive.
+            wbufsize = 1 << 16
+            disable_nagle_algorithm = True
+
+            def _reply(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _fail(self):
+                with fake.lock:
+                    fake.calls.append(self.path)
+                    if fake.fail_next > 0:
+                        fake.fail_next -= 1
+                        return True
+                return False
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if self._fail():
+                    return self._reply(500, {"status": False})
+                reference = body.get("reference") or f"ref{len(fake.calls)}"
+                self._reply(200, {"status": True, "data": {
+                    "authorization_url": f"https://checkout.paystack.com/{reference}",
+                    "reference": reference,
+                }})
+
+            def do_GET(self):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if self._fail():
+                    return self._reply(500, {"status": False})
+                reference = self.path.rsplit("/", 1)[-1]
+                status = fake.statuses.get(reference, "success")
+                self._reply(200, {"status": True, "data": {"reference": reference, "status": status}})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,356 @@
+# benchmarks/loadtest.py
+#
+# Replays synthetic traffic from N users through the real webhook routes and
+# reports, per storage scenario, webhook ack latency (p50/p99), end-to-end
+# throughput (until the update pipeline has drained), handler latency, and
+# how much file and SQLite I/O the run caused.
+#
+# Each user sends /start, picks a section (choose_* callback), /play, an
+# answer, a use_hint callback and /leaderboard, and buys a coin pack through
+# a signed Paystack webhook. Telegram and Paystack are the local fakes from
+# fake_servers.py. Handlers that do not exist in app.py yet (handle_play,
+# handle_section_choice, handle_answer) show up as handler errors; their
+# storage reads before the failure still count.
+#
+# Every scenario runs in a fresh interpreter because config is read at
+# import time.
+#
+#   python benchmarks/loadtest.py [--users N] [--clients C] [--http] [SCENARIO ...]
+#
+# Scenarios: json (data/*.json files) and sqlite (the default backend).
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+SCENARIOS = {
+    "json": {"STORAGE_BACKEND": "json"},
+    "sqlite": {"STORAGE_BACKEND": "sqlite"},
+}
+
+PAYSTACK_SECRET = "sk_test_loadtest"
+SECTIONS = ("free", "vip", "premium")
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+# --------------------
+# Synthetic traffic
+# --------------------
+
+class UpdateFactory:
+    def __init__(self):
+        self.next_update_id = 1
+
+    def _id(self):
+        update_id = self.next_update_id
+        self.next_update_id += 1
+        return update_id
+
+    def message(self, user_id, text):
+        return {
+            "update_id": self._id(),
+            "message": {
+                "message_id": self.next_update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "username": f"player{user_id}"},
+                "text": text,
+            },
+        }
+
+    def callback(self, user_id, data):
+        return {
+            "update_id": self._id(),
+            "callback_query": {
+                "id": str(self.next_update_id),
+                "from": {"id": user_id, "is_bot": False, "username": f"player{user_id}"},
+                "message": {"message_id": 1, "chat": {"id": user_id, "type": "private"}},
+                "data": data,
+            },
+        }
+
+
+def user_session(factory, user_id):
+    """The Telegram updates one player sends, in order."""
+    section = SECTIONS[user_id % len(SECTIONS)]
+    return [
+        factory.message(user_id, "/start"),
+        factory.callback(user_id, f"choose_{section}"),
+        factory.message(user_id, "/play"),
+        factory.message(user_id, "an echo"),
+        factory.callback(user_id, "use_hint"),
+        factory.message(user_id, "/leaderboard"),
+    ]
+
+
+def coin_purchase(user_id):
+    """A signed charge.success webhook body for a 50-coin pack."""
+    event = {
+        "event": "charge.success",
+        "data": {
+            "reference": f"load-{user_id}",
+            "amount": 200 * 100,
+            "metadata": {"user_id": user_id, "purpose": "coins", "coins": 50},
+        },
+    }
+    body = json.dumps(event).encode()
+    signature = hmac.new(PAYSTACK_SECRET.encode(), body, hashlib.sha512).hexdigest()
+    return body, signature
+
+
+# --------------------
+# I/O accounting
+# --------------------
+
+class IOCounter:
+    """Counts file opens/renames under the data dir (audit hooks) and SQL
+    statements (sqlite3 trace callbacks on each connection database.py opens)."""
+
+    def __init__(self, data_dir):
+        self.data_dir = os.path.realpath(data_dir)
+        self.counts = {"file_reads": 0, "file_writes": 0, "renames": 0, "sql_statements": 0}
+        self.lock = threading.Lock()
+        self.enabled = False
+        self._traced = set()
+
+    def _bump(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def audit(self, event, args):
+        if not self.enabled:
+            return
+        if event == "open":
+            path, mode, flags = args
+            if isinstance(path, str) and os.path.realpath(path).startswith(self.data_dir):
+                if path.endswith((".db", "-wal", "-shm", "-journal")):
+                    return
+                if mode is None:  # os.open(): look at the flags instead
+                    writing = bool(flags & (os.O_WRONLY | os.O_RDWR))
+                else:
+                    writing = any(c in mode for c in "wax+")
+                self._bump("file_writes" if writing else "file_reads")
+        elif event == "os.rename":
+            self._bump("renames")
+
+    def install(self, database):
+        sys.addaudithook(self.audit)
+        get_connection = database.get_connection
+
+        def traced_connection():
+            conn = get_connection()
+            if id(conn) not in self._traced:
+                self._traced.add(id(conn))
+                conn.set_trace_callback(lambda sql: self.enabled and self._bump("sql_statements"))
+            return conn
+
+        database.get_connection = traced_connection
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+# --------------------
+# One scenario (runs in its own interpreter)
+# --------------------
+
+def run_scenario(name, users, clients, use_http):
+    from fake_servers import FakePaystack, FakeTelegram
+
+    telegram = FakeTelegram().start()
+    paystack_fake = FakePaystack().start()
+    data_dir = tempfile.mkdtemp(prefix=f"loadtest-{name}-")
+    os.environ.update(SCENARIOS[name])
+    os.environ.update({
+        "DATA_DIR": data_dir,
+        "DB_PATH": os.path.join(data_dir, "app_data.db"),
+        "RIDDLES_FILE": os.path.join(ROOT, "riddles.json"),
+        "TELEGRAM_API_URL": telegram.url,
+        "PAYSTACK_BASE_URL": paystack_fake.url,
+        "PAYSTACK_SECRET_KEY": PAYSTACK_SECRET,
+        "TELEGRAM_GLOBAL_RATE": "10000",
+        "TELEGRAM_PER_CHAT_RATE": "1000",
+        "THROTTLE_GLOBAL_RATE": "100000",  # measure the app, not the spam limiter
+        "THROTTLE_GLOBAL_BURST": "100000",
+    })
+    os.chdir(data_dir)
+
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    import database
+    io = IOCounter(data_dir)
+    io.install(database)
+
+    import app
+    import metrics
+    import payments
+    import pipeline
+    import telegram_client
+    import user_store
+
+    factory = UpdateFactory()
+    sessions = [user_session(factory, 1000 + i) for i in range(users)]
+    purchases = [coin_purchase(1000 + i) for i in range(users)]
+
+    if use_http:
+        import requests
+        from werkzeug.serving import make_server
+
+        server = make_server("127.0.0.1", 0, app.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+        local = threading.local()
+
+        def post(path, **kwargs):
+            session = getattr(local, "session", None)
+            if session is None:
+                session = local.session = requests.Session()
+            return session.post(base + path, **kwargs).status_code
+    else:
+        local = threading.local()
+
+        def post(path, **kwargs):
+            test_client = getattr(local, "client", None)
+            if test_client is None:
+                test_client = local.client = app.app.test_client()
+            return test_client.post(path, **kwargs).status_code
+
+    ack_ms = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def client(index):
+        local_ms = []
+        local_status = {}
+        for i in range(index, users, clients):
+            requests_for_user = [("/webhook", {"json": u}) for u in sessions[i]]
+            body, signature = purchases[i]
+            requests_for_user.insert(2, ("/paystack-webhook", {
+                "data": body,
+                "headers": {"x-paystack-signature": signature, "Content-Type": "application/json"},
+            }))
+            for path, kwargs in requests_for_user:
+                started = time.perf_counter()
+                status = post(path, **kwargs)
+                local_ms.append((time.perf_counter() - started) * 1000)
+                local_status[status] = local_status.get(status, 0) + 1
+        with lock:
+            ack_ms.extend(local_ms)
+            for status, count in local_status.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    # Warm up the pipeline threads and the SQLite schema outside the timing.
+    pipeline.start(app.process_update)
+    user_store.count_users()
+    metrics.reset()
+
+    io.enabled = True
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    acked = time.perf_counter() - started
+    pipeline.drain(timeout=120)
+    payments.drain()
+    user_store.flush()
+    processed = time.perf_counter() - started
+    io.enabled = False
+    telegram_client.drain(timeout=30)
+
+    requests_sent = len(ack_ms)
+    pipe = pipeline.metrics()
+    return {
+        "scenario": name,
+        "transport": "http" if use_http else "test_client",
+        "users": users,
+        "clients": clients,
+        "requests": requests_sent,
+        "statuses": statuses,
+        "ack_p50_ms": percentile(ack_ms, 0.5),
+        "ack_p99_ms": percentile(ack_ms, 0.99),
+        "ack_rps": requests_sent / acked,
+        "processed_rps": requests_sent / processed,
+        "handler_p50_ms": pipe["processing_ms"]["p50"],
+        "handler_p99_ms": pipe["processing_ms"]["p99"],
+        "handler_errors": pipe["errors"],
+        "telegram_calls": len(telegram.delivered()),
+        **io.snapshot(),
+    }
+
+
+# --------------------
+# Driver
+# --------------------
+
+COLUMNS = (
+    ("requests", "{}"), ("ack_p50_ms", "{:.2f}"), ("ack_p99_ms", "{:.2f}"),
+    ("ack_rps", "{:.0f}"), ("processed_rps", "{:.0f}"), ("handler_p50_ms", "{:.2f}"),
+    ("handler_p99_ms", "{:.2f}"), ("handler_errors", "{}"), ("file_reads", "{}"),
+    ("file_writes", "{}"), ("renames", "{}"), ("sql_statements", "{}"), ("telegram_calls", "{}"),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay synthetic Telegram traffic against the bot.")
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS), help=", ".join(SCENARIOS))
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--http", action="store_true", help="serve the app on a local port instead of the test client")
+    parser.add_argument("--json", action="store_true", help="print raw results as JSON")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_scenario(args.child, args.users, args.clients, args.http)))
+        return
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    results = []
+    for name in args.scenarios:
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", name,
+               "--users", str(args.users), "--clients", str(args.clients)]
+        if args.http:
+            cmd.append("--http")
+        out = subprocess.run(cmd, capture_output=True, text=True)
+        if out.returncode != 0:
+            print(f"{name}: failed\n{out.stderr}", file=sys.stderr)
+            continue
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print(f"{result['scenario']} ({result['transport']}, {result['users']} users, "
+              f"{result['clients']} clients, statuses {result['statuses']})")
+        for key, fmt in COLUMNS:
+            print(f"  {key:16} {fmt.format(result[key])}")
+
+
+if __name__ == "__main__":
+    main()
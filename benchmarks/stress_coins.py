@@ -0,0 +1,210 @@
+# benchmarks/stress_coins.py
+#
+# Runs N processes (stand-ins for gunicorn workers) against one data dir with
+# the JSON backend and checks that nothing is lost or double-applied:
+#
+#   - every process hammers coins.deduct_coins (and some add_coins) on a
+#     shared set of players, re-sending some idempotency keys as a retry
+#     would;
+#   - every process also registers its own new players through user_store
+#     and writes their scores through app.update_score, so flushes of
+#     users.json and read-modify-writes of scores.json race each other.
+#
+# Invariants checked afterwards:
+#
+#   - no balance is negative, and each balance equals the opening coins plus
+#     the credits minus the debits the processes saw succeed;
+#   - SUM(delta) of each player's ledger rows equals their balance, and each
+#     idempotency key was applied once;
+#   - users.json and scores.json parse and contain every player and score
+#     any process wrote.
+#
+#   python benchmarks/stress_coins.py [--procs N] [--ops N] [--players N] [--no-locks]
+#
+# --no-locks replaces filestore.locked with a no-op to show the lost updates
+# the locks prevent.
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import queue
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+OPENING_COINS = 500
+NEW_PLAYER_BASE = 10_000_000
+SECTIONS = ("free", "vip", "premium")
+
+
+def worker(index, args, start, results):
+    if args.no_locks:
+        import filestore
+
+        @contextlib.contextmanager
+        def unlocked(path, shared=False, blocking=True):
+            yield True
+
+        filestore.locked = unlocked
+
+    import app
+    import coins
+    import user_store
+
+    rng = random.Random(index)
+    debited = {}
+    credited = {}
+    retries = 0
+    created = []
+    start.wait()
+    started = time.perf_counter()
+    for i in range(args.ops):
+        user_id = rng.randrange(args.players) + 1
+        key = f"stress:{index}:{i}"
+        if rng.random() < 0.2:
+            amount = rng.randint(1, 20)
+            if coins.add_coins(user_id, amount, key, "stress"):
+                credited[user_id] = credited.get(user_id, 0) + amount
+        else:
+            amount = rng.randint(1, 30)
+            if coins.deduct_coins(user_id, amount, key, "stress"):
+                debited[user_id] = debited.get(user_id, 0) + amount
+                if rng.random() < 0.1:
+                    coins.deduct_coins(user_id, amount, key, "stress")  # a retried tap: must not charge
+                    retries += 1
+        if i % 10 == 0:
+            new_id = NEW_PLAYER_BASE + index * args.ops + i
+            section = SECTIONS[new_id % len(SECTIONS)]
+            user_store.set_user(new_id, {"username": f"new{new_id}", "section": section, "coins": 0})
+            app.update_score(section, new_id, f"new{new_id}", i)
+            created.append(new_id)
+    user_store.flush()
+    results.put({
+        "debited": debited,
+        "credited": credited,
+        "retries": retries,
+        "created": created,
+        "seconds": time.perf_counter() - started,
+    })
+
+
+def seed(data_dir, players):
+    users = {
+        str(uid): {"username": f"player{uid}", "section": "free", "coins": OPENING_COINS}
+        for uid in range(1, players + 1)
+    }
+    with open(os.path.join(data_dir, "users.json"), "w") as f:
+        json.dump(users, f)
+
+
+def check(data_dir, args, reports):
+    failures = []
+    debited, credited, created = {}, {}, []
+    for report in reports:
+        for uid, amount in report["debited"].items():
+            debited[uid] = debited.get(uid, 0) + amount
+        for uid, amount in report["credited"].items():
+            credited[uid] = credited.get(uid, 0) + amount
+        created.extend(report["created"])
+
+    conn = sqlite3.connect(os.path.join(data_dir, "app_data.db"))
+    balances = dict(conn.execute("SELECT user_id, balance FROM coin_balances"))
+    sums = dict(conn.execute("SELECT user_id, SUM(delta) FROM coin_ledger GROUP BY user_id"))
+    applied_keys = conn.execute("SELECT COUNT(*), COUNT(DISTINCT idem_key) FROM coin_ledger "
+                                "WHERE reason='stress'").fetchone()
+    for uid in range(1, args.players + 1):
+        expected = OPENING_COINS + credited.get(uid, 0) - debited.get(uid, 0)
+        balance = balances.get(uid, OPENING_COINS)
+        if balance < 0:
+            failures.append(f"player {uid}: negative balance {balance}")
+        if balance != expected:
+            failures.append(f"player {uid}: balance {balance}, expected {expected}")
+        if uid in balances and sums.get(uid) != balance:
+            failures.append(f"player {uid}: ledger sums to {sums.get(uid)}, balance {balance}")
+    if applied_keys[0] != applied_keys[1]:
+        failures.append(f"{applied_keys[0] - applied_keys[1]} idempotency keys applied twice")
+
+    with open(os.path.join(data_dir, "users.json")) as f:
+        users = json.load(f)
+    missing_users = [uid for uid in created if str(uid) not in users]
+    if missing_users:
+        failures.append(f"{len(missing_users)} of {len(created)} new players lost from users.json")
+    if any(str(uid) not in users for uid in range(1, args.players + 1)):
+        failures.append("seeded players lost from users.json")
+
+    with open(os.path.join(data_dir, "scores.json")) as f:
+        scores = json.load(f)
+    missing_scores = [
+        uid for uid in created if str(uid) not in scores.get(SECTIONS[uid % len(SECTIONS)], {})
+    ]
+    if missing_scores:
+        failures.append(f"{len(missing_scores)} of {len(created)} scores lost from scores.json")
+    return failures, applied_keys[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hammer coins and the JSON stores from several processes.")
+    parser.add_argument("--procs", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--ops", type=int, default=500, help="coin operations per process")
+    parser.add_argument("--players", type=int, default=20, help="shared players (fewer means more contention)")
+    parser.add_argument("--no-locks", action="store_true", help="disable filestore locking")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="stress-coins-")
+    seed(data_dir, args.players)
+    os.environ.update({
+        "STORAGE_BACKEND": "json",
+        "DATA_DIR": data_dir,
+        "DB_PATH": os.path.join(data_dir, "app_data.db"),
+        "RIDDLES_FILE": os.path.join(ROOT, "riddles.json"),
+        "USER_STORE_FLUSH_THRESHOLD": "5",
+        "TELEGRAM_BOT_TOKEN": "stress",
+    })
+    os.chdir(data_dir)
+
+    ctx = multiprocessing.get_context("spawn")  # fresh config per process, like a worker
+    start = ctx.Event()
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(i, args, start, results)) for i in range(args.procs)]
+    for p in procs:
+        p.start()
+    time.sleep(1.0)  # let every process finish importing before the gun
+    started = time.perf_counter()
+    start.set()
+    reports = []
+    while len(reports) < len(procs):
+        try:
+            reports.append(results.get(timeout=1))
+        except queue.Empty:
+            crashed = [p.pid for p in procs if p.exitcode not in (None, 0)]
+            if crashed:
+                print(f"FAILED: worker processes {crashed} crashed (see their traceback above)")
+                sys.exit(1)
+    elapsed = time.perf_counter() - started
+    for p in procs:
+        p.join()
+
+    failures, applied = check(data_dir, args, reports)
+    ops = args.procs * args.ops
+    print(f"{args.procs} processes x {args.ops} ops on {args.players} players "
+          f"({'no locks' if args.no_locks else 'locked'}): {ops / elapsed:.0f} ops/s, "
+          f"{applied} ledger entries, {sum(r['retries'] for r in reports)} retried keys, "
+          f"{sum(len(r['created']) for r in reports)} new players")
+    print(f"data dir: {data_dir}")
+    if failures:
+        print("FAILED:")
+        for failure in failures[:20]:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("all invariants hold")
+
+
+if __name__ == "__main__":
+    main()
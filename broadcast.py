@@ -0,0 +1,171 @@
+# broadcast.py
+#
+# Bulk sends for the daily riddle drop and the Saturday Challenge. Recipients
+# are streamed from the user store one chunk at a time (filtered by section
+# and has_paid_entry), each chunk is fanned out over a thread pool through
+# telegram_client.call, whose global token bucket keeps us at the highest
+# rate Telegram accepts. After every chunk the last user_id is checkpointed
+# (an fsynced atomic replace, filestore.write_json), so a crashed or killed
+# run resumes where it stopped instead of messaging everyone twice. A run
+# holds the checkpoint's lock throughout, so a second copy started by
+# accident (cron overlap, a manual retry) exits instead of sending again.
+#
+#   python broadcast.py daily [--force-restart]
+#   python broadcast.py saturday [--force-restart]
+
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import daily
+import filestore
+import telegram_client
+import user_store
+from config import DATA_DIR, MAX_DAILY_RIDDLES, SATURDAY_RIDDLES_COUNT
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = os.path.join(DATA_DIR, "broadcasts")
+CHUNK_SIZE = 500
+WORKERS = 16
+MAX_ATTEMPTS = 3
+PAID_SECTIONS = ("vip", "premium")
+
+
+def _checkpoint_path(name):
+    return os.path.join(CHECKPOINT_DIR, f"{name}.json")
+
+
+def load_checkpoint(name):
+    return filestore.read_json(_checkpoint_path(name)) or None
+
+
+def save_checkpoint(name, state):
+    filestore.write_json(_checkpoint_path(name), state)
+
+
+def iter_recipients(sections, paid_only=True, after_id=None):
+    """Yield (user_id, chat_id) in user_id order for users in the given sections."""
+    for section in sections:
+        for user_id, user in user_store.iter_users(section=section, after_id=after_id):
+            if paid_only and not user.get("has_paid_entry"):
+                continue
+            yield int(user_id), user.get("chat_id") or int(user_id)
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _deliver(chat_id, text, reply_markup):
+    data = {"chat_id": chat_id, "text": text, "parse_mode": "Markdown"}
+    if reply_markup:
+        data["reply_markup"] = reply_markup
+    for _ in range(MAX_ATTEMPTS):
+        result = telegram_client.call("sendMessage", data)
+        if result.get("ok"):
+            return "sent"
+        if result.get("error_code") == 403:
+            return "blocked"  # user blocked the bot or deleted their account
+        retry_after = (result.get("parameters") or {}).get("retry_after")
+        if not retry_after:
+            break
+        time.sleep(float(retry_after))
+    return "failed"
+
+
+def run_broadcast(name, text, sections, paid_only=True, reply_markup=None, restart=False):
+    """Send text to every matching user, resuming from the checkpoint called name.
+
+    Returns the final state: sent / blocked / failed counts, elapsed seconds
+    and messages per second, or None if another process is running it.
+    """
+    with filestore.locked(_checkpoint_path(name), blocking=False) as acquired:
+        if not acquired:
+            logger.warning("Broadcast %s is already running in another process", name)
+            return None
+        return _run_locked(name, text, sections, paid_only, reply_markup, restart)
+
+
+def _run_locked(name, text, sections, paid_only, reply_markup, restart):
+    state = None if restart else load_checkpoint(name)
+    if state and state.get("done"):
+        logger.info("Broadcast %s already finished", name)
+        return state
+    if state is None:
+        state = {"name": name, "sections": list(sections), "last_user_id": None,
+                 "sent": 0, "blocked": 0, "failed": 0, "elapsed": 0.0, "done": False}
+    markup = json.dumps(reply_markup) if reply_markup else None
+
+    # Sections are sent one after another, so resume per section.
+    start = time.monotonic()
+    elapsed_before = state["elapsed"]
+    with ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="broadcast") as pool:
+        for section in sections:
+            if section in state.get("finished_sections", []):
+                continue
+            after_id = state["last_user_id"] if state.get("section") == section else None
+            state["section"] = section
+            for chunk in _chunks(iter_recipients([section], paid_only, after_id), CHUNK_SIZE):
+                for outcome in pool.map(lambda r: _deliver(r[1], text, markup), chunk):
+                    state[outcome] += 1
+                state["last_user_id"] = chunk[-1][0]
+                state["elapsed"] = elapsed_before + time.monotonic() - start
+                save_checkpoint(name, state)
+                logger.info("Broadcast %s: %s sent, %s blocked, %s failed (%.1f msg/s)",
+                            name, state["sent"], state["blocked"], state["failed"],
+                            (state["sent"] + state["blocked"] + state["failed"]) / max(state["elapsed"], 1e-9))
+            state.setdefault("finished_sections", []).append(section)
+            state["last_user_id"] = None
+            save_checkpoint(name, state)
+
+    state["elapsed"] = elapsed_before + time.monotonic() - start
+    total = state["sent"] + state["blocked"] + state["failed"]
+    state["rate"] = total / state["elapsed"] if state["elapsed"] else 0.0
+    state["done"] = True
+    save_checkpoint(name, state)
+    return state
+
+
+def broadcast_daily_drop(restart=False):
+    today = daily.today_key()
+    text = (
+        "🧩 *Today's riddles are live!*\n\n"
+        f"{MAX_DAILY_RIDDLES} new riddles are waiting for you. Use /play to start."
+    )
+    return run_broadcast(f"daily-{today}", text, PAID_SECTIONS, restart=restart)
+
+
+def broadcast_saturday_challenge(restart=False):
+    if not daily.is_saturday():
+        logger.info("Not Saturday (UTC); nothing to announce")
+        return None
+    today = daily.today_key()
+    text = (
+        "🏆 *The Saturday Challenge has started!*\n\n"
+        f"{SATURDAY_RIDDLES_COUNT} hard riddles, a special leaderboard and prizes. Use /play to join."
+    )
+    return run_broadcast(f"saturday-{today}", text, PAID_SECTIONS, restart=restart)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2 or sys.argv[1] not in ("daily", "saturday"):
+        print("usage: python broadcast.py daily|saturday [--force-restart]")
+        sys.exit(1)
+    restart = "--force-restart" in sys.argv
+    if sys.argv[1] == "daily":
+        result = broadcast_daily_drop(restart)
+    else:
+        result = broadcast_saturday_challenge(restart)
+    print(json.dumps(result, indent=2))
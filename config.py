@@ -1,11 +1,96 @@
 import os
 
+# Telegram
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL") or f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
+
 # Payment
 PAYSTACK_SECRET_KEY = os.getenv("PAYSTACK_SECRET_KEY")
 PAYSTACK_PUBLIC_KEY = os.getenv("PAYSTACK_PUBLIC_KEY")
+# Paystack signs webhooks with the secret key unless a separate one is set.
+PAYSTACK_WEBHOOK_SECRET = os.getenv("PAYSTACK_WEBHOOK_SECRET") or PAYSTACK_SECRET_KEY
 
 # Monetag Ads
 MONETAG_KEY = os.getenv("MONETAG_KEY")  # For free user ads
 
+# Prices (Naira), prizes and gameplay
+ENTRY_FEES = {
+    "free": 0,
+    "vip": 2000,
+    "premium": 500,
+}
+
+UNLOCK_ALL_FEES = {
+    "vip": 200,
+    "premium": 100,
+}
+
+PRIZES = {
+    "vip": {
+        "1": 10000,
+        "2": 5000,
+        "3": 3000,
+        "4-10": 1000,  # airtime
+    },
+    "premium": {
+        "1": 5000,
+        "2": 3000,
+        "3": 1000,
+        "4-10": 500,  # airtime
+    },
+    "free": {
+        "no_cash_prize": True,
+    },
+}
+
+COIN_PACKS = {
+    50: 200,
+    100: 350,
+    200: 600,
+    500: 1200,
+}
+
+HINT_COST = 10
+DAILY_LOGIN_REWARD = 5
+# Extra coins on reaching these streak lengths.
+STREAK_BONUSES = {3: 10, 5: 25, 7: 40}
+REFERRAL_REWARD = 10  # coins to the referrer each time a referee buys coins or a hint
+POINTS_CORRECT_ANSWER = 10
+POINTS_HINT_PENALTY = 3
+MAX_DAILY_RIDDLES = 7
+SATURDAY_RIDDLES_COUNT = 10
+
+# Read-only dashboard endpoints (/api/leaderboard, /api/profile); closed
+# (403) unless set, in which case requests must send it in X-Dashboard-Token
+DASHBOARD_TOKEN = os.getenv("DASHBOARD_TOKEN")
+
+# Runtime sampling profiler (/debug/profiler); disabled unless set
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN")
+
 # Other configs
 DATA_DIR = os.getenv("DATA_DIR", "data")
+
+# Storage: "sqlite" (database.py) or "json" (data/*.json files)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+
+
+def validate():
+    """Check the environment once at startup.
+
+    Returns a list of warnings for settings that only disable a feature
+    (the bot still runs without Monetag, for instance) and raises ValueError
+    for ones the app cannot work without.
+    """
+    errors = []
+    warnings = []
+    if not TELEGRAM_BOT_TOKEN and not os.getenv("TELEGRAM_API_URL"):
+        warnings.append("TELEGRAM_BOT_TOKEN is not set; outgoing messages will fail")
+    if STORAGE_BACKEND not in ("sqlite", "json"):
+        errors.append(f"STORAGE_BACKEND must be 'sqlite' or 'json', not {STORAGE_BACKEND!r}")
+    if not PAYSTACK_SECRET_KEY:
+        warnings.append("PAYSTACK_SECRET_KEY is not set; payments are disabled")
+    if not MONETAG_KEY:
+        warnings.append("MONETAG_KEY is not set; free users get a text-only ad")
+    if errors:
+        raise ValueError("Invalid configuration: " + "; ".join(errors))
+    return warnings
@@ -0,0 +1,131 @@
+# daily.py
+#
+# Per-day counters (riddles done, daily scores, hints used, unlock-all, coins
+# spent) are keyed by the user's last_active_day. A record whose
+# last_active_day is not today simply reads as all zeros, so nothing has to
+# be written at midnight; the counters are reset in memory the next time the
+# record is written for some other reason.
+#
+# today_key() is computed once and reused until the next UTC midnight.
+# bulk_rollover() is an optional nightly job that zeroes stale counters for
+# everybody in a single pass, for reports that read the raw records.
+
+import copy
+import json
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import database
+import user_store
+from config import STORAGE_BACKEND
+
+DAILY_DEFAULTS = {
+    "daily_riddles_done": 0,
+    "daily_scores": {"free": 0, "vip": 0, "premium": 0, "saturday": 0},
+    "hints_used_today": 0,
+    "unlocked_all": False,
+    "coins_spent_today": 0,
+}
+
+_today = None
+_today_ordinal = 0
+_today_expires = 0.0
+
+
+def today_key():
+    """Today's UTC date as YYYY-MM-DD, recomputed only after midnight."""
+    global _today, _today_ordinal, _today_expires
+    now = time.time()
+    if now >= _today_expires:
+        current = datetime.fromtimestamp(now, timezone.utc)
+        midnight = (current + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        _today = current.strftime("%Y-%m-%d")
+        _today_ordinal = current.date().toordinal()
+        _today_expires = midnight.timestamp()
+    return _today
+
+
+def today_ordinal():
+    """Today's UTC date as a date ordinal (consecutive days differ by 1)."""
+    today_key()
+    return _today_ordinal
+
+
+def is_saturday():
+    """Whether today (UTC) is Saturday Challenge day."""
+    return date.fromordinal(today_ordinal()).weekday() == 5
+
+
+def is_current(user):
+    return user.get("last_active_day") == today_key()
+
+
+def get_daily(user, field):
+    """Read a daily counter; stale days read as the default."""
+    if not is_current(user):
+        return copy.deepcopy(DAILY_DEFAULTS[field])
+    value = user.get(field)
+    return copy.deepcopy(DAILY_DEFAULTS[field]) if value is None else value
+
+
+def roll_over(user):
+    """Reset the counters in place if the record is from an earlier day. Returns True if it was."""
+    if is_current(user):
+        return False
+    user["last_active_day"] = today_key()
+    for field, default in DAILY_DEFAULTS.items():
+        user[field] = copy.deepcopy(default)
+    return True
+
+
+def set_daily(user, field, value):
+    """Set a daily counter on a record that is about to be written anyway."""
+    roll_over(user)
+    user[field] = value
+
+
+def add_daily(user, field, amount=1):
+    set_daily(user, field, get_daily(user, field) + amount)
+
+
+def bulk_rollover():
+    """Zero the daily counters of every user whose record is from an earlier day.
+
+    last_active_day is left alone (it still says when the user last played).
+    Returns the number of records changed.
+    """
+    today = today_key()
+    if STORAGE_BACKEND == "sqlite":
+        conn = database.get_connection()
+        with conn:
+            cur = conn.execute(
+                """UPDATE users SET daily_riddles_done=0, daily_scores=?, hints_used_today=0,
+                       unlocked_all=0, coins_spent_today=0
+                   WHERE (last_active_day IS NULL OR last_active_day != ?)
+                     AND (daily_riddles_done != 0 OR hints_used_today != 0 OR unlocked_all != 0
+                          OR coins_spent_today != 0 OR daily_scores != ?)""",
+                (json.dumps(DAILY_DEFAULTS["daily_scores"]), today,
+                 json.dumps(DAILY_DEFAULTS["daily_scores"])),
+            )
+            return cur.rowcount
+    changed = {}
+    for user_id, user in user_store.iter_users():
+        if user.get("last_active_day") == today:
+            continue
+        stale = {f: user.get(f) for f in DAILY_DEFAULTS}
+        if all(v in (None, DAILY_DEFAULTS[f]) for f, v in stale.items()):
+            continue
+        for field, default in DAILY_DEFAULTS.items():
+            user[field] = copy.deepcopy(default)
+        changed[user_id] = user
+    user_store.set_users(changed)
+    return len(changed)
+
+
+if __name__ == "__main__":
+    # python daily.py rollover   (e.g. from cron just after 00:00 UTC)
+    if len(sys.argv) < 2 or sys.argv[1] != "rollover":
+        print("usage: python daily.py rollover")
+        sys.exit(1)
+    print(f"Reset daily counters for {bulk_rollover()} users")
@@ -1,58 +1,490 @@
+import json
+import os
 import sqlite3
-from contextlib import closing
+import sys
+import threading
+
+DB_PATH = os.getenv("DB_PATH", "app_data.db")
+
+# Full user record as built by app.handle_start. Every column maps to one
+# key of the user dict; "kind" says how the value is stored in SQLite.
+USER_COLUMNS = [
+    # (name, sql type and default, kind)
+    ("username", "TEXT DEFAULT ''", "text"),
+    ("coins", "INTEGER DEFAULT 0", "int"),
+    ("hints", "INTEGER DEFAULT 0", "int"),
+    ("section", "TEXT", "text"),
+    ("daily_riddles_done", "INTEGER DEFAULT 0", "int"),
+    ("last_active_day", "TEXT", "text"),
+    ("daily_scores", "TEXT", "json"),
+    ("streak", "INTEGER DEFAULT 0", "int"),
+    ("streak_day", "INTEGER DEFAULT 0", "int"),  # date ordinal of the last day counted in streak
+    ("referrals", "TEXT", "json"),
+    ("referred_by", "INTEGER", "int"),
+    ("has_paid_entry", "INTEGER DEFAULT 0", "bool"),
+    ("payment_reference", "TEXT", "text"),
+    ("waiting_for_answer", "INTEGER DEFAULT 0", "bool"),
+    ("current_riddle_index", "INTEGER DEFAULT 0", "int"),
+    ("using_hint_for_current", "INTEGER DEFAULT 0", "bool"),
+    ("coins_spent_today", "INTEGER DEFAULT 0", "int"),
+    ("hints_used_today", "INTEGER DEFAULT 0", "int"),
+    ("unlocked_all", "INTEGER DEFAULT 0", "bool"),
+    ("answered_riddles_count", "INTEGER DEFAULT 0", "int"),
+    ("answered", "TEXT", "json"),  # legacy form, see models.Progress
+    ("progress", "TEXT", "json"),
+    # Any keys not listed above (is_vip, phone, bank, ...) are kept here.
+    ("extra", "TEXT", "json"),
+]
+_USER_KINDS = {name: kind for name, _, kind in USER_COLUMNS}
+
+# Columns added to payments after the first release (see payments.py).
+PAYMENT_COLUMNS = [
+    ("purpose", "TEXT"),
+    ("metadata", "TEXT"),
+    ("updated_at", "TIMESTAMP"),
+]
+
+_SELECT_USER_COLUMNS = "user_id, chat_id, " + ", ".join(name for name, _, _ in USER_COLUMNS)
+_UPSERT_USER_SQL = """
+    INSERT INTO users (user_id, chat_id, {cols}) VALUES (?, ?, {marks})
+    ON CONFLICT(user_id) DO UPDATE SET chat_id=excluded.chat_id, {updates}
+""".format(
+    cols=", ".join(name for name, _, _ in USER_COLUMNS),
+    marks=", ".join("?" for _ in USER_COLUMNS),
+    updates=", ".join(f"{name}=excluded.{name}" for name, _, _ in USER_COLUMNS),
+)
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def get_connection():
+    """Return this thread's connection, opening it (in WAL mode) on first use.
+
+    Statements are kept as constant SQL strings so sqlite3's statement cache
+    reuses the prepared form on every call.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == DB_PATH:
+        return conn
+    conn = sqlite3.connect(DB_PATH, timeout=10, cached_statements=256)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=10000")
+    _local.conn = conn
+    _local.path = DB_PATH
+    if DB_PATH not in _schema_ready:
+        with _schema_lock:
+            if DB_PATH not in _schema_ready:
+                _create_schema(conn)
+                _schema_ready.add(DB_PATH)
+    return conn
+
+
+def _create_schema(conn):
+    with conn:
+        # One transaction, taken up front: workers starting together would
+        # otherwise all see a column missing and race to ALTER TABLE.
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                chat_id INTEGER NOT NULL,
+                email TEXT,
+                premium INTEGER DEFAULT 0
+            )
+        """)
+        # Older databases only have the four columns above.
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+        for name, decl, _ in USER_COLUMNS:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE users ADD COLUMN {name} {decl}")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_users_section ON users (section)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS payments (
+                reference TEXT PRIMARY KEY,
+                user_id INTEGER,
+                amount INTEGER,
+                status TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(payments)")}
+        for name, decl in PAYMENT_COLUMNS:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE payments ADD COLUMN {name} {decl}")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_status ON payments (status)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS scores (
+                section TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                username TEXT,
+                points INTEGER DEFAULT 0,
+                PRIMARY KEY (section, user_id)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_scores_points ON scores (section, points DESC)")
+        # Coin ledger (see ledger.py): append-only entries plus the
+        # materialised balance each entry was applied to.
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS coin_ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                delta INTEGER NOT NULL,
+                reason TEXT,
+                idem_key TEXT UNIQUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_coin_ledger_user ON coin_ledger (user_id, id)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS coin_balances (
+                user_id INTEGER PRIMARY KEY,
+                balance INTEGER NOT NULL DEFAULT 0 CHECK (balance >= 0)
+            )
+        """)
+        # Referral graph (referrals.py): one edge per referee, per-referrer
+        # counters so lookups and top-referrer queries never scan users, and
+        # rewards waiting to be credited in the next batch.
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS referrals (
+                referee_id INTEGER PRIMARY KEY,
+                referrer_id INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON referrals (referrer_id)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS referral_counts (
+                referrer_id INTEGER PRIMARY KEY,
+                referrals INTEGER NOT NULL DEFAULT 0,
+                coins_earned INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_referral_counts_top ON referral_counts (referrals DESC)")
+        # How far eventlog.py's materialiser has folded the answer log into
+        # the scores table; updated in the same transaction as the scores.
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS event_checkpoints (
+                name TEXT PRIMARY KEY,
+                segment TEXT NOT NULL,
+                offset INTEGER NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS referral_rewards_pending (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                referrer_id INTEGER NOT NULL,
+                referee_id INTEGER NOT NULL,
+                amount INTEGER NOT NULL,
+                event_key TEXT UNIQUE
+            )
+        """)
 
-DB_PATH = "app_data.db"
 
 def init_db():
-    with closing(sqlite3.connect(DB_PATH)) as conn:
-        with conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    chat_id INTEGER NOT NULL,
-                    email TEXT,
-                    premium INTEGER DEFAULT 0
-                )
-            """)
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS payments (
-                    reference TEXT PRIMARY KEY,
-                    user_id INTEGER,
-                    amount INTEGER,
-                    status TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
+    get_connection()
+
+
+# --------------------
+# Users
+# --------------------
+
+def _user_to_row(user_id, user):
+    values = []
+    extra = {k: v for k, v in user.items() if k not in _USER_KINDS and k not in ("id", "chat_id")}
+    for name, decl, kind in USER_COLUMNS:
+        value = extra if name == "extra" else user.get(name)
+        if value is None and decl.endswith("DEFAULT 0"):
+            value = 0
+        if kind == "json":
+            value = json.dumps(value) if value is not None else None
+        elif kind == "bool":
+            value = 1 if value else 0
+        values.append(value)
+    chat_id = user.get("chat_id") or user_id
+    return (int(user_id), int(chat_id), *values)
+
+
+def _row_to_user(row):
+    user = {"id": row[0]}
+    extra = {}
+    for (name, _, kind), value in zip(USER_COLUMNS, row[2:]):
+        if kind == "json":
+            value = json.loads(value) if value is not None else None
+        elif kind == "bool":
+            value = bool(value)
+        if name == "extra":
+            extra = value or {}
+        else:
+            user[name] = value
+    if user.get("daily_scores") is None:
+        user["daily_scores"] = {"free": 0, "vip": 0, "premium": 0, "saturday": 0}
+    if user.get("referrals") is None:
+        user["referrals"] = []
+    user.update(extra)
+    return user
+
+
+def load_user(user_id):
+    row = get_connection().execute(
+        f"SELECT {_SELECT_USER_COLUMNS} FROM users WHERE user_id=?", (int(user_id),)
+    ).fetchone()
+    return _row_to_user(row) if row else None
+
+
+def save_user(user_id, user):
+    conn = get_connection()
+    with conn:
+        conn.execute(_UPSERT_USER_SQL, _user_to_row(user_id, user))
+
+
+def update_user(user_id, changes, expected=None):
+    """Set only the given keys of a user's record, optionally only while the
+    keys in `expected` still hold those values. Returns True if it changed."""
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            f"SELECT {_SELECT_USER_COLUMNS} FROM users WHERE user_id=?", (int(user_id),)
+        ).fetchone()
+        if row is None:
+            return False
+        user = _row_to_user(row)
+        if expected and any(user.get(k) != v for k, v in expected.items()):
+            return False
+        user.update(changes)
+        conn.execute(_UPSERT_USER_SQL, _user_to_row(user_id, user))
+        return True
+
+
+def save_users(users):
+    """Upsert many {user_id: record} entries in one transaction."""
+    conn = get_connection()
+    with conn:
+        conn.executemany(_UPSERT_USER_SQL, (_user_to_row(uid, u) for uid, u in users.items()))
+
+
+def iter_users(section=None, chunk_size=500, after_id=None):
+    """Yield (user_id, record) in user_id order, fetching one chunk at a time."""
+    conn = get_connection()
+    last_id = -1 if after_id is None else int(after_id)
+    while True:
+        if section is None:
+            rows = conn.execute(
+                f"SELECT {_SELECT_USER_COLUMNS} FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                (last_id, chunk_size),
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                f"SELECT {_SELECT_USER_COLUMNS} FROM users WHERE section = ? AND user_id > ? ORDER BY user_id LIMIT ?",
+                (section, last_id, chunk_size),
+            ).fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield str(row[0]), _row_to_user(row)
+        last_id = rows[-1][0]
+
+
+def count_users():
+    return get_connection().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
 
 def add_user(user_id, chat_id, email=None):
-    with closing(sqlite3.connect(DB_PATH)) as conn:
-        with conn:
-            conn.execute("""
-                INSERT OR IGNORE INTO users (user_id, chat_id, email) VALUES (?, ?, ?)
-            """, (user_id, chat_id, email))
+    conn = get_connection()
+    with conn:
+        conn.execute("""
+            INSERT OR IGNORE INTO users (user_id, chat_id, email) VALUES (?, ?, ?)
+        """, (user_id, chat_id, email))
 
 def set_user_premium(user_id):
-    with closing(sqlite3.connect(DB_PATH)) as conn:
-        with conn:
-            conn.execute("UPDATE users SET premium=1 WHERE user_id=?", (user_id,))
+    conn = get_connection()
+    with conn:
+        conn.execute("UPDATE users SET premium=1 WHERE user_id=?", (user_id,))
 
 def get_user(user_id):
-    with closing(sqlite3.connect(DB_PATH)) as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT user_id, chat_id, email, premium FROM users WHERE user_id=?", (user_id,))
-        row = cur.fetchone()
-        if row:
-            return {
-                "user_id": row[0],
-                "chat_id": row[1],
-                "email": row[2],
-                "premium": bool(row[3]),
-            }
+    cur = get_connection().cursor()
+    cur.execute("SELECT user_id, chat_id, email, premium FROM users WHERE user_id=?", (user_id,))
+    row = cur.fetchone()
+    if row:
+        return {
+            "user_id": row[0],
+            "chat_id": row[1],
+            "email": row[2],
+            "premium": bool(row[3]),
+        }
+    return None
+
+# --------------------
+# Payments
+# --------------------
+
+def add_payment(reference, user_id, amount, status, purpose=None, metadata=None):
+    """Record a payment once. Returns False if the reference was already known."""
+    conn = get_connection()
+    with conn:
+        cur = conn.execute("""
+            INSERT OR IGNORE INTO payments (reference, user_id, amount, status, purpose, metadata, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """, (reference, user_id, amount, status, purpose,
+              json.dumps(metadata) if metadata is not None else None))
+        return cur.rowcount == 1
+
+def get_payment(reference):
+    row = get_connection().execute(
+        "SELECT reference, user_id, amount, status, purpose, metadata FROM payments WHERE reference=?",
+        (reference,),
+    ).fetchone()
+    if not row:
         return None
+    return {
+        "reference": row[0],
+        "user_id": row[1],
+        "amount": row[2],
+        "status": row[3],
+        "purpose": row[4],
+        "metadata": json.loads(row[5]) if row[5] else {},
+    }
+
+def set_payment_status(reference, status, expected=None):
+    """Move a payment to a new status, optionally only from an expected one.
+
+    Returns True if the row changed, which makes the update usable as a claim.
+    """
+    conn = get_connection()
+    with conn:
+        if expected is None:
+            cur = conn.execute(
+                "UPDATE payments SET status=?, updated_at=CURRENT_TIMESTAMP WHERE reference=?",
+                (status, reference),
+            )
+        else:
+            cur = conn.execute(
+                "UPDATE payments SET status=?, updated_at=CURRENT_TIMESTAMP WHERE reference=? AND status=?",
+                (status, reference, expected),
+            )
+        return cur.rowcount == 1
+
+def payments_with_status(status, older_than_seconds=0):
+    return [row[0] for row in get_connection().execute(
+        "SELECT reference FROM payments WHERE status=? AND updated_at <= datetime('now', ?)",
+        (status, f"-{int(older_than_seconds)} seconds"),
+    )]
+
+# --------------------
+# Scores
+# --------------------
+
+def get_scores():
+    """Return scores in the scores.json shape: {section: {user_id: {...}}}."""
+    scores = {"free": {}, "vip": {}, "premium": {}, "saturday": {}}
+    for section, user_id, username, points in get_connection().execute(
+        "SELECT section, user_id, username, points FROM scores"
+    ):
+        scores.setdefault(section, {})[str(user_id)] = {"username": username, "points": points}
+    return scores
+
+
+def top_scores(section, limit=10):
+    return get_connection().execute(
+        "SELECT user_id, username, points FROM scores WHERE section=? ORDER BY points DESC LIMIT ?",
+        (section, limit),
+    ).fetchall()
+
+
+def update_score(section, user_id, username, points):
+    conn = get_connection()
+    with conn:
+        conn.execute("""
+            INSERT INTO scores (section, user_id, username, points) VALUES (?, ?, ?, ?)
+            ON CONFLICT(section, user_id) DO UPDATE SET username=excluded.username, points=excluded.points
+        """, (section, int(user_id), username, points))
+
+
+def get_checkpoint(name):
+    """(segment, offset) saved by add_points, or None."""
+    row = get_connection().execute(
+        "SELECT segment, offset FROM event_checkpoints WHERE name=?", (name,)
+    ).fetchone()
+    return tuple(row) if row else None
+
+
+def add_points(deltas, checkpoint_name, expected, new):
+    """Add points to many scores and move a checkpoint, atomically.
+
+    deltas: iterable of (section, user_id, username, points_to_add).
+    The checkpoint must still be `expected` (None if never saved), otherwise
+    another process already applied this stretch and nothing is written.
+    Returns the new (section, user_id, username, points) rows, or None.
+    """
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT segment, offset FROM event_checkpoints WHERE name=?", (checkpoint_name,)
+        ).fetchone()
+        if (tuple(row) if row else None) != (tuple(expected) if expected else None):
+            conn.rollback()
+            return None
+        totals = []
+        for section, user_id, username, points in deltas:
+            totals.append(conn.execute("""
+                INSERT INTO scores (section, user_id, username, points) VALUES (?, ?, ?, ?)
+                ON CONFLICT(section, user_id) DO UPDATE SET
+                    username=COALESCE(excluded.username, username), points=points + excluded.points
+                RETURNING section, user_id, username, points
+            """, (section, int(user_id), username, points)).fetchone())
+        conn.execute(
+            "INSERT OR REPLACE INTO event_checkpoints (name, segment, offset) VALUES (?, ?, ?)",
+            (checkpoint_name, new[0], new[1]),
+        )
+        conn.commit()
+        return totals
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def save_scores(scores):
+    rows = [
+        (section, int(user_id), entry.get("username"), entry.get("points", 0))
+        for section, entries in scores.items()
+        for user_id, entry in entries.items()
+    ]
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM scores")
+        conn.executemany(
+            "INSERT INTO scores (section, user_id, username, points) VALUES (?, ?, ?, ?)", rows
+        )
+
+# --------------------
+# One-shot import from the JSON files
+# --------------------
+
+def import_json(users_file, scores_file):
+    """Copy users.json / scores.json into the database. The riddle catalogue
+    stays in riddles.json (riddles.py)."""
+    counts = {}
+    if users_file and os.path.exists(users_file):
+        with open(users_file) as f:
+            users = json.load(f)
+        save_users(users)
+        counts["users"] = len(users)
+    if scores_file and os.path.exists(scores_file):
+        with open(scores_file) as f:
+            scores = json.load(f)
+        save_scores(scores)
+        counts["scores"] = sum(len(v) for v in scores.values())
+    return counts
+
 
-def add_payment(reference, user_id, amount, status):
-    with closing(sqlite3.connect(DB_PATH)) as conn:
-        with conn:
-            conn.execute("""
-                INSERT OR IGNORE INTO payments (reference, user_id, amount, status) VALUES (?, ?, ?, ?)
-            """, (reference, user_id, amount, status))
+if __name__ == "__main__":
+    # python database.py import data/users.json data/scores.json
+    if len(sys.argv) != 4 or sys.argv[1] != "import":
+        print("usage: python database.py import USERS_JSON SCORES_JSON")
+        sys.exit(1)
+    result = import_json(sys.argv[2], sys.argv[3])
+    print(f"Imported into {DB_PATH}: {result}")
@@ -0,0 +1,416 @@
+# eventlog.py
+#
+# Append-only log of gameplay events (answer, hint, skip). Recording an
+# answer is one small write to the end of today's segment file
+# (data/events/YYYY-MM-DD.jsonl, one compact JSON object per line) instead of
+# rewriting the user and scores files. Segments are opened with O_APPEND, so
+# several gunicorn workers can share them; fsync is batched, every
+# FSYNC_INTERVAL seconds or FSYNC_BATCH events, whichever comes first, and
+# append(..., durable=True) waits for it.
+#
+# materialise() folds everything after the saved checkpoint (segment,
+# byte offset) into the stored scores and the live leaderboard index:
+#
+#   - SQLite: score increments and the new checkpoint commit in one
+#     transaction, so each event is counted exactly once even with several
+#     workers materialising.
+#   - JSON: one worker at a time materialises (the checkpoint's filestore
+#     lock); scores.json is updated under its own lock, so it cannot race
+#     app.update_score, and both files are replaced atomically. Every score
+#     entry a batch touches records the log position it now includes ("ev":
+#     [segment, offset]) in the same write, and events at or before an
+#     entry's position are skipped. A crash after scores.json is written but
+#     before the checkpoint is therefore harmless: the batch is read again
+#     and adds nothing.
+#
+# replay() recomputes boards for any range of days straight from the log
+# (daily and weekly boards, audits) without touching stored state.
+#
+# Record fields: ts (unix time), k (kind), u (user id), s (section), and when
+# present r (riddle id), p (points earned) and n (username).
+
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+import daily
+import database
+import filestore
+import leaderboard
+import metrics
+from config import DATA_DIR, STORAGE_BACKEND
+
+logger = logging.getLogger(__name__)
+
+EVENTS_DIR = os.getenv("EVENTS_DIR", os.path.join(DATA_DIR, "events"))
+SCORES_FILE = os.path.join(DATA_DIR, "scores.json")
+CHECKPOINT_FILE = os.path.join(EVENTS_DIR, "checkpoint.json")
+CHECKPOINT_NAME = "scores"
+
+KINDS = ("answer", "hint", "skip")
+FSYNC_INTERVAL = float(os.getenv("EVENTLOG_FSYNC_INTERVAL", "0.05"))  # seconds
+FSYNC_BATCH = 256
+# 0 disables the in-process materialiser (run `python eventlog.py materialise` instead).
+MATERIALISE_INTERVAL = float(os.getenv("EVENTLOG_MATERIALISE_INTERVAL", "5"))
+
+_lock = threading.Lock()
+_sync_done = threading.Condition(_lock)
+_fd = None
+_fd_day = None
+_written = 0  # events written by this process
+_synced = 0  # of which fsynced
+_threads_started = False
+
+
+# --------------------
+# Writing
+# --------------------
+
+def _segment_path(day):
+    return os.path.join(EVENTS_DIR, f"{day}.jsonl")
+
+
+def _open_segment_locked(day):
+    global _fd, _fd_day
+    if _fd is not None and _fd_day == day:
+        return _fd
+    if _fd is not None:
+        _sync_locked()
+        os.close(_fd)
+    os.makedirs(EVENTS_DIR, exist_ok=True)
+    _fd = os.open(_segment_path(day), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    _fd_day = day
+    return _fd
+
+
+def _sync_locked():
+    global _synced
+    if _fd is not None and _synced < _written:
+        os.fsync(_fd)
+        _synced = _written
+        _sync_done.notify_all()
+
+
+def append(kind, user_id, section, riddle_id=None, points=0, username=None, durable=False):
+    """Log one event. With durable=True, return only once it is fsynced."""
+    if kind not in KINDS:
+        raise ValueError(f"unknown event kind {kind!r}")
+    record = {"ts": round(time.time(), 3), "k": kind, "u": int(user_id), "s": section}
+    if riddle_id is not None:
+        record["r"] = riddle_id
+    if points:
+        record["p"] = points
+    if username:
+        record["n"] = username
+    line = (json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n").encode("utf-8")
+    # Before taking _lock: a durable append waits for the fsync thread.
+    _start_threads()
+    global _written
+    with _lock:
+        # One write() per line: with O_APPEND the line lands whole even if
+        # another worker is appending to the same segment.
+        os.write(_open_segment_locked(daily.today_key()), line)
+        _written += 1
+        mine = _written
+        if _written - _synced >= FSYNC_BATCH:
+            _sync_locked()
+        elif durable:
+            while _synced < mine:
+                _sync_done.wait()
+    metrics.inc("eventlog_events_total", kind=kind)
+
+
+def sync():
+    """fsync everything appended so far."""
+    with _lock:
+        _sync_locked()
+
+
+def _start_threads():
+    global _threads_started
+    if _threads_started:
+        return
+    with _lock:
+        if _threads_started:
+            return
+        _threads_started = True
+    threading.Thread(target=_sync_loop, name="eventlog-fsync", daemon=True).start()
+    if MATERIALISE_INTERVAL > 0:
+        threading.Thread(target=_materialise_loop, name="eventlog-materialise", daemon=True).start()
+
+
+def _sync_loop():
+    while True:
+        time.sleep(FSYNC_INTERVAL)
+        sync()
+
+
+def _materialise_loop():
+    while True:
+        time.sleep(MATERIALISE_INTERVAL)
+        try:
+            materialise()
+        except Exception:
+            logger.exception("Materialising the event log failed; will retry")
+
+
+atexit.register(sync)
+
+
+# --------------------
+# Reading
+# --------------------
+
+def segments():
+    """Segment days present on disk, oldest first."""
+    if not os.path.isdir(EVENTS_DIR):
+        return []
+    return sorted(name[:-6] for name in os.listdir(EVENTS_DIR) if name.endswith(".jsonl"))
+
+
+def read(start=None, until=None):
+    """Yield (day, end_offset, record) for complete lines after `start`
+    ((day, byte offset) or None for the beginning), up to and including
+    segment day `until`. A line still being written is left for next time."""
+    first_day, offset = start or (None, 0)
+    for day in segments():
+        if first_day is not None and day < first_day:
+            continue
+        if until is not None and day > until:
+            break
+        position = offset if day == first_day else 0
+        with open(_segment_path(day), "rb") as f:
+            f.seek(position)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                position += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning("Skipping corrupt event in %s at byte %d", day, position - len(line))
+                    continue
+                yield day, position, record
+
+
+def fold(records, scores=None, default_name="Anonymous"):
+    """Add answer points from records into a scores.json-shaped dict."""
+    scores = {} if scores is None else scores
+    for record in records:
+        if record.get("k") != "answer" or not record.get("p"):
+            continue
+        entry = scores.setdefault(record["s"], {}).setdefault(
+            str(record["u"]), {"username": record.get("n") or default_name, "points": 0}
+        )
+        entry["points"] += record["p"]
+        if record.get("n"):
+            entry["username"] = record["n"]
+    return scores
+
+
+def replay(first_day=None, last_day=None):
+    """Scores for the events logged between two days (inclusive, YYYY-MM-DD)."""
+    return fold(record for _, _, record in read((first_day, 0) if first_day else None, last_day))
+
+
+def window_totals(first_day=None, last_day=None):
+    """Yield (section, user_id, points) per player for the events logged
+    between two days, without holding every player in memory: the events
+    are grouped in a throwaway on-disk SQLite database that spills to disk."""
+    conn = sqlite3.connect("")  # private temporary database, deleted on close
+    try:
+        conn.execute("PRAGMA temp_store = FILE")
+        conn.execute("CREATE TABLE points (section TEXT, user_id INTEGER, points INTEGER)")
+        conn.executemany(
+            "INSERT INTO points VALUES (?, ?, ?)",
+            (
+                (record["s"], record["u"], record["p"])
+                for _, _, record in read((first_day, 0) if first_day else None, last_day)
+                if record.get("k") == "answer" and record.get("p")
+            ),
+        )
+        yield from conn.execute("SELECT section, user_id, SUM(points) FROM points GROUP BY section, user_id")
+    finally:
+        conn.close()
+
+
+def daily_board(day=None):
+    day = day or daily.today_key()
+    return replay(day, day)
+
+
+def weekly_board(last_day=None):
+    """Scores over the 7 days ending on last_day (default today)."""
+    last_day = last_day or daily.today_key()
+    first_day = (date.fromisoformat(last_day) - timedelta(days=6)).isoformat()
+    return replay(first_day, last_day)
+
+
+# --------------------
+# Materialising into stored scores
+# --------------------
+
+def _pending(checkpoint, limit):
+    """Fold up to `limit` events after the checkpoint. Returns (deltas, new checkpoint, count)."""
+    deltas = {}
+    new = checkpoint
+    count = 0
+    for day, end, record in read(checkpoint):
+        fold([record], deltas, default_name=None)  # keep the stored name if the event has none
+        new = (day, end)
+        count += 1
+        if limit and count >= limit:
+            break
+    return deltas, new, count
+
+
+def _materialise_sqlite(limit):
+    checkpoint = database.get_checkpoint(CHECKPOINT_NAME)
+    deltas, new, count = _pending(checkpoint, limit)
+    if not count:
+        return 0, []
+    rows = [
+        (section, user_id, entry["username"], entry["points"])
+        for section, entries in deltas.items()
+        for user_id, entry in entries.items()
+    ]
+    totals = database.add_points(rows, CHECKPOINT_NAME, checkpoint, new)
+    if totals is None:
+        return 0, []  # another worker got there first
+    return count, totals
+
+
+def _materialise_json(limit):
+    with filestore.locked(CHECKPOINT_FILE, blocking=False) as acquired:
+        if not acquired:
+            return 0, []  # another worker is materialising
+        saved = filestore.read_json(CHECKPOINT_FILE)
+        checkpoint = (saved["segment"], saved["offset"]) if saved else None
+        events = []
+        new = checkpoint
+        for day, end, record in read(checkpoint):
+            events.append(((day, end), record))
+            new = (day, end)
+            if limit and len(events) >= limit:
+                break
+        if not events:
+            return 0, []
+        with filestore.locked(SCORES_FILE):
+            scores = filestore.read_json(SCORES_FILE)
+            touched = {}
+            for position, record in events:
+                if record.get("k") != "answer" or not record.get("p"):
+                    continue
+                section, user_id = record["s"], str(record["u"])
+                stored = scores.setdefault(section, {}).setdefault(
+                    user_id, {"username": record.get("n") or "Anonymous", "points": 0}
+                )
+                if tuple(stored.get("ev") or ("", 0)) >= position:
+                    continue  # already in this entry (a batch whose checkpoint was lost)
+                stored["points"] += record["p"]
+                stored["username"] = record.get("n") or stored["username"]
+                touched[(section, user_id)] = stored
+            for stored in touched.values():
+                stored["ev"] = list(new)
+            filestore.write_json(SCORES_FILE, scores)
+        filestore.write_json(CHECKPOINT_FILE, {"segment": new[0], "offset": new[1]})
+        totals = [(section, user_id, e["username"], e["points"]) for (section, user_id), e in touched.items()]
+        return len(events), totals
+
+
+@metrics.timed("eventlog_materialise_seconds")
+def materialise(limit=50000):
+    """Fold new events into the stored scores. Returns the number of events applied."""
+    sync()
+    if STORAGE_BACKEND == "sqlite":
+        count, totals = _materialise_sqlite(limit)
+    else:
+        count, totals = _materialise_json(limit)
+    if totals and not leaderboard.index_is_stale():
+        for section, user_id, username, points in totals:
+            leaderboard.record_score(section, user_id, username, points)
+    if count:
+        metrics.inc("eventlog_materialised_total", count)
+    return count
+
+
+def stored_scores():
+    if STORAGE_BACKEND == "sqlite":
+        return database.get_scores()
+    return filestore.read_json(SCORES_FILE)
+
+
+def audit():
+    """Compare stored scores with a full replay of the log. Returns
+    [(section, user_id, stored points, replayed points)] that differ; users
+    with points from before the event log existed show up here too."""
+    replayed = replay()
+    stored = stored_scores()
+    mismatches = []
+    for section in sorted(set(replayed) | set(stored)):
+        ours, theirs = replayed.get(section, {}), stored.get(section, {})
+        for user_id in sorted(set(ours) | set(theirs), key=int):
+            a = (theirs.get(user_id) or {}).get("points", 0)
+            b = (ours.get(user_id) or {}).get("points", 0)
+            if a != b:
+                mismatches.append((section, user_id, a, b))
+    return mismatches
+
+
+def rebuild_scores():
+    """Replace the stored scores with a full replay and reset the checkpoint."""
+    sync()
+    scores = replay()
+    days = segments()
+    end = (days[-1], os.path.getsize(_segment_path(days[-1]))) if days else ("", 0)
+    if STORAGE_BACKEND == "sqlite":
+        database.save_scores(scores)
+        conn = database.get_connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO event_checkpoints (name, segment, offset) VALUES (?, ?, ?)",
+                (CHECKPOINT_NAME, end[0], end[1]),
+            )
+    else:
+        for entries in scores.values():
+            for entry in entries.values():
+                entry["ev"] = list(end)
+        with filestore.locked(CHECKPOINT_FILE), filestore.locked(SCORES_FILE):
+            filestore.write_json(SCORES_FILE, scores)
+            filestore.write_json(CHECKPOINT_FILE, {"segment": end[0], "offset": end[1]})
+    leaderboard.rebuild_index(scores)
+    return scores
+
+
+if __name__ == "__main__":
+    # python eventlog.py materialise | audit | rebuild | daily [DAY] | weekly [DAY]
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    arg = sys.argv[2] if len(sys.argv) > 2 else None
+    if command == "materialise":
+        total = 0
+        while True:
+            applied = materialise()
+            if not applied:
+                break
+            total += applied
+        print(f"Materialised {total} events")
+    elif command == "audit":
+        mismatches = audit()
+        for section, user_id, stored, replayed in mismatches:
+            print(f"{section}\t{user_id}\tstored={stored}\treplayed={replayed}")
+        print(f"{len(mismatches)} mismatches")
+    elif command == "rebuild":
+        scores = rebuild_scores()
+        print(f"Rebuilt scores for {sum(len(v) for v in scores.values())} entries")
+    elif command in ("daily", "weekly"):
+        board = daily_board(arg) if command == "daily" else weekly_board(arg)
+        print(json.dumps(board, indent=2))
+    else:
+        print("usage: python eventlog.py materialise|audit|rebuild|daily [DAY]|weekly [DAY]")
+        sys.exit(1)
@@ -0,0 +1,106 @@
+# filestore.py
+#
+# Coordination for the JSON files that several gunicorn workers (and the cron
+# jobs) share. Three pieces, used by every path that writes a data file:
+#
+#   locked(path)        an fcntl lock on "<path>.lock", held across a
+#                       read-modify-write so two processes cannot interleave
+#                       and drop each other's changes. Shared locks for
+#                       readers that need a consistent multi-file view.
+#   atomic_write(path)  write to a temp file in the same directory, fsync and
+#                       rename over the target, so readers see either the old
+#                       or the new file and a crash never leaves half a file.
+#   generation(path)    the file's identity (inode, mtime, size). Every atomic
+#                       write creates a new inode, so a worker compares the
+#                       generation it loaded with the current one to know its
+#                       cached copy is stale, even within one mtime tick.
+#
+# update_json() combines them: lock, read, apply a function, write, unlock.
+# flock locks belong to an open file, so they also serialise threads of one
+# process as long as each acquisition opens the lock file itself (they do).
+
+import fcntl
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+def lock_path(path):
+    return path + ".lock"
+
+
+@contextmanager
+def locked(path, shared=False, blocking=True):
+    """Hold the inter-process lock for path. With blocking=False, yields False
+    instead of waiting when another process holds it."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    with open(lock_path(path), "a") as lock:
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(lock, flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+@contextmanager
+def atomic_write(path, mode="w", **kwargs):
+    """Yield a temp file that replaces path when the block exits cleanly."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.basename(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def generation(path):
+    """An opaque value that changes whenever path is replaced; None if missing."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def read_json(path, default=None):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {} if default is None else default
+
+
+def write_json(path, data, indent=2):
+    """Atomically replace path with data. Callers doing read-modify-write
+    should hold locked(path) or use update_json()."""
+    with atomic_write(path) as f:
+        json.dump(data, f, indent=indent)
+
+
+def update_json(path, apply, default=None, indent=2):
+    """Under the file's lock, load it, call apply(data) (which may mutate data
+    or return a replacement) and write the result. Returns the written data."""
+    with locked(path):
+        data = read_json(path, default)
+        result = apply(data)
+        if result is not None:
+            data = result
+        write_json(path, data, indent)
+        return data
@@ -1,28 +1,48 @@
-import json
+import bisect
+import os
+import threading
+import time
+from functools import lru_cache
 
-USERS_FILE = "data/users.json"
-LEADERBOARD_FILE = "data/leaderboard.json"
-SATURDAY_RIDDLE_IDS = list(range(41, 51))  # IDs 41–50 are Saturday riddles
+import filestore
+import metrics
+import riddles
+import user_store
+from config import DATA_DIR
+from models import progress_of, riddle_mask
+
+USERS_FILE = os.path.join(DATA_DIR, "users.json")
+LEADERBOARD_FILE = os.path.join(DATA_DIR, "leaderboard.json")
+
+def saturday_riddle_ids():
+    # Ids of the riddles in the catalogue's "saturday" section.
+    return riddles.section_ids("saturday")
+
+@lru_cache(maxsize=8)
+def _mask(riddle_ids):
+    return riddle_mask(riddle_ids)
 
 def load_json(filepath):
-    with open(filepath, "r") as f:
-        return json.load(f)
+    return filestore.read_json(filepath)
 
 def save_json(filepath, data):
-    with open(filepath, "w") as f:
-        json.dump(data, f, indent=4)
+    filestore.write_json(filepath, data, indent=4)
+
+def answered_score(user_data, riddle_ids=None):
+    """A user's riddle score, optionally over just the given riddle ids."""
+    progress = progress_of(user_data)
+    if riddle_ids is None:
+        return progress.score()
+    return progress.score(_mask(tuple(riddle_ids)))
 
 def calculate_leaderboard():
-    users = load_json(USERS_FILE)
     leaderboard = []
 
-    for user_id, user_data in users.items():
+    for user_id, user_data in user_store.iter_users():
         if not user_data.get("is_vip") and not user_data.get("is_premium"):
             continue
 
-        score = 0
-        for riddle_id_str, ans_data in user_data.get("answered", {}).items():
-            score += ans_data.get("score", 0)
+        score = answered_score(user_data)
 
         leaderboard.append({
             "user_id": user_id,
@@ -34,14 +54,11 @@ def calculate_leaderboard():
     save_json(LEADERBOARD_FILE, leaderboard)
 
 def calculate_saturday_winners():
-    users = load_json(USERS_FILE)
     saturday_board = []
+    saturday_ids = saturday_riddle_ids()
 
-    for user_id, user_data in users.items():
-        score = 0
-        for riddle_id in SATURDAY_RIDDLE_IDS:
-            ans_data = user_data.get("answered", {}).get(str(riddle_id), {})
-            score += ans_data.get("score", 0)
+    for user_id, user_data in user_store.iter_users():
+        score = answered_score(user_data, saturday_ids)
 
         if score > 0:
             saturday_board.append({
@@ -53,3 +70,172 @@ def calculate_saturday_winners():
     saturday_board.sort(key=lambda x: x["saturday_score"], reverse=True)
     return saturday_board  # This part is used for payout
 
+
+# --------------------
+# Live leaderboard index
+# --------------------
+#
+# One ordering of (-points, user_id) per section, updated in place when a
+# score changes, so top-10 and "my rank" are a slice and a bisect instead of
+# a full sort per /leaderboard call. The rendered top-10 text is cached until
+# a change actually reaches the top 10.
+#
+# The ordering is a list of sorted chunks (_Ranking) rather than one flat
+# list: moving a score bisects the chunk maxima and then shifts entries
+# within one chunk of at most 2 * CHUNK_SIZE, instead of shifting the whole
+# section as list.insert would. A rank sums the lengths of the chunks before
+# it, one int per CHUNK_SIZE players.
+#
+# The index is per process: callers rebuild it from storage (index_is_stale /
+# rebuild_index) every INDEX_MAX_AGE seconds so scores written by other
+# gunicorn workers show up.
+
+SECTIONS = ("free", "vip", "premium", "saturday")
+TOP_N = 10
+INDEX_MAX_AGE = 30  # seconds
+CHUNK_SIZE = 512
+
+_index_lock = threading.Lock()
+_index = {}
+_index_built_at = None
+
+
+class _Ranking:
+    """A sorted collection of (-points, user_id) kept as sorted chunks."""
+
+    def __init__(self, items=()):
+        items = sorted(items)
+        self.chunks = [items[i:i + CHUNK_SIZE] for i in range(0, len(items), CHUNK_SIZE)]
+        self.maxes = [chunk[-1] for chunk in self.chunks]
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self.chunks)
+
+    def _chunk_for(self, item):
+        return min(bisect.bisect_left(self.maxes, item), len(self.maxes) - 1)
+
+    def add(self, item):
+        """Insert item; returns its position."""
+        if not self.chunks:
+            self.chunks.append([item])
+            self.maxes.append(item)
+            return 0
+        i = self._chunk_for(item)
+        chunk = self.chunks[i]
+        j = bisect.bisect_left(chunk, item)
+        chunk.insert(j, item)
+        self.maxes[i] = chunk[-1]
+        position = self._before(i) + j
+        if len(chunk) > 2 * CHUNK_SIZE:
+            self.chunks[i:i + 1] = [chunk[:CHUNK_SIZE], chunk[CHUNK_SIZE:]]
+            self.maxes[i:i + 1] = [chunk[CHUNK_SIZE - 1], chunk[-1]]
+        return position
+
+    def remove(self, item):
+        """Remove item, which must be present; returns its position."""
+        i = self._chunk_for(item)
+        chunk = self.chunks[i]
+        j = bisect.bisect_left(chunk, item)
+        del chunk[j]
+        position = self._before(i) + j
+        if chunk:
+            self.maxes[i] = chunk[-1]
+        else:
+            del self.chunks[i], self.maxes[i]
+        return position
+
+    def position(self, item):
+        """How many items sort before item."""
+        if not self.chunks:
+            return 0
+        i = bisect.bisect_left(self.maxes, item)
+        if i == len(self.chunks):
+            return len(self)
+        return self._before(i) + bisect.bisect_left(self.chunks[i], item)
+
+    def head(self, limit):
+        out = []
+        for chunk in self.chunks:
+            out.extend(chunk[:limit - len(out)])
+            if len(out) >= limit:
+                break
+        return out
+
+    def _before(self, i):
+        return sum(len(chunk) for chunk in self.chunks[:i])
+
+
+def _empty_section():
+    return {"entries": {}, "order": _Ranking(), "text": None}
+
+
+def rebuild_index(scores):
+    """Replace the index with a scores.json-shaped dict {section: {user_id: {...}}}."""
+    global _index, _index_built_at
+    index = {}
+    for section in set(SECTIONS) | set(scores):
+        sec = _empty_section()
+        for user_id, data in scores.get(section, {}).items():
+            sec["entries"][str(user_id)] = (data.get("points", 0), data.get("username", "Anonymous"))
+        sec["order"] = _Ranking((-points, user_id) for user_id, (points, _) in sec["entries"].items())
+        index[section] = sec
+    with _index_lock:
+        _index = index
+        _index_built_at = time.monotonic()
+
+
+def index_is_stale():
+    return _index_built_at is None or time.monotonic() - _index_built_at > INDEX_MAX_AGE
+
+
+def record_score(section, user_id, username, points):
+    """Apply one user's new total for a section to the index."""
+    user_id = str(user_id)
+    with _index_lock:
+        sec = _index.setdefault(section, _empty_section())
+        order = sec["order"]
+        old = sec["entries"].get(user_id)
+        touches_top = False
+        if old is not None:
+            touches_top = order.remove((-old[0], user_id)) < TOP_N
+        pos = order.add((-points, user_id))
+        sec["entries"][user_id] = (points, username or "Anonymous")
+        if touches_top or pos < TOP_N:
+            sec["text"] = None
+
+
+def user_rank(section, user_id):
+    """Return (rank, points) for a user, or None if they have no score in the section."""
+    with _index_lock:
+        sec = _index.get(section)
+        entry = sec["entries"].get(str(user_id)) if sec else None
+        if entry is None:
+            return None
+        # Competition ranking: one more than the number of strictly higher scores.
+        return sec["order"].position((-entry[0],)) + 1, entry[0]
+
+
+def top_entries(section, limit=TOP_N):
+    with _index_lock:
+        sec = _index.get(section)
+        if not sec:
+            return []
+        return [(uid, sec["entries"][uid]) for _, uid in sec["order"].head(limit)]
+
+
+@metrics.timed("leaderboard_render_seconds")
+def leaderboard_text(section):
+    """Rendered top-10 for a section, cached until the top 10 changes."""
+    with _index_lock:
+        sec = _index.get(section)
+        if not sec or not sec["entries"]:
+            return "No scores yet."
+        if sec["text"] is not None:
+            return sec["text"]
+    text = f"*Leaderboard for {section.capitalize()} Section:*\n\n"
+    for i, (user_id, (points, username)) in enumerate(top_entries(section), 1):
+        text += f"{i}. {username}: {points} points\n"
+    with _index_lock:
+        if _index.get(section) is sec:
+            sec["text"] = text
+    return text
@@ -0,0 +1,176 @@
+# ledger.py
+#
+# Coin ledger. Every change to a user's coins is an append-only row in
+# coin_ledger carrying an idempotency key (the Paystack reference for a coin
+# purchase, the hint usage id for a hint, ...), and coin_balances holds the
+# materialised balance. A debit is one conditional UPDATE
+# ("... WHERE balance >= amount") inside a short IMMEDIATE transaction, so
+# concurrent taps or gunicorn workers can neither overdraw nor apply the same
+# key twice.
+#
+# The first time a user touches the ledger their pre-ledger "coins" value from
+# the user record is booked as an "opening" entry, so SUM(delta) per user
+# always equals the materialised balance.
+
+import sqlite3
+import sys
+import uuid
+
+import database
+import user_store
+
+
+def new_key(prefix):
+    """Make a one-off idempotency key for callers that have no natural one."""
+    return f"{prefix}:{uuid.uuid4().hex}"
+
+
+def _ensure_account(conn, user_id):
+    """Create the balance row from the user record. Returns False for unknown users."""
+    if conn.execute("SELECT 1 FROM coin_balances WHERE user_id=?", (user_id,)).fetchone():
+        return True
+    user = user_store.get_user(user_id)
+    if not user:
+        return False
+    opening = int(user.get("coins") or 0)
+    with conn:
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO coin_balances (user_id, balance) VALUES (?, ?)", (user_id, opening)
+        )
+        if cur.rowcount:
+            conn.execute(
+                "INSERT OR IGNORE INTO coin_ledger (user_id, delta, reason, idem_key) VALUES (?, ?, 'opening', ?)",
+                (user_id, opening, f"opening:{user_id}"),
+            )
+    return True
+
+
+def get_balance(user_id):
+    user_id = int(user_id)
+    conn = database.get_connection()
+    row = conn.execute("SELECT balance FROM coin_balances WHERE user_id=?", (user_id,)).fetchone()
+    if row:
+        return row[0]
+    if not _ensure_account(conn, user_id):
+        return 0
+    return conn.execute("SELECT balance FROM coin_balances WHERE user_id=?", (user_id,)).fetchone()[0]
+
+
+def apply_entry(user_id, delta, key, reason):
+    """Apply one entry. Returns "applied", "duplicate", "insufficient" or "no_user"."""
+    user_id = int(user_id)
+    conn = database.get_connection()
+    if not _ensure_account(conn, user_id):
+        return "no_user"
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = apply_in_transaction(conn, user_id, delta, key, reason)
+        if result == "applied":
+            conn.commit()
+        else:
+            conn.rollback()
+        return result
+    except sqlite3.IntegrityError:
+        # Another process committed the same key between our check and insert.
+        conn.rollback()
+        return "duplicate"
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def apply_in_transaction(conn, user_id, delta, key, reason):
+    """The statements of one entry, for callers that batch several entries
+    into their own IMMEDIATE transaction (see referrals.apply_pending). The
+    account must already exist (ensure_account). Leaves commit/rollback to
+    the caller; returns "applied", "duplicate" or "insufficient"."""
+    if conn.execute("SELECT 1 FROM coin_ledger WHERE idem_key=?", (key,)).fetchone():
+        return "duplicate"
+    cur = conn.execute(
+        "UPDATE coin_balances SET balance = balance + ? WHERE user_id=? AND balance + ? >= 0",
+        (delta, user_id, delta),
+    )
+    if cur.rowcount == 0:
+        return "insufficient"
+    conn.execute(
+        "INSERT INTO coin_ledger (user_id, delta, reason, idem_key) VALUES (?, ?, ?, ?)",
+        (user_id, delta, reason, key),
+    )
+    return "applied"
+
+
+def ensure_account(user_id):
+    """Open the user's ledger account if needed. False for unknown users."""
+    return _ensure_account(database.get_connection(), int(user_id))
+
+
+def credit(user_id, amount, key, reason="credit"):
+    """Add coins. True if the credit is in the ledger (now or from an earlier call with the same key)."""
+    if amount <= 0:
+        return False
+    return apply_entry(user_id, amount, key, reason) in ("applied", "duplicate")
+
+
+def debit(user_id, amount, key, reason="debit"):
+    """Take coins if the balance covers them. Repeating a key never charges twice."""
+    if amount <= 0:
+        return False
+    return apply_entry(user_id, -amount, key, reason) in ("applied", "duplicate")
+
+
+def history(user_id, limit=50):
+    return database.get_connection().execute(
+        "SELECT delta, reason, idem_key, created_at FROM coin_ledger WHERE user_id=? ORDER BY id DESC LIMIT ?",
+        (int(user_id), limit),
+    ).fetchall()
+
+
+def fold_balances(older_than_days=30):
+    """Compact old entries and audit balances.
+
+    Entries older than the cutoff are replaced by a single "fold" entry per
+    user carrying their sum, which keeps the ledger (and the idempotency-key
+    index) bounded. Keys older than the cutoff stop being deduplicated here;
+    Paystack references are still deduplicated by the payments table.
+
+    Returns the user_ids whose materialised balance does not match the sum of
+    their entries (expected to be empty).
+    """
+    conn = database.get_connection()
+    cutoff = f"-{int(older_than_days)} days"
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(
+            """SELECT user_id, SUM(delta), MAX(id) FROM coin_ledger
+               WHERE created_at < datetime('now', ?) GROUP BY user_id HAVING COUNT(*) > 1""",
+            (cutoff,),
+        ).fetchall()
+        for user_id, total, max_id in rows:
+            conn.execute("DELETE FROM coin_ledger WHERE user_id=? AND id <= ?", (user_id, max_id))
+            conn.execute(
+                "INSERT INTO coin_ledger (user_id, delta, reason, idem_key, created_at) "
+                "VALUES (?, ?, 'fold', ?, datetime('now', ?))",
+                (user_id, total, f"fold:{user_id}:{max_id}", cutoff),
+            )
+        mismatched = [
+            row[0] for row in conn.execute(
+                """SELECT b.user_id FROM coin_balances b
+                   LEFT JOIN (SELECT user_id, SUM(delta) AS total FROM coin_ledger GROUP BY user_id) l
+                   ON l.user_id = b.user_id
+                   WHERE b.balance != COALESCE(l.total, 0)"""
+            )
+        ]
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return mismatched
+
+
+if __name__ == "__main__":
+    # python ledger.py fold [DAYS]
+    if len(sys.argv) < 2 or sys.argv[1] != "fold":
+        print("usage: python ledger.py fold [DAYS]")
+        sys.exit(1)
+    bad = fold_balances(int(sys.argv[2]) if len(sys.argv) > 2 else 30)
+    print("Ledger folded; balance mismatches:", bad or "none")
@@ -0,0 +1,286 @@
+# metrics.py
+#
+# In-process counters and latency histograms, rendered in the Prometheus
+# text format by the /metrics route. Recording is a dict lookup, a bisect
+# over the bucket bounds and a few additions under a per-metric lock, so it
+# is cheap enough to leave on every handler and I/O call:
+#
+#   @metrics.timed("json_io_seconds", op="load")
+#   def load_json(...): ...
+#
+#   with metrics.timed("telegram_update_seconds", handler="start"):
+#       ...
+#
+# Metrics are per process; with several gunicorn workers each one reports
+# its own numbers (scrape them per worker or sum them in Prometheus).
+#
+# There is also a sampling profiler (start_profiler/stop_profiler) that can be
+# switched on at runtime: a daemon thread snapshots every thread's stack at
+# a fixed interval and counts the frames, so a hot spot shows up without
+# restarting the worker under cProfile.
+
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter as _FrameCounter
+from functools import wraps
+
+# Seconds. Telegram expects the webhook to answer quickly, so most of the
+# resolution is below 100 ms.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.005"))  # seconds between samples
+PROFILER_MAX_DEPTH = 30
+
+_registry = {}  # name -> Counter | Histogram
+_gauges = {}  # name -> (help, callable returning {labels tuple: value})
+_registry_lock = threading.Lock()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help="", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.values = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, seconds, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            row = self.values.get(key)
+            if row is None:
+                row = self.values[key] = [0] * (len(self.buckets) + 2)
+            row[index] += 1
+            row[-1] += seconds
+
+    def render(self):
+        with self.lock:
+            items = sorted((key, list(row)) for key, row in self.values.items())
+        lines = []
+        for key, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            cumulative += row[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {row[-1]:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+def _get(cls, name, help):
+    metric = _registry.get(name)
+    if metric is None:
+        with _registry_lock:
+            metric = _registry.get(name)
+            if metric is None:
+                metric = _registry[name] = cls(name, help)
+    return metric
+
+
+def counter(name, help=""):
+    return _get(Counter, name, help)
+
+
+def histogram(name, help=""):
+    return _get(Histogram, name, help)
+
+
+def inc(name, amount=1, **labels):
+    counter(name).inc(amount, **labels)
+
+
+def observe(name, seconds, **labels):
+    histogram(name).observe(seconds, **labels)
+
+
+def gauge(name, fn, help=""):
+    """Register a gauge read at scrape time. fn() returns a number or a
+    {labels dict as tuple of pairs: value} mapping."""
+    _gauges[name] = (help, fn)
+
+
+class timed:
+    """Record the duration of a block or function call in a histogram.
+
+    Exceptions are still timed and also counted in `<name>_errors_total`.
+    """
+
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        histogram(self.name).observe(time.perf_counter() - self.started, **self.labels)
+        if exc_type is not None:
+            counter(self.name + "_errors_total").inc(**self.labels)
+        return False
+
+    def __call__(self, func):
+        name, labels = self.name, self.labels
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(name, **labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for name in sorted(_registry):
+        metric = _registry[name]
+        if metric.help:
+            lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        lines.extend(metric.render())
+    for name in sorted(_gauges):
+        help, fn = _gauges[name]
+        try:
+            value = fn()
+        except Exception:
+            continue
+        if help:
+            lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        if isinstance(value, dict):
+            for key, v in sorted(value.items()):
+                lines.append(f"{name}{_format_labels(key)} {v}")
+        else:
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Forget all recorded values (used by benchmarks between runs)."""
+    with _registry_lock:
+        _registry.clear()
+
+
+# --------------------
+# Sampling profiler
+# --------------------
+
+_profiler_thread = None
+_profiler_stop = threading.Event()
+_profile = _FrameCounter()  # collapsed stack "a;b;c" -> samples
+_profile_lock = threading.Lock()
+_profile_samples = 0
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _sample_loop(interval):
+    global _profile_samples
+    me = threading.get_ident()
+    while not _profiler_stop.wait(interval):
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            names = []
+            while frame is not None and len(names) < PROFILER_MAX_DEPTH:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            stacks.append(";".join(reversed(names)))
+        with _profile_lock:
+            _profile.update(stacks)
+            _profile_samples += 1
+
+
+def start_profiler(interval=None):
+    """Start sampling (no-op if already running). Previous samples are cleared."""
+    global _profiler_thread, _profile_samples
+    if profiler_running():
+        return False
+    with _profile_lock:
+        _profile.clear()
+        _profile_samples = 0
+    _profiler_stop.clear()
+    _profiler_thread = threading.Thread(
+        target=_sample_loop, args=(interval or PROFILER_INTERVAL,), name="metrics-profiler", daemon=True
+    )
+    _profiler_thread.start()
+    return True
+
+
+def stop_profiler():
+    global _profiler_thread
+    if not profiler_running():
+        return False
+    _profiler_stop.set()
+    _profiler_thread.join()
+    _profiler_thread = None
+    return True
+
+
+def profiler_running():
+    return _profiler_thread is not None and _profiler_thread.is_alive()
+
+
+def profile_report(limit=50):
+    """Collapsed stacks ("a;b;c count" per line, flamegraph.pl input) and
+    the functions seen most often at the top of a stack."""
+    with _profile_lock:
+        stacks = _profile.most_common()
+        samples = _profile_samples
+    leaves = _FrameCounter()
+    for stack, count in stacks:
+        leaves[stack.rsplit(";", 1)[-1]] += count
+    return {
+        "running": profiler_running(),
+        "samples": samples,
+        "top_functions": leaves.most_common(limit),
+        "collapsed": "\n".join(f"{stack} {count}" for stack, count in stacks[:limit * 10]),
+    }
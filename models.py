@@ -0,0 +1,293 @@
+# models.py
+#
+# Compact in-memory form of a user record. A handle_start user is a dict of
+# 20+ keys plus a nested daily_scores dict; kept resident for every player
+# that costs several KB each. UserRecord stores the same data in __slots__:
+# booleans packed into one flags int, the section as a small int, the daily
+# scores as four plain ints, last_active_day as a date ordinal and answered
+# riddles as a Progress bitmap instead of a nested dict. Assigning
+# a misspelt attribute raises instead of silently adding a key.
+#
+# from_dict()/to_dict() convert to and from the users.json format. The only
+# change on disk is that a legacy "answered" dict is written back as the
+# compact "progress" form.
+
+import copy
+from datetime import date
+from enum import IntEnum
+
+from config import POINTS_CORRECT_ANSWER, POINTS_HINT_PENALTY
+
+
+class Section(IntEnum):
+    NONE = 0
+    FREE = 1
+    VIP = 2
+    PREMIUM = 3
+    SATURDAY = 4
+
+    @classmethod
+    def parse(cls, name):
+        return _SECTION_BY_NAME.get(name, cls.NONE)
+
+    @property
+    def label(self):
+        return None if self is Section.NONE else self.name.lower()
+
+
+_SECTION_BY_NAME = {s.name.lower(): s for s in Section if s is not Section.NONE}
+
+DAILY_SECTIONS = ("free", "vip", "premium", "saturday")
+
+# Boolean fields, stored as bits of UserRecord.flags.
+FLAG_FIELDS = (
+    "has_paid_entry",
+    "waiting_for_answer",
+    "using_hint_for_current",
+    "unlocked_all",
+    "is_vip",
+    "is_premium",
+)
+_FLAG_BITS = {name: 1 << i for i, name in enumerate(FLAG_FIELDS)}
+
+# Integer fields that default to 0.
+INT_FIELDS = (
+    "coins",
+    "hints",
+    "daily_riddles_done",
+    "streak",
+    "streak_day",
+    "current_riddle_index",
+    "coins_spent_today",
+    "hints_used_today",
+    "answered_riddles_count",
+)
+
+# Optional fields written back only when set, so records that never had
+# them (e.g. new users without phone/bank) round-trip unchanged.
+OPTIONAL_FIELDS = ("chat_id", "referred_by", "payment_reference", "phone", "bank")
+
+_KNOWN_KEYS = (
+    {"id", "username", "section", "last_active_day", "daily_scores", "referrals", "answered", "progress"}
+    | set(FLAG_FIELDS) | set(INT_FIELDS) | set(OPTIONAL_FIELDS)
+)
+
+
+def _day_to_ordinal(day):
+    if not day:
+        return 0
+    try:
+        return date.fromisoformat(day).toordinal()
+    except ValueError:
+        return 0
+
+
+class Progress:
+    """A user's riddle progress as two bitmaps and a running total.
+
+    Bit n of `answered` is set once riddle id n is answered correctly, and
+    bit n of `hinted` if a hint was used on it. Every answer scores
+    POINTS_CORRECT_ANSWER minus POINTS_HINT_PENALTY with a hint, so the
+    score over any set of riddles (e.g. the Saturday ones) is two popcounts
+    against a mask. `total` is kept alongside so the overall score is free.
+
+    Stored in users.json / SQLite as {"a": hex, "h": hex, "s": total}.
+    """
+
+    __slots__ = ("answered", "hinted", "total")
+
+    def __init__(self, answered=0, hinted=0, total=0):
+        self.answered = answered
+        self.hinted = hinted
+        self.total = total
+
+    def has_answered(self, riddle_id):
+        return bool(self.answered >> int(riddle_id) & 1)
+
+    def record(self, riddle_id, used_hint=False):
+        """Record a correct answer; returns the points it earned (0 if already answered)."""
+        bit = 1 << int(riddle_id)
+        if self.answered & bit:
+            return 0
+        self.answered |= bit
+        points = POINTS_CORRECT_ANSWER
+        if used_hint:
+            self.hinted |= bit
+            points -= POINTS_HINT_PENALTY
+        self.total += points
+        return points
+
+    def score(self, mask=None):
+        """Points earned on the riddles in `mask` (see riddle_mask), or overall."""
+        if mask is None:
+            return self.total
+        answered = self.answered & mask
+        return (answered.bit_count() * POINTS_CORRECT_ANSWER
+                - (answered & self.hinted).bit_count() * POINTS_HINT_PENALTY)
+
+    def count(self):
+        return self.answered.bit_count()
+
+    def to_json(self):
+        return {"a": format(self.answered, "x"), "h": format(self.hinted, "x"), "s": self.total}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(int(data.get("a") or "0", 16), int(data.get("h") or "0", 16), data.get("s", 0))
+
+    @classmethod
+    def from_answered(cls, answered):
+        """Convert the legacy {"<riddle id>": {"score": n, ...}} dict."""
+        progress = cls()
+        hinted_score = POINTS_CORRECT_ANSWER - POINTS_HINT_PENALTY
+        for riddle_id, ans_data in (answered or {}).items():
+            try:
+                bit = 1 << int(riddle_id)
+            except ValueError:
+                continue
+            score = ans_data.get("score", 0)
+            progress.answered |= bit
+            if ans_data.get("used_hint") or ans_data.get("hint") or score == hinted_score:
+                progress.hinted |= bit
+            progress.total += score
+        return progress
+
+    def to_answered(self):
+        """The legacy dict form, for code that still wants it."""
+        answered = {}
+        bits, riddle_id = self.answered, 0
+        while bits:
+            if bits & 1:
+                hinted = bool(self.hinted >> riddle_id & 1)
+                answered[str(riddle_id)] = {
+                    "score": POINTS_CORRECT_ANSWER - (POINTS_HINT_PENALTY if hinted else 0),
+                    "used_hint": hinted,
+                }
+            bits >>= 1
+            riddle_id += 1
+        return answered
+
+
+def riddle_mask(riddle_ids):
+    mask = 0
+    for riddle_id in riddle_ids:
+        mask |= 1 << int(riddle_id)
+    return mask
+
+
+def progress_of(user):
+    """Progress for a user dict in either the new ("progress") or legacy ("answered") form."""
+    data = user.get("progress")
+    if data:
+        return Progress.from_json(data)
+    return Progress.from_answered(user.get("answered"))
+
+
+class UserRecord:
+    __slots__ = (
+        "id", "username", "section", "flags", "last_active_ordinal",
+        "daily_free", "daily_vip", "daily_premium", "daily_saturday",
+        "referrals", "progress", "extra",
+    ) + INT_FIELDS + OPTIONAL_FIELDS
+
+    def __init__(self, user_id, username=""):
+        self.id = user_id
+        self.username = username
+        self.section = Section.NONE
+        self.flags = 0
+        self.last_active_ordinal = 0
+        self.daily_free = self.daily_vip = self.daily_premium = self.daily_saturday = 0
+        self.referrals = ()
+        self.progress = None
+        self.extra = None
+        for name in INT_FIELDS:
+            setattr(self, name, 0)
+        for name in OPTIONAL_FIELDS:
+            setattr(self, name, None)
+
+    def get_flag(self, name):
+        return bool(self.flags & _FLAG_BITS[name])
+
+    def set_flag(self, name, value):
+        bit = _FLAG_BITS[name]
+        self.flags = (self.flags | bit) if value else (self.flags & ~bit)
+
+    @property
+    def last_active_day(self):
+        return date.fromordinal(self.last_active_ordinal).isoformat() if self.last_active_ordinal else None
+
+    @classmethod
+    def from_dict(cls, data, user_id=None):
+        rec = cls(data.get("id", user_id), data.get("username") or "")
+        rec.section = Section.parse(data.get("section"))
+        flags = 0
+        for name, bit in _FLAG_BITS.items():
+            if data.get(name):
+                flags |= bit
+        rec.flags = flags
+        rec.last_active_ordinal = _day_to_ordinal(data.get("last_active_day"))
+        daily = data.get("daily_scores") or {}
+        rec.daily_free = daily.get("free", 0)
+        rec.daily_vip = daily.get("vip", 0)
+        rec.daily_premium = daily.get("premium", 0)
+        rec.daily_saturday = daily.get("saturday", 0)
+        rec.referrals = tuple(data.get("referrals") or ())
+        if data.get("progress") or data.get("answered"):
+            rec.progress = progress_of(data)
+        for name in INT_FIELDS:
+            value = data.get(name)
+            if value:
+                setattr(rec, name, value)
+        for name in OPTIONAL_FIELDS:
+            value = data.get(name)
+            if value is not None:
+                setattr(rec, name, value)
+        extra = {k: v for k, v in data.items() if k not in _KNOWN_KEYS}
+        rec.extra = copy.deepcopy(extra) if extra else None
+        return rec
+
+    def to_dict(self):
+        # Flag bits follow FLAG_FIELDS order; spelled out here because this
+        # runs on every read from the JSON-backed user store.
+        flags = self.flags
+        data = {
+            "id": self.id,
+            "username": self.username,
+            "coins": self.coins,
+            "hints": self.hints,
+            "section": self.section.label,
+            "daily_riddles_done": self.daily_riddles_done,
+            "last_active_day": self.last_active_day,
+            "daily_scores": {
+                "free": self.daily_free,
+                "vip": self.daily_vip,
+                "premium": self.daily_premium,
+                "saturday": self.daily_saturday,
+            },
+            "streak": self.streak,
+            "streak_day": self.streak_day,
+            "referrals": list(self.referrals),
+            "referred_by": self.referred_by,
+            "has_paid_entry": bool(flags & 1),
+            "payment_reference": self.payment_reference,
+            "waiting_for_answer": bool(flags & 2),
+            "current_riddle_index": self.current_riddle_index,
+            "using_hint_for_current": bool(flags & 4),
+            "coins_spent_today": self.coins_spent_today,
+            "hints_used_today": self.hints_used_today,
+            "unlocked_all": bool(flags & 8),
+            "answered_riddles_count": self.answered_riddles_count,
+        }
+        if flags & 16:
+            data["is_vip"] = True
+        if flags & 32:
+            data["is_premium"] = True
+        for name in ("chat_id", "phone", "bank"):
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        if self.progress is not None:
+            data["progress"] = self.progress.to_json()
+        if self.extra:
+            data.update(copy.deepcopy(self.extra))
+        return data
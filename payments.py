@@ -0,0 +1,205 @@
+# payments.py
+#
+# Paystack payment ingestion. The webhook verifies the signature once,
+# records the event in the payments table keyed by its reference (a
+# redelivered event is a no-op there) and returns; fulfilment happens on a
+# background thread:
+#
+#   received -> fulfilling -> fulfilled     (or "unmatched" if we can't tell
+#                                            what the payment was for)
+#
+# Moving a payment to "fulfilling" is a conditional UPDATE, so only one
+# thread or gunicorn worker ever fulfils a given reference, and coin credits
+# go through the ledger with the reference as idempotency key, so even a
+# fulfilment retried after a crash cannot credit twice.
+#
+# A fulfilment that raises goes back to "received" and is queued again
+# after a backoff (RETRY_BASE_DELAY, doubling up to RETRY_MAX_DELAY), so a
+# database hiccup delays a payment rather than parking it until the next
+# restart. Fulfilment changes only the user fields it sets
+# (user_store.update_user), never the whole record.
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+
+import daily
+import database
+import ledger
+import referrals
+import user_store
+from config import COIN_PACKS, ENTRY_FEES, PAYSTACK_WEBHOOK_SECRET, UNLOCK_ALL_FEES
+
+logger = logging.getLogger(__name__)
+
+STALE_FULFILLING_SECONDS = 300  # a claim older than this is assumed to have crashed
+RETRY_BASE_DELAY = float(os.getenv("PAYMENT_RETRY_BASE_DELAY", "5"))  # seconds
+RETRY_MAX_DELAY = float(os.getenv("PAYMENT_RETRY_MAX_DELAY", "600"))
+
+_queue = queue.Queue()
+_attempts = {}  # reference -> failed fulfilments so far
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def verify_signature(body, signature, secret=None):
+    """Check Paystack's x-paystack-signature (HMAC-SHA512 of the raw body)."""
+    secret = secret or PAYSTACK_WEBHOOK_SECRET
+    if not secret or not signature:
+        return False
+    computed = hmac.new(secret.encode("utf-8"), body, hashlib.sha512).hexdigest()
+    return hmac.compare_digest(computed, signature)
+
+
+def _metadata(data):
+    metadata = data.get("metadata") or {}
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata)
+        except ValueError:
+            metadata = {}
+    return metadata if isinstance(metadata, dict) else {}
+
+
+def _infer_purpose(metadata, amount_naira):
+    """What a payment buys. Prefer the metadata we set when creating the link;
+    fall back to entry fees, whose amounts are unambiguous."""
+    purpose = metadata.get("purpose")
+    if purpose:
+        return purpose
+    for section, fee in ENTRY_FEES.items():
+        if fee and fee == amount_naira:
+            metadata.setdefault("section", section)
+            return "entry"
+    return None
+
+
+def ingest(event):
+    """Accept a verified webhook event. Returns "queued", "duplicate" or "ignored"."""
+    if event.get("event") != "charge.success":
+        return "ignored"
+    data = event.get("data") or {}
+    reference = data.get("reference")
+    if not reference:
+        return "ignored"
+    metadata = _metadata(data)
+    amount_kobo = int(data.get("amount") or 0)
+    purpose = _infer_purpose(metadata, amount_kobo / 100)
+    user_id = metadata.get("user_id")
+    is_new = database.add_payment(reference, user_id, amount_kobo, "received", purpose, metadata)
+    if not is_new:
+        return "duplicate"
+    _submit(reference)
+    return "queued"
+
+
+def _submit(reference):
+    global _worker
+    _queue.put(reference)
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = threading.Thread(target=_run, name="payment-fulfilment", daemon=True)
+                _worker.start()
+
+
+def requeue_pending():
+    """Queue payments that were received but never fulfilled (e.g. after a restart)."""
+    references = database.payments_with_status("received")
+    references += database.payments_with_status("fulfilling", STALE_FULFILLING_SECONDS)
+    for reference in references:
+        database.set_payment_status(reference, "received")
+        _submit(reference)
+    return len(references)
+
+
+def _run():
+    while True:
+        reference = _queue.get()
+        try:
+            fulfil(reference)
+            _attempts.pop(reference, None)
+        except Exception:
+            _retry_later(reference)
+        finally:
+            _queue.task_done()
+
+
+def _retry_later(reference):
+    attempts = _attempts[reference] = _attempts.get(reference, 0) + 1
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1))
+    logger.exception("Fulfilling payment %s failed (attempt %d); retrying in %.0f s", reference, attempts, delay)
+    try:
+        database.set_payment_status(reference, "received", expected="fulfilling")
+    except Exception:
+        # Still "fulfilling": requeue_pending picks it up once the claim is stale.
+        logger.exception("Could not release payment %s", reference)
+        return
+    timer = threading.Timer(delay, _submit, (reference,))
+    timer.daemon = True
+    timer.start()
+
+
+def fulfil(reference):
+    """Apply a received payment to the user. Returns the final status."""
+    if not database.set_payment_status(reference, "fulfilling", expected="received"):
+        return None  # already fulfilled, or another worker has it
+    payment = database.get_payment(reference)
+    metadata = payment["metadata"]
+    user_id = payment["user_id"]
+    amount_naira = (payment["amount"] or 0) / 100
+    user = user_store.get_user(user_id) if user_id is not None else None
+
+    status = "unmatched"
+    if user is None:
+        logger.warning("Payment %s has no known user (metadata=%s)", reference, metadata)
+    elif payment["purpose"] == "entry":
+        section = metadata.get("section")
+        if section in ENTRY_FEES and amount_naira >= ENTRY_FEES[section]:
+            user_store.update_user(user_id, {
+                "has_paid_entry": True,
+                "section": section,
+                "payment_reference": reference,
+                "is_vip": section == "vip" or bool(user.get("is_vip")),
+                "is_premium": section == "premium" or bool(user.get("is_premium")),
+            })
+            status = "fulfilled"
+    elif payment["purpose"] == "coins":
+        coins = int(metadata.get("coins") or 0)
+        if coins in COIN_PACKS and amount_naira >= COIN_PACKS[coins]:
+            ledger.credit(user_id, coins, f"paystack:{reference}", "purchase")
+            referrals.queue_reward(user_id, f"paystack:{reference}")
+            status = "fulfilled"
+    elif payment["purpose"] == "unlock_all":
+        section = metadata.get("section") or user.get("section")
+        if section in UNLOCK_ALL_FEES and amount_naira >= UNLOCK_ALL_FEES[section]:
+            updated = dict(user)
+            daily.set_daily(updated, "unlocked_all", True)  # may also roll the day over
+            user_store.update_user(user_id, {k: v for k, v in updated.items() if user.get(k) != v})
+            status = "fulfilled"
+
+    if status != "fulfilled":
+        logger.warning("Payment %s (%s, ₦%s) did not match anything it could buy",
+                       reference, payment["purpose"], amount_naira)
+    database.set_payment_status(reference, status)
+    return status
+
+
+def drain():
+    """Block until queued fulfilments are done (used by jobs and benchmarks)."""
+    _queue.join()
+
+
+if __name__ == "__main__":
+    # python payments.py requeue   (fulfil anything left over from a crash)
+    if len(sys.argv) < 2 or sys.argv[1] != "requeue":
+        print("usage: python payments.py requeue")
+        sys.exit(1)
+    count = requeue_pending()
+    drain()
+    print(f"Re-queued and processed {count} payments")
@@ -0,0 +1,130 @@
+# payouts.py
+#
+# Weekly prize payout export. Players are ranked by the points they earned
+# in the payout window, replayed from the event log (eventlog.py): the days
+# after the previous payout up to today, or the last 7 days for the first
+# one. All-time scores would hand the prize to the same veterans every week.
+# Window totals are streamed per player from eventlog.window_totals (grouped
+# on disk, not in a dict), only players who scored are looked up, and for
+# each paid section only the current top-K are kept in a bounded min-heap. Ranks are mapped
+# onto the PRIZES tiers (including the "4-10" airtime band) and written to
+# winners.csv row by row; the file is fsynced and swapped into place when
+# complete, and only then is the window recorded as paid (payouts.json).
+# Exporting again on the same day re-exports the same window.
+#
+#   python payouts.py [OUTPUT_CSV] [LAST_DAY]    (default: winners.csv, today)
+
+import csv
+import heapq
+import os
+import sys
+from datetime import date, timedelta
+
+import daily
+import eventlog
+import filestore
+import user_store
+from config import DATA_DIR, PRIZES
+
+STATE_FILE = os.path.join(DATA_DIR, "payouts.json")
+FIRST_WINDOW_DAYS = 7
+
+CSV_COLUMNS = ["username", "telegram_id", "phone", "bank", "total_score", "paid", "section", "rank", "prize"]
+
+
+def prize_tiers(section):
+    """[(first_rank, last_rank, amount)] for a section's cash/airtime prizes."""
+    tiers = []
+    for ranks, amount in PRIZES.get(section, {}).items():
+        if not isinstance(amount, int) or isinstance(amount, bool):
+            continue  # e.g. "no_cash_prize"
+        first, _, last = ranks.partition("-")
+        tiers.append((int(first), int(last or first), amount))
+    return sorted(tiers)
+
+
+def prize_for_rank(section, rank):
+    for first, last, amount in prize_tiers(section):
+        if first <= rank <= last:
+            return amount
+    return None
+
+
+def paid_sections():
+    return [section for section in PRIZES if prize_tiers(section)]
+
+
+def payout_window(last_day=None):
+    """(first_day, last_day) of the payout ending on last_day (default today)."""
+    last_day = last_day or daily.today_key()
+    previous = filestore.read_json(STATE_FILE)
+    if previous.get("last_day") == last_day:
+        return previous["first_day"], last_day  # the same payout, exported again
+    if previous.get("last_day") and previous["last_day"] < last_day:
+        first_day = date.fromisoformat(previous["last_day"]) + timedelta(days=1)
+    else:
+        first_day = date.fromisoformat(last_day) - timedelta(days=FIRST_WINDOW_DAYS - 1)
+    return first_day.isoformat(), last_day
+
+
+def top_players(sections=None, window=None):
+    """{section: [(points, user_id, user), ...]} best first, by the points
+    each paid-up player earned in that section during the window."""
+    sections = sections or paid_sections()
+    first_day, last_day = window or payout_window()
+    limits = {s: max(last for _, last, _ in prize_tiers(s)) for s in sections}
+    heaps = {s: [] for s in sections}
+    for section, user_id, points in eventlog.window_totals(first_day, last_day):
+        heap = heaps.get(section)
+        if heap is None or points <= 0:
+            continue
+        # Ties go to the older account (lower user id).
+        key = (points, -int(user_id))
+        if len(heap) >= limits[section] and key <= heap[0][:2]:
+            continue
+        user = user_store.get_user(user_id)
+        if not user or not user.get("has_paid_entry"):
+            continue
+        item = (*key, {k: user.get(k) for k in ("username", "phone", "bank")})
+        if len(heap) < limits[section]:
+            heapq.heappush(heap, item)
+        else:
+            heapq.heapreplace(heap, item)
+    return {
+        section: [(points, -neg_id, user) for points, neg_id, user in sorted(heap, key=lambda e: e[:2], reverse=True)]
+        for section, heap in heaps.items()
+    }
+
+
+def export_winners(path="winners.csv", sections=None, last_day=None):
+    """Write the winners file for the payout window ending on last_day and
+    record the window as paid. Returns the number of winners written."""
+    window = payout_window(last_day)
+    winners = top_players(sections, window)
+    written = 0
+    with filestore.atomic_write(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for section, ranked in winners.items():
+            for rank, (score, user_id, user) in enumerate(ranked, 1):
+                writer.writerow([
+                    user.get("username") or "",
+                    user_id,
+                    user.get("phone") or "",
+                    user.get("bank") or "",
+                    score,
+                    "no",
+                    section,
+                    rank,
+                    prize_for_rank(section, rank) or "",
+                ])
+                written += 1
+    filestore.write_json(STATE_FILE, {"first_day": window[0], "last_day": window[1]})
+    return written
+
+
+if __name__ == "__main__":
+    output = sys.argv[1] if len(sys.argv) > 1 else "winners.csv"
+    first, last = payout_window(sys.argv[2] if len(sys.argv) > 2 else None)
+    count = export_winners(output, last_day=last)
+    print(f"Wrote {count} winners for {first} to {last} to {output}")
@@ -1,47 +1,199 @@
+import logging
 import os
-import requests
-import hmac
-import hashlib
+import random
+import threading
+import time
+from collections import OrderedDict
 
-PAYSTACK_SECRET_KEY = os.getenv("PAYSTACK_SECRET_KEY")
-if not PAYSTACK_SECRET_KEY:
-    raise ValueError("PAYSTACK_SECRET_KEY environment variable not set")
+import metrics
+import payments
+from config import PAYSTACK_SECRET_KEY
 
-BASE_URL = "https://api.paystack.co"
+logger = logging.getLogger(__name__)
+
+BASE_URL = os.getenv("PAYSTACK_BASE_URL", "https://api.paystack.co")
 HEADERS = {
     "Authorization": f"Bearer {PAYSTACK_SECRET_KEY}",
     "Content-Type": "application/json",
 }
 
-def initialize_payment(email: str, amount_kobo: int, metadata: dict) -> dict | None:
+REQUEST_TIMEOUT = (3.05, 10)  # connect, read
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.25  # seconds; attempt n sleeps up to BACKOFF_BASE * 2**n
+BREAKER_THRESHOLD = 5  # consecutive failures that open the circuit
+BREAKER_COOLDOWN = 30  # seconds before a trial request is let through
+# Only these are retried after a timeout or 5xx: a POST that timed out may
+# still have reached Paystack (a second /transaction/initialize would create
+# a second transaction), so a POST is retried only when it never got there
+# (connect timeout) or was turned away (429).
+IDEMPOTENT_METHODS = {"GET", "HEAD"}
+
+# Verification results by reference. Final states never change on Paystack's
+# side, so they are kept until evicted; anything else (pending, ongoing, ...)
+# is re-checked after PENDING_TTL so /checkpayment polling stays cheap.
+FINAL_STATUSES = {"success", "failed", "abandoned", "reversed"}
+PENDING_TTL = 10  # seconds
+VERIFY_CACHE_SIZE = 10000
+
+_session = None
+_session_lock = threading.Lock()
+
+_breaker_lock = threading.Lock()
+_consecutive_failures = 0
+_open_until = 0.0
+
+_cache_lock = threading.Lock()
+_verify_cache = OrderedDict()  # reference -> (expires_at or None, data)
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.headers.update(HEADERS)
+                session.mount("https://", HTTPAdapter(pool_maxsize=10))
+                session.mount("http://", HTTPAdapter(pool_maxsize=10))
+                _session = session
+    return _session
+
+
+def _breaker_state():
+    """"closed" (call away), "probe" (the one trial call after the cooldown)
+    or "open" (reject). While a probe is out the circuit stays open, so the
+    cooldown is pushed back by the probe's own allowance; a probe that never
+    reports (e.g. its thread died) just lets the next one through later."""
+    global _open_until
+    with _breaker_lock:
+        if _consecutive_failures < BREAKER_THRESHOLD:
+            return "closed"
+        now = time.monotonic()
+        if now < _open_until:
+            return "open"
+        _open_until = now + BREAKER_COOLDOWN
+        return "probe"
+
+
+def _record_result(ok):
+    global _consecutive_failures, _open_until
+    with _breaker_lock:
+        if ok:
+            _consecutive_failures = 0
+            _open_until = 0.0
+        else:
+            _consecutive_failures += 1
+            if _consecutive_failures >= BREAKER_THRESHOLD:
+                # Open (or re-open after a failed probe) the circuit.
+                _open_until = time.monotonic() + BREAKER_COOLDOWN
+
+
+def _request(method: str, path: str, **kwargs) -> dict | None:
+    """
+    Call the Paystack API with retries and the circuit breaker.
+    Returns:
+        Decoded JSON body, or None if Paystack is not configured or could not be reached
+    """
+    if not PAYSTACK_SECRET_KEY:
+        # Checked here rather than at import so workers start without it;
+        # config.validate() reports it at startup.
+        logger.error("PAYSTACK_SECRET_KEY is not set; cannot call %s", path)
+        return None
+    state = _breaker_state()
+    if state == "open":
+        metrics.inc("paystack_breaker_rejections_total")
+        return None
+    session = _get_session()
+    import requests  # already loaded by _get_session()
+
+    url = f"{BASE_URL}{path}"
+    endpoint = path.split("/")[2] if path.count("/") >= 2 else path  # drop the reference
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    retries = 0 if state == "probe" else MAX_RETRIES
+    for attempt in range(retries + 1):
+        try:
+            with metrics.timed("paystack_api_seconds", endpoint=endpoint):
+                resp = session.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
+            metrics.inc("paystack_api_responses_total", endpoint=endpoint, status=resp.status_code)
+            if resp.status_code < 500 and resp.status_code != 429:
+                _record_result(True)
+                return resp.json()
+            retryable = idempotent or resp.status_code == 429
+        except requests.ConnectTimeout:
+            retryable = True  # the request never left
+        except (requests.RequestException, ValueError):
+            retryable = idempotent
+        if not retryable:
+            break
+        if attempt < retries:
+            # Full jitter so a burst of callers does not retry in lockstep.
+            time.sleep(random.uniform(0, BACKOFF_BASE * 2 ** attempt))
+    _record_result(False)
+    return None
+
+
+def initialize_payment(email: str, amount_kobo: int, metadata: dict,
+                       reference: str | None = None, callback_url: str | None = None) -> dict | None:
     """
     Initialize a payment on Paystack.
     Args:
         email: Customer email
         amount_kobo: Amount in Kobo (1 Naira = 100 Kobo)
         metadata: Dictionary with extra info (e.g., user_id, chat_id)
+        reference: Optional reference to use instead of a Paystack-generated one
+        callback_url: Optional URL Paystack redirects to after payment
     Returns:
         dict with 'authorization_url' and 'reference' if success, else None
     """
-    url = f"{BASE_URL}/transaction/initialize"
     payload = {
         "email": email,
         "amount": amount_kobo,
         "metadata": metadata,
     }
-    try:
-        resp = requests.post(url, json=payload, headers=HEADERS, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        if data.get("status") and data["data"].get("authorization_url"):
-            return {
-                "authorization_url": data["data"]["authorization_url"],
-                "reference": data["data"]["reference"],
-            }
-    except requests.RequestException:
-        pass
+    if reference:
+        payload["reference"] = reference
+    if callback_url:
+        payload["callback_url"] = callback_url
+    data = _request("POST", "/transaction/initialize", json=payload)
+    if data and data.get("status") and (data.get("data") or {}).get("authorization_url"):
+        return {
+            "authorization_url": data["data"]["authorization_url"],
+            "reference": data["data"]["reference"],
+        }
     return None
 
+
+def get_transaction(reference: str) -> dict | None:
+    """
+    Look up a transaction by reference, using the verification cache.
+    Args:
+        reference: Paystack payment reference string
+    Returns:
+        Paystack's transaction data (with its 'status'), or None if unavailable
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _verify_cache.get(reference)
+        if cached and (cached[0] is None or cached[0] > now):
+            _verify_cache.move_to_end(reference)
+            return cached[1]
+
+    data = _request("GET", f"/transaction/verify/{reference}")
+    if not data or not data.get("status") or not data.get("data"):
+        return None
+    transaction = data["data"]
+    final = transaction.get("status") in FINAL_STATUSES
+    with _cache_lock:
+        _verify_cache[reference] = (None if final else now + PENDING_TTL, transaction)
+        _verify_cache.move_to_end(reference)
+        while len(_verify_cache) > VERIFY_CACHE_SIZE:
+            _verify_cache.popitem(last=False)
+    return transaction
+
+
 def verify_payment(reference: str) -> dict | None:
     """
     Verify a payment by reference.
@@ -50,17 +202,12 @@ def verify_payment(reference: str) -> dict | None:
     Returns:
         Payment data dict if verified and successful, else None
     """
-    url = f"{BASE_URL}/transaction/verify/{reference}"
-    try:
-        resp = requests.get(url, headers=HEADERS, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        if data.get("status") and data["data"]["status"] == "success":
-            return data["data"]
-    except requests.RequestException:
-        pass
+    transaction = get_transaction(reference)
+    if transaction and transaction.get("status") == "success":
+        return transaction
     return None
 
+
 def verify_webhook_signature(paystack_signature: str, payload_body: bytes) -> bool:
     """
     Verify webhook payload signature for security.
@@ -70,10 +217,4 @@ def verify_webhook_signature(paystack_signature: str, payload_body: bytes) -> bo
     Returns:
         True if signatures match, else False
     """
-    computed_signature = hmac.new(
-        PAYSTACK_SECRET_KEY.encode('utf-8'),
-        msg=payload_body,
-        digestmod=hashlib.sha512
-    ).hexdigest()
-    return hmac.compare_digest(computed_signature, paystack_signature)
-
+    return payments.verify_signature(payload_body, paystack_signature, PAYSTACK_SECRET_KEY)
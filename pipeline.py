@@ -0,0 +1,165 @@
+# pipeline.py
+#
+# Background processing for Telegram updates. The /webhook route only
+# validates an update, drops it if its update_id was already seen, and hands
+# it to submit(); a worker thread runs the real handler later and the route
+# acks Telegram immediately.
+#
+# Updates are sharded by user: each worker owns one bounded queue and a user
+# always maps to the same worker, so one user's updates run strictly in
+# order while different users are processed in parallel.
+#
+# update_id dedupe is per process. Telegram only redelivers when we fail to
+# ack, which the fast ack makes rare; the handlers themselves stay idempotent
+# where money is involved (ledger keys).
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("PIPELINE_WORKERS", "8"))
+QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "1000"))  # per worker
+SEEN_UPDATES = 10000  # how many recent update_ids to remember
+LATENCY_SAMPLES = 2048
+
+_lock = threading.Lock()
+_seen = OrderedDict()
+_queues = []
+_threads = []
+_handler = None
+
+_stats_lock = threading.Lock()
+_counters = {"received": 0, "duplicates": 0, "rejected": 0, "processed": 0, "errors": 0}
+_wait_ms = deque(maxlen=LATENCY_SAMPLES)  # time spent queued
+_run_ms = deque(maxlen=LATENCY_SAMPLES)  # time spent in the handler
+
+
+def _count(name):
+    with _stats_lock:
+        _counters[name] += 1
+
+
+def update_user_key(update):
+    """The id updates are ordered by: the sender, or the update itself."""
+    for kind in ("message", "edited_message", "callback_query"):
+        sender = (update.get(kind) or {}).get("from")
+        if sender and "id" in sender:
+            return sender["id"]
+    return update.get("update_id")
+
+
+def is_valid_update(update):
+    return (
+        isinstance(update, dict)
+        and isinstance(update.get("update_id"), int)
+        and any(k in update for k in ("message", "edited_message", "callback_query"))
+    )
+
+
+def start(handler, workers=None):
+    """Start the worker threads (once per process) with the update handler to run."""
+    global _handler
+    with _lock:
+        _handler = handler
+        if _threads:
+            return
+        for i in range(workers or WORKERS):
+            q = queue.Queue(maxsize=QUEUE_SIZE)
+            t = threading.Thread(target=_worker, args=(q,), name=f"update-worker-{i}", daemon=True)
+            _queues.append(q)
+            _threads.append(t)
+            t.start()
+
+
+def remember(update_id):
+    """Record an update_id; False if it was already seen."""
+    with _lock:
+        if update_id in _seen:
+            _seen.move_to_end(update_id)
+            return False
+        _seen[update_id] = None
+        if len(_seen) > SEEN_UPDATES:
+            _seen.popitem(last=False)
+        return True
+
+
+def forget(update_id):
+    with _lock:
+        _seen.pop(update_id, None)
+
+
+def claim(update):
+    """Count an incoming update and remember its update_id. False if it is a
+    redelivery of one already claimed (forget() releases a claim)."""
+    _count("received")
+    if not remember(update["update_id"]):
+        _count("duplicates")
+        return False
+    return True
+
+
+def submit(update, claimed=False):
+    """Queue an update. Returns "queued", "duplicate" or "full". Pass
+    claimed=True if the caller already claim()ed it."""
+    if not claimed and not claim(update):
+        return "duplicate"
+    shard = _queues[hash(update_user_key(update)) % len(_queues)]
+    try:
+        shard.put_nowait((time.monotonic(), update))
+    except queue.Full:
+        # Let Telegram redeliver it later rather than blocking the request.
+        forget(update["update_id"])
+        _count("rejected")
+        return "full"
+    return "queued"
+
+
+def _worker(q):
+    while True:
+        queued_at, update = q.get()
+        started = time.monotonic()
+        _wait_ms.append((started - queued_at) * 1000)
+        try:
+            _handler(update)
+            _count("processed")
+        except Exception:
+            _count("errors")
+            logger.exception("Failed to process update %s", update.get("update_id"))
+        finally:
+            _run_ms.append((time.monotonic() - started) * 1000)
+            q.task_done()
+
+
+def drain(timeout=10.0):
+    """Wait for all queued updates to finish. Returns True if the queues emptied."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(q.unfinished_tasks == 0 for q in _queues):
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def metrics():
+    depths = [q.qsize() for q in _queues]
+    wait, run = list(_wait_ms), list(_run_ms)
+    return {
+        **_counters,
+        "workers": len(_queues),
+        "queue_depth": sum(depths),
+        "max_shard_depth": max(depths, default=0),
+        "queue_wait_ms": {"p50": _percentile(wait, 0.5), "p99": _percentile(wait, 0.99)},
+        "processing_ms": {"p50": _percentile(run, 0.5), "p99": _percentile(run, 0.99)},
+    }
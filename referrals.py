@@ -0,0 +1,236 @@
+# referrals.py
+#
+# Refer-a-friend. Edges live in the referrals table (one row per referee, so
+# "who referred X" is a primary-key lookup and a user can only be referred
+# once) and referral_counts keeps each referrer's totals, so counts and the
+# top-referrer list never scan the users. Nothing here touches the user
+# records themselves.
+#
+# When a referee buys coins or a hint, queue_reward() records a pending
+# reward keyed by the event that earned it (so a retried event is queued
+# once). apply_pending() then reads and credits the pending rewards inside
+# one IMMEDIATE transaction: one ledger entry per referrer for the whole
+# batch, the counters updated and exactly those pending rows removed
+# together, so workers flushing at the same time never credit a row twice. It runs from a
+# background thread every FLUSH_INTERVAL seconds, when REWARD_BATCH rewards
+# are waiting, at exit, or via `python referrals.py flush`.
+
+import atexit
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import database
+import ledger
+import user_store
+from config import REFERRAL_REWARD
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = float(os.getenv("REFERRAL_FLUSH_INTERVAL", "30"))  # seconds
+REWARD_BATCH = int(os.getenv("REFERRAL_REWARD_BATCH", "200"))
+
+_flusher = None
+_flusher_lock = threading.Lock()
+_apply_lock = threading.Lock()
+
+
+def record(referee_id, referrer_id):
+    """Record that referrer_id invited referee_id. False if the referee was
+    already referred, refers themself, or the referrer is unknown."""
+    referee_id, referrer_id = int(referee_id), int(referrer_id)
+    if referee_id == referrer_id or user_store.get_user(referrer_id) is None:
+        return False
+    conn = database.get_connection()
+    with conn:
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO referrals (referee_id, referrer_id) VALUES (?, ?)",
+            (referee_id, referrer_id),
+        )
+        if not cur.rowcount:
+            return False
+        conn.execute(
+            """INSERT INTO referral_counts (referrer_id, referrals) VALUES (?, 1)
+               ON CONFLICT(referrer_id) DO UPDATE SET referrals = referrals + 1""",
+            (referrer_id,),
+        )
+    return True
+
+
+def referrer_of(referee_id):
+    row = database.get_connection().execute(
+        "SELECT referrer_id FROM referrals WHERE referee_id=?", (int(referee_id),)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def referees(referrer_id, limit=100):
+    rows = database.get_connection().execute(
+        "SELECT referee_id FROM referrals WHERE referrer_id=? ORDER BY created_at, referee_id LIMIT ?",
+        (int(referrer_id), limit),
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def referral_count(referrer_id):
+    row = database.get_connection().execute(
+        "SELECT referrals FROM referral_counts WHERE referrer_id=?", (int(referrer_id),)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def coins_earned(referrer_id):
+    row = database.get_connection().execute(
+        "SELECT coins_earned FROM referral_counts WHERE referrer_id=?", (int(referrer_id),)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def top_referrers(limit=10):
+    """[(referrer_id, referrals, coins_earned)], most referrals first."""
+    return database.get_connection().execute(
+        """SELECT referrer_id, referrals, coins_earned FROM referral_counts
+           WHERE referrals > 0 ORDER BY referrals DESC, referrer_id LIMIT ?""",
+        (limit,),
+    ).fetchall()
+
+
+def queue_reward(referee_id, event_key, amount=REFERRAL_REWARD):
+    """Queue the referrer's reward for a referee's purchase (no-op if the
+    referee was not referred). event_key identifies the purchase, e.g. the
+    Paystack reference or the hint's ledger key. Returns True if queued."""
+    referrer_id = referrer_of(referee_id)
+    if referrer_id is None or amount <= 0:
+        return False
+    conn = database.get_connection()
+    with conn:
+        cur = conn.execute(
+            """INSERT OR IGNORE INTO referral_rewards_pending (referrer_id, referee_id, amount, event_key)
+               VALUES (?, ?, ?, ?)""",
+            (referrer_id, int(referee_id), amount, event_key),
+        )
+    if not cur.rowcount:
+        return False
+    pending = conn.execute("SELECT COUNT(*) FROM referral_rewards_pending").fetchone()[0]
+    if pending >= REWARD_BATCH:
+        apply_pending()
+    else:
+        _ensure_flusher()
+    return True
+
+
+def apply_pending(limit=5000):
+    """Credit up to `limit` pending rewards in one transaction. Returns the
+    number of pending rewards consumed (credited, or dropped for unknown
+    referrers)."""
+    with _apply_lock:
+        conn = database.get_connection()
+        # Opening an account may read the user record and commits on its own,
+        # so do it before the transaction.
+        referrers = {row[0] for row in conn.execute("SELECT DISTINCT referrer_id FROM referral_rewards_pending")}
+        if not referrers:
+            return 0
+        known = {r for r in referrers if ledger.ensure_account(r)}
+        unknown = referrers - known
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Read the batch under the write lock: another worker flushing at
+            # the same time waits here and then sees only what is left.
+            rows = conn.execute(
+                "SELECT id, referrer_id, amount FROM referral_rewards_pending ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+            totals = {}
+            last_id = {}
+            consumed = []
+            dropped = set()
+            for row_id, referrer_id, amount in rows:
+                if referrer_id in known:
+                    totals[referrer_id] = totals.get(referrer_id, 0) + amount
+                    last_id[referrer_id] = row_id
+                elif referrer_id in unknown:
+                    dropped.add(referrer_id)
+                else:
+                    continue  # queued after we opened accounts; next batch
+                consumed.append((row_id,))
+            if dropped:
+                logger.warning("Dropping referral rewards for unknown users %s", dropped)
+            for referrer_id, total in totals.items():
+                # One entry per referrer per batch, keyed on a row id that is
+                # deleted in the same transaction, so no key is ever reused.
+                key = f"referral:{referrer_id}:{last_id[referrer_id]}"
+                if ledger.apply_in_transaction(conn, referrer_id, total, key, "referral") == "applied":
+                    conn.execute(
+                        """INSERT INTO referral_counts (referrer_id, coins_earned) VALUES (?, ?)
+                           ON CONFLICT(referrer_id) DO UPDATE SET coins_earned = coins_earned + excluded.coins_earned""",
+                        (referrer_id, total),
+                    )
+            conn.executemany("DELETE FROM referral_rewards_pending WHERE id = ?", consumed)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        return len(consumed)
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="referral-rewards", daemon=True)
+            _flusher.start()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            apply_pending()
+        except Exception:
+            logger.exception("Applying referral rewards failed; will retry")
+
+
+def _flush_at_exit():
+    if _flusher is not None:
+        apply_pending()
+
+
+atexit.register(_flush_at_exit)
+
+
+def import_from_users():
+    """Build the referral tables from the referred_by field of existing user
+    records (a one-off migration). Returns the number of edges added."""
+    added = 0
+    for user_id, user in user_store.iter_users():
+        referrer_id = user.get("referred_by")
+        if referrer_id is not None and record(user_id, referrer_id):
+            added += 1
+    return added
+
+
+if __name__ == "__main__":
+    # python referrals.py flush     (credit pending rewards now)
+    # python referrals.py import    (index referred_by from existing users)
+    # python referrals.py top [N]
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "flush":
+        total = 0
+        while True:
+            applied = apply_pending()
+            if not applied:
+                break
+            total += applied
+        print(f"Applied {total} referral rewards")
+    elif command == "import":
+        print(f"Indexed {import_from_users()} referrals")
+    elif command == "top":
+        for referrer_id, count, earned in top_referrers(int(sys.argv[2]) if len(sys.argv) > 2 else 10):
+            print(f"{referrer_id}\t{count} referrals\t{earned} coins")
+    else:
+        print("usage: python referrals.py flush|import|top [N]")
+        sys.exit(1)
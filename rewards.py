@@ -0,0 +1,204 @@
+# rewards.py
+#
+# Daily login reward and streak bonuses. check_in() runs after a user's
+# updates are handled; the first one of each UTC day extends (or restarts)
+# the streak and pays DAILY_LOGIN_REWARD plus any STREAK_BONUSES.
+#
+# The streak is worked out from two stored numbers, streak and streak_day
+# (the date ordinal of the last day counted), so it costs one comparison:
+# yesterday extends it, today changes nothing, anything older restarts it.
+# Coins go through the ledger under keys naming the user and the day
+# (login:<user>:<day>, streak:<user>:<day>), so a repeated check-in can never
+# pay twice, and a check-in whose login key is already there reports nothing.
+# With the SQLite backend the streak fields and both ledger entries are
+# written in a single transaction; with the JSON backend the ledger entries
+# are committed first and the streak is then moved by a compare-and-set on
+# streak_day (user_store.update_user), so a crash in between leaves the coins
+# paid and the next check-in just catches the streak up.
+#
+# backfill() recomputes every streak from the login entries in the ledger in
+# one streaming pass, e.g. after the rules change, and can pay bonuses that
+# the new rules grant for past days.
+
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from itertools import groupby
+
+import daily
+import database
+import ledger
+import user_store
+from config import DAILY_LOGIN_REWARD, STORAGE_BACKEND, STREAK_BONUSES
+
+CHECKED_CACHE_SIZE = 50000
+BACKFILL_CHUNK = 500
+
+# user_id -> day ordinal already checked in by this process, so later
+# updates the same day cost no storage read.
+_checked = OrderedDict()
+_checked_lock = threading.Lock()
+
+
+def next_streak(streak, streak_day, today):
+    if streak_day == today:
+        return streak
+    if streak_day == today - 1:
+        return streak + 1
+    return 1
+
+
+def bonus_for(streak):
+    return STREAK_BONUSES.get(streak, 0)
+
+
+def _already_checked(user_id, today):
+    with _checked_lock:
+        return _checked.get(user_id) == today
+
+
+def _mark_checked(user_id, today):
+    with _checked_lock:
+        _checked[user_id] = today
+        _checked.move_to_end(user_id)
+        if len(_checked) > CHECKED_CACHE_SIZE:
+            _checked.popitem(last=False)
+
+
+def check_in(user_id):
+    """Record today's activity. Returns {"streak", "login", "bonus"} the
+    first time it pays out today, otherwise None."""
+    today = daily.today_ordinal()
+    if _already_checked(user_id, today):
+        return None
+    user = user_store.get_user(user_id)
+    if not user:
+        return None  # not registered yet; /start creates the record
+    if (user.get("streak_day") or 0) == today:
+        _mark_checked(user_id, today)
+        return None
+    streak = next_streak(user.get("streak") or 0, user.get("streak_day") or 0, today)
+    bonus = bonus_for(streak)
+    granted = _grant(user_id, user, streak, today, bonus)
+    _mark_checked(user_id, today)
+    if not granted:
+        return None
+    return {"streak": streak, "login": DAILY_LOGIN_REWARD, "bonus": bonus}
+
+
+def _grant(user_id, user, streak, today, bonus):
+    """Move the streak to today and pay for it. False if another worker (or
+    an earlier call) got there first, in which case nothing is paid."""
+    user_id = int(user_id)
+    if not ledger.ensure_account(user_id):
+        return False
+    conn = database.get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if STORAGE_BACKEND == "sqlite":
+            cur = conn.execute(
+                "UPDATE users SET streak=?, streak_day=? WHERE user_id=? AND COALESCE(streak_day, 0) != ?",
+                (streak, today, user_id, today),
+            )
+            if cur.rowcount == 0:
+                conn.rollback()  # another worker checked this user in first
+                return False
+        login = ledger.apply_in_transaction(
+            conn, user_id, DAILY_LOGIN_REWARD, f"login:{user_id}:{today}", "daily_login"
+        )
+        if login != "applied":
+            conn.rollback()  # today's login was already paid
+        else:
+            if bonus:
+                ledger.apply_in_transaction(conn, user_id, bonus, f"streak:{user_id}:{today}", "streak_bonus")
+            conn.commit()
+    except sqlite3.IntegrityError:
+        conn.rollback()  # another process committed the same key first
+        login = "duplicate"
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    if STORAGE_BACKEND != "sqlite":
+        # The coins are committed; now move the streak. Also done when the
+        # login was already paid, in case that payer died before this step.
+        user_store.update_user(
+            user_id, {"streak": streak, "streak_day": today}, expected={"streak_day": user.get("streak_day")}
+        )
+    return login == "applied"
+
+
+def _login_days():
+    """Yield (user_id, sorted day ordinals) from the ledger's login entries."""
+    database.get_connection()  # make sure the schema exists
+    # A separate read connection, so the writes made while streaming commit
+    # independently of this cursor.
+    conn = sqlite3.connect(database.DB_PATH)
+    try:
+        rows = conn.execute(
+            "SELECT user_id, idem_key FROM coin_ledger WHERE reason='daily_login' ORDER BY user_id, id"
+        )
+        for user_id, group in groupby(rows, key=lambda row: row[0]):
+            yield user_id, sorted({int(key.rsplit(":", 1)[1]) for _, key in group})
+    finally:
+        conn.close()
+
+
+def _write_streaks(streaks):
+    if STORAGE_BACKEND == "sqlite":
+        conn = database.get_connection()
+        with conn:
+            conn.executemany(
+                "UPDATE users SET streak=?, streak_day=? WHERE user_id=?",
+                [(streak, day, user_id) for user_id, (streak, day) in streaks.items()],
+            )
+        return
+    users = {}
+    for user_id, (streak, day) in streaks.items():
+        user = user_store.get_user(user_id)
+        if user:
+            user["streak"] = streak
+            user["streak_day"] = day
+            users[user_id] = user
+    user_store.set_users(users)
+
+
+def backfill(pay_missing=False):
+    """Recompute streak/streak_day for everyone with login history, one user
+    at a time, writing in chunks. With pay_missing, also credit bonuses the
+    current rules grant for past days (already-paid days are skipped by their
+    ledger keys). Only history not yet folded by ledger.fold_balances is seen.
+
+    Returns (users updated, bonuses paid).
+    """
+    updated = paid = 0
+    chunk = {}
+    for user_id, days in _login_days():
+        streak, previous = 0, None
+        for day in days:
+            streak = streak + 1 if previous == day - 1 else 1
+            previous = day
+            bonus = bonus_for(streak)
+            if pay_missing and bonus:
+                status = ledger.apply_entry(user_id, bonus, f"streak:{user_id}:{day}", "streak_bonus")
+                paid += status == "applied"
+        chunk[user_id] = (streak, previous)
+        if len(chunk) >= BACKFILL_CHUNK:
+            _write_streaks(chunk)
+            updated += len(chunk)
+            chunk = {}
+    if chunk:
+        _write_streaks(chunk)
+        updated += len(chunk)
+    with _checked_lock:
+        _checked.clear()
+    return updated, paid
+
+
+if __name__ == "__main__":
+    # python rewards.py backfill [--pay-missing]
+    if len(sys.argv) < 2 or sys.argv[1] != "backfill":
+        print("usage: python rewards.py backfill [--pay-missing]")
+        sys.exit(1)
+    users, bonuses = backfill(pay_missing="--pay-missing" in sys.argv[2:])
+    print(f"Recomputed streaks for {users} users; paid {bonuses} missing bonuses")
@@ -0,0 +1,148 @@
+# riddles.py
+#
+# Riddle catalogue. riddles.json is parsed once, every riddle gets a stable
+# integer id (the "id" field; riddles added without one are numbered after
+# the current maximum) and is indexed by id and by section, with its answer
+# matcher (answers.py) prepared up front. The file is re-read only when its mtime changes, and
+# the mtime itself is checked at most every RELOAD_CHECK_INTERVAL seconds, so
+# /play and answer checking never wait on disk.
+#
+# A section with fewer riddles than a day's quota (daily_count) is logged
+# when the catalogue loads, since every player would get the whole section.
+
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+
+import answers
+import daily
+from config import MAX_DAILY_RIDDLES, SATURDAY_RIDDLES_COUNT
+
+logger = logging.getLogger(__name__)
+
+# Next to this module unless configured, whatever the working directory.
+RIDDLES_FILE = os.getenv("RIDDLES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "riddles.json"))
+RELOAD_CHECK_INTERVAL = 2.0  # seconds
+
+_lock = threading.Lock()
+_catalogue = None
+_checked_at = 0.0
+
+
+def _build(raw, mtime):
+    by_id = {}
+    by_section = {}
+    used_ids = {r["id"] for items in raw.values() for r in items if "id" in r}
+    next_id = max(used_ids, default=0) + 1
+    for section, items in raw.items():
+        riddles = []
+        for item in items:
+            riddle = dict(item)
+            if "id" not in riddle:
+                riddle["id"] = next_id
+                next_id += 1
+            riddle["section"] = section
+            riddle["normalised_answer"] = answers.normalise(riddle["answer"])
+            riddle["matcher"] = answers.prepare(riddle["answer"], riddle.get("accept", ()))
+            by_id[riddle["id"]] = riddle
+            riddles.append(riddle)
+        by_section[section] = riddles
+        if len(riddles) < daily_count(section):
+            logger.warning("Riddle section %r has %d riddles, fewer than the %d played per day",
+                           section, len(riddles), daily_count(section))
+    return {
+        "mtime": mtime,
+        "by_id": by_id,
+        "by_section": by_section,
+        "section_ids": {s: tuple(r["id"] for r in rs) for s, rs in by_section.items()},
+    }
+
+
+def load(path=None):
+    """(Re)load the catalogue from disk and return it."""
+    global _catalogue, _checked_at
+    path = path or RIDDLES_FILE
+    mtime = os.stat(path).st_mtime_ns
+    with open(path, "r") as f:
+        raw = json.load(f)
+    catalogue = _build(raw, mtime)
+    with _lock:
+        _catalogue = catalogue
+        _checked_at = time.monotonic()
+    _daily_selection.cache_clear()
+    return catalogue
+
+
+def get_catalogue():
+    """Return the loaded catalogue, reloading it if riddles.json changed."""
+    global _checked_at
+    catalogue = _catalogue
+    if catalogue is None:
+        return load()
+    now = time.monotonic()
+    if now - _checked_at < RELOAD_CHECK_INTERVAL:
+        return catalogue
+    _checked_at = now
+    try:
+        mtime = os.stat(RIDDLES_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return catalogue
+    if mtime != catalogue["mtime"]:
+        return load()
+    return catalogue
+
+
+def get_riddle(riddle_id):
+    return get_catalogue()["by_id"].get(int(riddle_id))
+
+
+def section_riddles(section):
+    return get_catalogue()["by_section"].get(section, [])
+
+
+def section_ids(section):
+    return get_catalogue()["section_ids"].get(section, ())
+
+
+def daily_count(section):
+    return SATURDAY_RIDDLES_COUNT if section == "saturday" else MAX_DAILY_RIDDLES
+
+
+def today():
+    return daily.today_key()
+
+
+def daily_selection(user_id, section, day=None, unlocked_all=False):
+    """The riddle ids a user plays in a section on a given day.
+
+    The choice is a deterministic shuffle seeded by (user, day, section), so
+    every worker picks the same riddles for the same user without storing
+    them. Saturday players get SATURDAY_RIDDLES_COUNT riddles, everyone else
+    MAX_DAILY_RIDDLES, unless they unlocked the whole section.
+    """
+    ids = section_ids(section)
+    if unlocked_all:
+        return list(ids)
+    return list(_daily_selection(str(user_id), section, day or today(), ids))
+
+
+def _seeded_sample(user_id, section, day, ids):
+    seed = hashlib.sha256(f"{user_id}:{day}:{section}".encode()).digest()
+    rng = random.Random(int.from_bytes(seed[:8], "big"))
+    return tuple(rng.sample(ids, min(daily_count(section), len(ids))))
+
+
+# Small memo so repeated /play and answer checks within a day reuse the pick.
+_daily_selection = lru_cache(maxsize=4096)(_seeded_sample)
+
+
+def check_answer(riddle_id, reply):
+    riddle = get_riddle(riddle_id)
+    if riddle is None:
+        return False
+    return answers.matches(riddle["matcher"], reply)
@@ -0,0 +1,324 @@
+# snapshot.py
+#
+# Read-only snapshot of the leaderboards and user profiles for the dashboard
+# and the public leaderboard pages. build() writes one file of fixed-width
+# records; readers mmap it and page through it by slicing, so serving a page
+# never loads the user store, takes a storage lock or sorts anything.
+#
+# Layout (little-endian):
+#
+#   header     magic "RWSNAP01", built_at (double), section count, user count,
+#              names offset
+#   sections   per section: name (16 bytes), first entry index, entry count
+#   entries    per section, best first: user_id (int64), points (int32),
+#              rank (int32), name offset (uint32), name length (uint16)
+#   profiles   sorted by user_id: user_id, coins, streak, points and rank in
+#              their own section, section code, flags, name offset/length
+#   names      UTF-8 usernames, referenced by offset
+#
+# The builder writes a temporary file and renames it over the old one, so
+# open readers keep their mapping of the previous snapshot and Reader picks up
+# the new file on its next check. Building reads the whole user store, so web
+# workers never do it: the snapshot is rebuilt by cron (`python snapshot.py
+# build`), by a long-running `python snapshot.py watch` (every
+# SNAPSHOT_INTERVAL seconds), or by the one process started with
+# SNAPSHOT_BUILDER=1. Until the first snapshot exists, current() returns None
+# and the dashboard answers 503.
+
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+import database
+import filestore
+import metrics
+import user_store
+from config import DATA_DIR, STORAGE_BACKEND
+from models import DAILY_SECTIONS, Section
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = os.getenv("SNAPSHOT_FILE", os.path.join(DATA_DIR, "leaderboard.snap"))
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "60"))  # seconds between rebuilds; 0 only builds a missing one
+SNAPSHOT_BUILDER = os.getenv("SNAPSHOT_BUILDER", "0") == "1"  # set in exactly one process to build in the background
+RELOAD_CHECK = 1.0  # seconds between checks for a newer snapshot file
+
+MAGIC = b"RWSNAP01"
+HEADER = struct.Struct("<8sdIIQ")  # magic, built_at, sections, users, names offset
+SECTION = struct.Struct("<16sII")  # name, first entry, count
+ENTRY = struct.Struct("<qiiIH2x")  # user_id, points, rank, name offset, name length
+PROFILE = struct.Struct("<qiiiiBBIH")  # user_id, coins, streak, points, rank, section, flags, name off/len
+
+FLAG_PAID = 1
+FLAG_VIP = 2
+FLAG_PREMIUM = 4
+
+
+# --------------------
+# Building
+# --------------------
+
+def _stored_scores():
+    if STORAGE_BACKEND == "sqlite":
+        return database.get_scores()
+    try:
+        with open(os.path.join(DATA_DIR, "scores.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _balances():
+    return dict(database.get_connection().execute("SELECT user_id, balance FROM coin_balances"))
+
+
+class _Names:
+    def __init__(self):
+        self.blob = bytearray()
+        self.offsets = {}
+
+    def add(self, name):
+        name = name or ""
+        ref = self.offsets.get(name)
+        if ref is None:
+            data = name.encode("utf-8")[:0xFFFF]
+            ref = self.offsets[name] = (len(self.blob), len(data))
+            self.blob += data
+        return ref
+
+
+def _ranked(entries):
+    """Sort {user_id: {"username", "points"}} best first with competition ranks."""
+    rows = sorted(((int(uid), e.get("points", 0), e.get("username")) for uid, e in entries.items()),
+                  key=lambda row: (-row[1], row[0]))
+    ranked = []
+    rank = 0
+    previous = None
+    for i, (user_id, points, username) in enumerate(rows, 1):
+        if points != previous:
+            rank, previous = i, points
+        ranked.append((user_id, points, rank, username))
+    return ranked
+
+
+@metrics.timed("snapshot_build_seconds")
+def build(path=None):
+    """Write a new snapshot from the stored scores and users. Returns the path."""
+    path = path or SNAPSHOT_FILE
+    scores = _stored_scores()
+    names = _Names()
+    sections = [s for s in DAILY_SECTIONS] + sorted(set(scores) - set(DAILY_SECTIONS))
+
+    entries = bytearray()
+    section_table = bytearray()
+    standing = {}  # (section, user_id) -> (points, rank)
+    count = 0
+    for section in sections:
+        ranked = _ranked(scores.get(section, {}))
+        section_table += SECTION.pack(section.encode()[:16], count, len(ranked))
+        for user_id, points, rank, username in ranked:
+            offset, length = names.add(username)
+            entries += ENTRY.pack(user_id, points, rank, offset, length)
+            standing[(section, user_id)] = (points, rank)
+        count += len(ranked)
+
+    balances = _balances()
+    profiles = bytearray()
+    users = 0
+    for user_id, user in user_store.iter_users():  # user_id order
+        user_id = int(user_id)
+        section = user.get("section")
+        points, rank = standing.get((section, user_id), (0, 0))
+        flags = ((FLAG_PAID if user.get("has_paid_entry") else 0)
+                 | (FLAG_VIP if user.get("is_vip") else 0)
+                 | (FLAG_PREMIUM if user.get("is_premium") else 0))
+        offset, length = names.add(user.get("username"))
+        profiles += PROFILE.pack(
+            user_id, balances.get(user_id, int(user.get("coins") or 0)), int(user.get("streak") or 0),
+            points, rank, Section.parse(section), flags, offset, length,
+        )
+        users += 1
+
+    names_offset = HEADER.size + len(section_table) + len(entries) + len(profiles)
+    header = HEADER.pack(MAGIC, time.time(), len(sections), users, names_offset)
+
+    with filestore.atomic_write(path, "wb") as f:
+        for part in (header, section_table, entries, profiles, names.blob):
+            f.write(part)
+    return path
+
+
+def build_if_due(max_age=None):
+    """Rebuild if the snapshot is older than max_age, unless another process
+    is already building. Returns True if this call built one."""
+    max_age = SNAPSHOT_INTERVAL if max_age is None else max_age
+    try:
+        if time.time() - os.stat(SNAPSHOT_FILE).st_mtime < max_age:
+            return False
+    except FileNotFoundError:
+        pass
+    with filestore.locked(SNAPSHOT_FILE, blocking=False) as acquired:
+        if not acquired:
+            return False
+        build()
+        return True
+
+
+# --------------------
+# Reading
+# --------------------
+
+class Snapshot:
+    """One mapped snapshot file. Slices are taken straight from the mapping."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+        magic, self.built_at, n_sections, self.user_count, self.names_offset = HEADER.unpack_from(self.view, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a leaderboard snapshot")
+        self.sections = {}
+        pos = HEADER.size
+        for _ in range(n_sections):
+            name, first, count = SECTION.unpack_from(self.view, pos)
+            self.sections[name.rstrip(b"\0").decode()] = (first, count)
+            pos += SECTION.size
+        self.entries_offset = pos
+        total = sum(count for _, count in self.sections.values())
+        self.profiles_offset = pos + total * ENTRY.size
+
+    def _name(self, offset, length):
+        start = self.names_offset + offset
+        return str(self.view[start:start + length], "utf-8")
+
+    def section_size(self, section):
+        return self.sections.get(section, (0, 0))[1]
+
+    def page(self, section, start=0, limit=50):
+        """Entries [start, start+limit) of a section, best first."""
+        first, count = self.sections.get(section, (0, 0))
+        stop = min(count, start + limit)
+        rows = []
+        for i in range(max(start, 0), stop):
+            user_id, points, rank, offset, length = ENTRY.unpack_from(
+                self.view, self.entries_offset + (first + i) * ENTRY.size
+            )
+            rows.append({"rank": rank, "user_id": user_id, "username": self._name(offset, length),
+                         "points": points})
+        return rows
+
+    def _profile_id(self, i):
+        return struct.unpack_from("<q", self.view, self.profiles_offset + i * PROFILE.size)[0]
+
+    def profile(self, user_id):
+        """A user's profile by binary search over the id-sorted records, or None."""
+        user_id = int(user_id)
+        lo, hi = 0, self.user_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._profile_id(mid) < user_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.user_count or self._profile_id(lo) != user_id:
+            return None
+        _, coins, streak, points, rank, section, flags, offset, length = PROFILE.unpack_from(
+            self.view, self.profiles_offset + lo * PROFILE.size
+        )
+        return {
+            "user_id": user_id,
+            "username": self._name(offset, length),
+            "section": Section(section).label,
+            "coins": coins,
+            "streak": streak,
+            "points": points,
+            "rank": rank or None,
+            "has_paid_entry": bool(flags & FLAG_PAID),
+            "is_vip": bool(flags & FLAG_VIP),
+            "is_premium": bool(flags & FLAG_PREMIUM),
+        }
+
+
+_current = None
+_checked_at = 0.0
+_reader_lock = threading.Lock()
+_builder = None
+
+
+def current():
+    """The newest snapshot, remapped at most every RELOAD_CHECK seconds, or
+    None until the first one has been built."""
+    global _current, _checked_at
+    if SNAPSHOT_BUILDER:
+        _ensure_builder()
+    now = time.monotonic()
+    if _current is not None and now - _checked_at < RELOAD_CHECK:
+        return _current
+    with _reader_lock:
+        if _current is not None and now - _checked_at < RELOAD_CHECK:
+            return _current
+        try:
+            stat = os.stat(SNAPSHOT_FILE)
+        except FileNotFoundError:
+            return _current  # not built yet
+        if _current is None or (stat.st_ino, stat.st_mtime_ns) != (_current.stat.st_ino, _current.stat.st_mtime_ns):
+            # The old mapping is left to the garbage collector: a request may
+            # still be slicing it.
+            _current = Snapshot(SNAPSHOT_FILE)
+        _checked_at = now
+        return _current
+
+
+def _ensure_builder():
+    global _builder
+    if _builder is not None:
+        return
+    with _reader_lock:
+        if _builder is None:
+            _builder = threading.Thread(target=_build_loop, name="snapshot-builder", daemon=True)
+            _builder.start()
+
+
+def _build_loop():
+    # With SNAPSHOT_INTERVAL 0 (cron builds) this only makes the first
+    # snapshot if there is none.
+    max_age = SNAPSHOT_INTERVAL if SNAPSHOT_INTERVAL > 0 else float("inf")
+    while True:
+        try:
+            build_if_due(max_age)
+        except Exception:
+            logger.exception("Building the leaderboard snapshot failed; will retry")
+        if SNAPSHOT_INTERVAL <= 0:
+            if os.path.exists(SNAPSHOT_FILE):
+                return
+            time.sleep(RELOAD_CHECK)
+        else:
+            time.sleep(SNAPSHOT_INTERVAL)
+
+
+if __name__ == "__main__":
+    # python snapshot.py build | watch | show SECTION [START] [LIMIT] | profile USER_ID
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "build":
+        print(f"Wrote {build()}")
+    elif command == "watch":
+        logging.basicConfig(level=logging.INFO)
+        _build_loop()
+    elif command == "show" and len(sys.argv) > 2:
+        snap = Snapshot(SNAPSHOT_FILE)
+        start = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+        limit = int(sys.argv[4]) if len(sys.argv) > 4 else 20
+        for row in snap.page(sys.argv[2], start, limit):
+            print(f"{row['rank']}\t{row['user_id']}\t{row['username']}\t{row['points']}")
+    elif command == "profile" and len(sys.argv) > 2:
+        print(Snapshot(SNAPSHOT_FILE).profile(sys.argv[2]))
+    else:
+        print("usage: python snapshot.py build | watch | show SECTION [START] [LIMIT] | profile USER_ID")
+        sys.exit(1)
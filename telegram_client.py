@@ -0,0 +1,331 @@
+# telegram_client.py
+#
+# Outbound Telegram Bot API calls. Webhook handlers enqueue messages and
+# return straight away; a small pool of sender threads delivers them over one
+# keep-alive requests.Session.
+#
+# Delivery respects Telegram's limits: a global token bucket (about 30
+# messages/second per bot) and a per-chat bucket (about 1/second), with at
+# most one request in flight per chat so a chat's messages arrive in order.
+# A 429 pauses that chat for the returned retry_after; 5xx and connection
+# errors are retried with backoff.
+#
+# Consecutive plain sendMessage calls to the same chat that are still queued
+# are merged into one message (see send_message's coalesce flag).
+#
+# Under the asyncio entry point (asgi.py) the sender threads are replaced by
+# coroutines: set_async_sender() registers a wake-up callback, and the event
+# loop pulls due jobs with take_job() and reports results with complete().
+
+import atexit
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import metrics
+from config import TELEGRAM_API_URL
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))  # messages/second
+PER_CHAT_RATE = float(os.getenv("TELEGRAM_PER_CHAT_RATE", "1"))  # messages/second
+PER_CHAT_BURST = 3
+MAX_CHAT_BUCKETS = 10000
+SENDER_THREADS = int(os.getenv("TELEGRAM_SENDER_THREADS", "4"))
+MAX_RETRIES = 3
+REQUEST_TIMEOUT = (3.05, 15)  # connect, read
+MAX_MESSAGE_LENGTH = 4096
+
+
+class TokenBucket:
+    """Classic token bucket; reserve() returns how long the caller must wait."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Take a token now (possibly going negative) and return the delay before using it."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def next_free(self):
+        """Seconds until a token is available, without taking one."""
+        with self.lock:
+            self._refill(time.monotonic())
+            return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+_session = None
+_session_lock = threading.Lock()
+global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+
+# Queue state, all guarded by _cond.
+_cond = threading.Condition()
+_pending = {}  # chat_id -> deque of jobs
+# chat_id -> TokenBucket in last-use order. A bucket idle long enough to
+# have refilled is the same as a new one, so those are dropped from the
+# front as new chats arrive (as in throttle.Limiter); a busy chat keeps its
+# bucket, and with it its rate limit, however many other chats come and go.
+_chat_buckets = OrderedDict()
+_CHAT_IDLE_EXPIRY = PER_CHAT_BURST / PER_CHAT_RATE
+_ready = []  # heap of (not_before, seq, chat_id) for chats with work and nothing in flight
+_in_flight = set()
+_seq = itertools.count()
+_workers = []
+_wakeup = None  # set by set_async_sender(); called when new work may be due
+
+stats = {"sent": 0, "failed": 0, "retried": 0, "rate_limited": 0, "coalesced": 0}
+
+
+def get_session():
+    global _session
+    if _session is None:
+        # requests is imported on first use: it is a large share of a
+        # worker's import time and many processes never send anything.
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(SENDER_THREADS * 2, 10))
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def call(method, data):
+    """Call a Bot API method synchronously and return the decoded response.
+
+    Waits on the global bucket first and retries transient failures. A 429
+    is returned to the caller as-is (the response carries retry_after) so
+    queue workers can reschedule the chat instead of blocking a thread.
+    """
+    delay = global_bucket.reserve()
+    if delay:
+        time.sleep(delay)
+    session = get_session()
+    import requests  # already loaded by get_session()
+
+    url = f"{TELEGRAM_API_URL}/{method}"
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            with metrics.timed("telegram_api_seconds", method=method):
+                resp = session.post(url, data=data, timeout=REQUEST_TIMEOUT)
+            metrics.inc("telegram_api_responses_total", method=method, status=resp.status_code)
+            if resp.status_code < 500:
+                try:
+                    return resp.json()
+                except ValueError:
+                    return {"ok": False, "error_code": resp.status_code, "description": resp.text[:200]}
+        except requests.RequestException as exc:
+            logger.warning("Telegram %s failed: %s", method, exc)
+        if attempt < MAX_RETRIES:
+            stats["retried"] += 1
+            time.sleep(0.5 * 2 ** attempt)
+    return {"ok": False, "description": "request failed"}
+
+
+def _message_data(chat_id, text, reply_markup, parse_mode):
+    data = {"chat_id": chat_id, "text": text}
+    if parse_mode:
+        data["parse_mode"] = parse_mode
+    if reply_markup:
+        data["reply_markup"] = reply_markup if isinstance(reply_markup, str) else json.dumps(reply_markup)
+    return data
+
+
+def _enqueue(chat_id, job, coalesce=False):
+    with _cond:
+        queue = _pending.get(chat_id)
+        if queue is None:
+            queue = _pending[chat_id] = deque()
+        if coalesce and queue and queue[-1]["coalesce"]:
+            tail = queue[-1]
+            merged = f"{tail['data']['text']}\n\n{job['data']['text']}"
+            if (tail["data"].get("parse_mode") == job["data"].get("parse_mode")
+                    and len(merged) <= MAX_MESSAGE_LENGTH):
+                tail["data"]["text"] = merged
+                stats["coalesced"] += 1
+                return
+        queue.append(job)
+        if len(queue) == 1 and chat_id not in _in_flight:
+            heapq.heappush(_ready, (time.monotonic(), next(_seq), chat_id))
+            _cond.notify()
+    if _wakeup is not None:
+        _wakeup()
+    _ensure_workers()
+
+
+def send_message(chat_id, text, reply_markup=None, parse_mode="Markdown", coalesce=True):
+    """Queue a sendMessage. Plain messages (no keyboard) may be merged with the
+    previous still-queued plain message to the same chat."""
+    can_merge = coalesce and not reply_markup
+    job = {"method": "sendMessage", "data": _message_data(chat_id, text, reply_markup, parse_mode),
+           "coalesce": can_merge, "attempts": 0}
+    _enqueue(chat_id, job, coalesce=can_merge)
+
+
+def edit_message(chat_id, message_id, text, reply_markup=None, parse_mode="Markdown"):
+    data = _message_data(chat_id, text, reply_markup, parse_mode)
+    data["message_id"] = message_id
+    _enqueue(chat_id, {"method": "editMessageText", "data": data, "coalesce": False, "attempts": 0})
+
+
+def enqueue(method, data):
+    """Queue any other Bot API call that targets data["chat_id"]."""
+    _enqueue(data["chat_id"], {"method": method, "data": dict(data), "coalesce": False, "attempts": 0})
+
+
+def _chat_bucket(chat_id):
+    """With _cond held: the chat's bucket, marked as most recently used."""
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is not None:
+        _chat_buckets.move_to_end(chat_id)
+        return bucket
+    now = time.monotonic()
+    while _chat_buckets:
+        oldest = next(iter(_chat_buckets.values()))
+        if now - oldest.updated < _CHAT_IDLE_EXPIRY and len(_chat_buckets) < MAX_CHAT_BUCKETS:
+            break
+        _chat_buckets.popitem(last=False)
+    bucket = _chat_buckets[chat_id] = TokenBucket(PER_CHAT_RATE, PER_CHAT_BURST)
+    return bucket
+
+
+def _take_job():
+    """With _cond held: (chat_id, job) for the first due chat, else (None,
+    seconds until one may be due), with None seconds if nothing is queued."""
+    while _ready:
+        not_before, _, chat_id = _ready[0]
+        wait = not_before - time.monotonic()
+        if wait > 0:
+            return None, wait
+        heapq.heappop(_ready)
+        wait = _chat_bucket(chat_id).next_free()
+        if wait > 0:
+            heapq.heappush(_ready, (time.monotonic() + wait, next(_seq), chat_id))
+            continue
+        _chat_bucket(chat_id).reserve()
+        _in_flight.add(chat_id)
+        job = _pending[chat_id].popleft()
+        # Started jobs can no longer absorb new messages.
+        job["coalesce"] = False
+        return chat_id, job
+    return None, None
+
+
+def _next_job():
+    """Block until some chat is due, then take its first job."""
+    with _cond:
+        while True:
+            chat_id, item = _take_job()
+            if chat_id is not None:
+                return chat_id, item
+            _cond.wait(item)  # until the next chat is due, or until notified
+
+
+def take_job():
+    """Non-blocking _next_job for an async sender: (chat_id, job), or
+    (None, seconds to wait) where None seconds means wait for a wake-up."""
+    with _cond:
+        return _take_job()
+
+
+def _finish(chat_id, job=None, delay=0.0):
+    """Release a chat after a send; put job back at the front if it must be retried."""
+    with _cond:
+        _in_flight.discard(chat_id)
+        queue = _pending.get(chat_id)
+        if job is not None:
+            queue.appendleft(job)
+        if queue:
+            heapq.heappush(_ready, (time.monotonic() + delay, next(_seq), chat_id))
+        else:
+            _pending.pop(chat_id, None)
+        _cond.notify_all()
+    if _wakeup is not None:
+        _wakeup()
+
+
+def complete(chat_id, job, result):
+    """Record the outcome of a job's API call and release its chat."""
+    if result.get("ok"):
+        stats["sent"] += 1
+        _finish(chat_id)
+        return
+    retry_after = (result.get("parameters") or {}).get("retry_after")
+    job["attempts"] += 1
+    if retry_after and job["attempts"] <= MAX_RETRIES:
+        stats["rate_limited"] += 1
+        _finish(chat_id, job, delay=float(retry_after))
+        return
+    stats["failed"] += 1
+    logger.warning("Telegram %s to %s failed: %s", job["method"], chat_id, result.get("description"))
+    _finish(chat_id)
+
+
+def _worker():
+    while True:
+        chat_id, job = _next_job()
+        try:
+            result = call(job["method"], job["data"])
+        except Exception:
+            logger.exception("Telegram %s to %s crashed", job["method"], chat_id)
+            result = {"ok": False}
+        complete(chat_id, job, result)
+
+
+def set_async_sender(wakeup):
+    """Deliver from an event loop instead of sender threads. wakeup() must be
+    thread-safe; it is called whenever a job may have become due."""
+    global _wakeup
+    _wakeup = wakeup
+    wakeup()
+
+
+def _ensure_workers():
+    if _wakeup is not None or len(_workers) >= SENDER_THREADS:
+        return
+    with _session_lock:
+        while len(_workers) < SENDER_THREADS:
+            t = threading.Thread(target=_worker, name=f"telegram-sender-{len(_workers)}", daemon=True)
+            t.start()
+            _workers.append(t)
+
+
+def queue_depth():
+    with _cond:
+        return sum(len(q) for q in _pending.values()) + len(_in_flight)
+
+
+def drain(timeout=10.0):
+    """Wait until everything queued has been sent (or given up). Returns True if drained."""
+    deadline = time.monotonic() + timeout
+    with _cond:
+        while _pending or _in_flight:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _cond.wait(min(remaining, 0.1))
+    return True
+
+
+atexit.register(drain, 5.0)
@@ -0,0 +1,77 @@
+# tests/conftest.py
+#
+# Modules read their configuration (DATA_DIR, DB_PATH, STORAGE_BACKEND, ...)
+# at import time, so the environment for the test process is set here, before
+# any test module imports them. Tests that need a different backend or
+# several processes run code in child interpreters via run_python().
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_DATA_DIR = tempfile.mkdtemp(prefix="riddlewars-tests-")
+os.environ.update({
+    "DATA_DIR": _DATA_DIR,
+    "DB_PATH": os.path.join(_DATA_DIR, "app_data.db"),
+    "RIDDLES_FILE": os.path.join(ROOT, "riddles.json"),
+    "STORAGE_BACKEND": "sqlite",
+    "TELEGRAM_API_URL": "http://127.0.0.1:9",  # nothing listens; sends just fail
+    "REFERRAL_FLUSH_INTERVAL": "3600",
+    "SNAPSHOT_INTERVAL": "0",
+})
+
+
+@pytest.fixture
+def data_env(tmp_path):
+    """Environment for child processes sharing one fresh data dir."""
+    return dict(os.environ, DATA_DIR=str(tmp_path), DB_PATH=str(tmp_path / "app_data.db"), PYTHONPATH=ROOT)
+
+
+def run_python(code, env, procs=1, timeout=120):
+    """Run `code` in `procs` child interpreters at once. Returns their stdouts;
+    fails the test if any of them fails."""
+    children = [
+        subprocess.Popen([sys.executable, "-c", code, str(i)], env=env, cwd=env["DATA_DIR"],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        for i in range(procs)
+    ]
+    outputs = []
+    for child in children:
+        try:
+            out, err = child.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            for c in children:
+                c.kill()
+            pytest.fail(f"child process still running after {timeout} s")
+        assert child.returncode == 0, err
+        outputs.append(out)
+    return outputs
+
+
+# Prepended to the code run_together() starts: start_together(offset) blocks
+# until a wall-clock instant shared by every child, so they race for real
+# instead of one finishing before the next has imported.
+_BARRIER = """
+import time as _barrier_time
+
+def start_together(offset=0.0, _at={at!r}):
+    while _barrier_time.time() < _at + offset:
+        _barrier_time.sleep(0.001)
+"""
+
+
+@pytest.fixture
+def run_together(data_env):
+    """run_python(code, data_env, procs) where code may call
+    start_together([offset seconds]) once it has done its imports."""
+    def run(code, procs=2, env=None, lead=1.5):
+        barrier = _BARRIER.format(at=time.time() + lead)
+        return run_python(barrier + code, env or data_env, procs=procs)
+    return run
@@ -0,0 +1,45 @@
+import pytest
+
+import answers
+
+NEAR_MISSES = [
+    ("cold", "gold"), ("clock", "block"), ("coin", "corn"), ("bank", "tank"),
+    ("comb", "bomb"), ("river", "liver"), ("towel", "tower"), ("candle", "handle"),
+]
+
+TYPOS = [
+    ("echo", "ecoh"),  # swapped letters
+    ("shadow", "shadw"),  # missing letter
+    ("piano", "pianno"),  # extra letter
+    ("footsteps", "fotstep"),  # long answers take two
+    ("keyboard", "keybaord"),
+]
+
+
+@pytest.mark.parametrize("answer, reply", NEAR_MISSES + [(b, a) for a, b in NEAR_MISSES])
+def test_other_real_words_are_not_typos(answer, reply):
+    assert not answers.matches(answers.prepare(answer), reply)
+
+
+@pytest.mark.parametrize("answer, reply", TYPOS)
+def test_typos_are_accepted(answer, reply):
+    assert answers.matches(answers.prepare(answer), reply)
+
+
+def test_synonyms_and_filler():
+    assert answers.matches(answers.prepare("a phone"), "It's the telephone!")
+    assert answers.matches(answers.prepare("footsteps"), "steps")
+
+
+def test_typo_budget_is_per_word():
+    matcher = answers.prepare("letter e")
+    assert not answers.matches(matcher, "letter")
+    assert not answers.matches(matcher, "letter x")
+    assert answers.matches(matcher, "leter e")
+    assert answers.matches(answers.prepare("garbage truck"), "garbage truk")
+
+
+def test_words_ending_in_s_that_are_not_plurals():
+    assert answers.canonical("news") == "news"
+    assert answers.canonical("glasses") != answers.canonical("glass")
+    assert answers.canonical("candles") == "candle"
@@ -0,0 +1,51 @@
+import asyncio
+
+import asgi
+
+
+async def _serve(responses):
+    """A server answering each request on a connection with the next canned
+    response; returns (server, url, connections accepted)."""
+    accepted = []
+
+    async def handle(reader, writer):
+        accepted.append(writer)
+        for response in responses:
+            length = 0
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            writer.write(response)
+            await writer.drain()
+            if b"Content-Length" not in response:
+                break
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}/bot/sendMessage", accepted
+
+
+def test_close_delimited_body_is_read_and_not_pooled():
+    async def main():
+        server, url, accepted = await _serve([b"HTTP/1.1 200 OK\r\nConnection: close\r\n\r\n{\"ok\":true}"])
+        client = asgi.HTTPClient()
+        async with server:
+            status, body = await client.post_form(url, {}, timeout=5)
+            assert (status, body) == (200, b'{"ok":true}')
+            assert not any(client.idle.values())
+    asyncio.run(main())
+
+
+def test_idle_pool_is_capped():
+    async def main():
+        ok = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+        server, url, accepted = await _serve([ok] * 10)
+        client = asgi.HTTPClient(max_idle=2)
+        async with server:
+            results = await asyncio.gather(*(client.post_form(url, {}, timeout=5) for _ in range(5)))
+            assert results == [(200, b"ok")] * 5
+            assert len(accepted) == 5
+            assert sum(len(conns) for conns in client.idle.values()) == 2
+    asyncio.run(main())
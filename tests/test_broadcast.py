@@ -0,0 +1,24 @@
+import textwrap
+
+from conftest import run_python
+
+
+def test_saturday_broadcast_does_not_import_the_app(data_env):
+    out = run_python(textwrap.dedent("""
+        import sys
+        import broadcast, daily
+        daily.is_saturday = lambda: False
+        print(broadcast.broadcast_saturday_challenge(), "app" in sys.modules, "flask" in sys.modules)
+    """), data_env)[0]
+    assert out.split() == ["None", "False", "False"]
+
+
+def test_checkpoint_round_trip_and_single_runner(data_env):
+    out = run_python(textwrap.dedent("""
+        import broadcast, filestore
+        broadcast.save_checkpoint("daily-x", {"sent": 3})
+        with filestore.locked(broadcast._checkpoint_path("daily-x")):
+            running = broadcast.run_broadcast("daily-x", "hi", broadcast.PAID_SECTIONS)
+        print(broadcast.load_checkpoint("daily-x"), broadcast.load_checkpoint("missing"), running)
+    """), data_env)[0]
+    assert out.strip() == "{'sent': 3} None None"
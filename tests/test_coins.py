@@ -0,0 +1,57 @@
+import json
+import sqlite3
+import textwrap
+
+from conftest import run_python
+
+OPENING_COINS = 100
+PLAYERS = 5
+
+# A small version of benchmarks/stress_coins.py: every process spends and
+# credits coins on the same few players, re-sending some keys as a retried
+# tap would, and reports what it saw succeed.
+HAMMER = textwrap.dedent("""
+    import json, random, sys
+    import coins
+    index = int(sys.argv[1])
+    rng = random.Random(index)
+    debited, credited = {}, {}
+    start_together()
+    for i in range(150):
+        user_id = rng.randrange(5) + 1
+        key = f"stress:{index}:{i}"
+        if rng.random() < 0.2:
+            amount = rng.randint(1, 10)
+            if coins.add_coins(user_id, amount, key, "stress"):
+                credited[user_id] = credited.get(user_id, 0) + amount
+        else:
+            amount = rng.randint(1, 15)
+            if coins.deduct_coins(user_id, amount, key, "stress"):
+                debited[user_id] = debited.get(user_id, 0) + amount
+                coins.deduct_coins(user_id, amount, key, "stress")  # must not charge again
+    print(json.dumps({"debited": debited, "credited": credited}))
+""")
+
+
+def test_concurrent_spending_loses_nothing(data_env, tmp_path, run_together):
+    data_env["STORAGE_BACKEND"] = "json"
+    users = {str(uid): {"username": f"p{uid}", "coins": OPENING_COINS} for uid in range(1, PLAYERS + 1)}
+    (tmp_path / "users.json").write_text(json.dumps(users))
+    run_python("import ledger", data_env)  # create the schema before the race
+    reports = [json.loads(out) for out in run_together(HAMMER, procs=4)]
+
+    conn = sqlite3.connect(tmp_path / "app_data.db")
+    balances = dict(conn.execute("SELECT user_id, balance FROM coin_balances"))
+    sums = dict(conn.execute("SELECT user_id, SUM(delta) FROM coin_ledger GROUP BY user_id"))
+    applied, distinct = conn.execute(
+        "SELECT COUNT(*), COUNT(DISTINCT idem_key) FROM coin_ledger WHERE reason='stress'"
+    ).fetchone()
+    assert applied == distinct
+    for uid in range(1, PLAYERS + 1):
+        expected = OPENING_COINS + sum(
+            r["credited"].get(str(uid), 0) - r["debited"].get(str(uid), 0) for r in reports
+        )
+        balance = balances.get(uid, OPENING_COINS)
+        assert balance == expected >= 0
+        if uid in balances:
+            assert sums[uid] == balance
@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+
+import daily
+
+
+def _at(monkeypatch, iso):
+    monkeypatch.setattr(daily.time, "time", lambda: datetime.fromisoformat(iso).replace(tzinfo=timezone.utc).timestamp())
+
+
+def test_stale_counters_read_as_defaults_without_a_write():
+    user = {"last_active_day": "2000-01-01", "daily_riddles_done": 5, "hints_used_today": 2,
+            "daily_scores": {"free": 30, "vip": 0, "premium": 0, "saturday": 0}}
+    assert daily.get_daily(user, "daily_riddles_done") == 0
+    scores = daily.get_daily(user, "daily_scores")
+    assert scores == daily.DAILY_DEFAULTS["daily_scores"]
+    scores["free"] = 99  # a copy, not the shared default
+    assert daily.DAILY_DEFAULTS["daily_scores"]["free"] == 0
+    assert user["daily_riddles_done"] == 5  # reading changed nothing
+
+
+def test_roll_over_resets_once_per_day():
+    user = {"last_active_day": "2000-01-01", "daily_riddles_done": 5, "coins_spent_today": 40}
+    assert daily.roll_over(user)
+    assert user["last_active_day"] == daily.today_key()
+    assert (user["daily_riddles_done"], user["coins_spent_today"], user["unlocked_all"]) == (0, 0, False)
+    daily.add_daily(user, "daily_riddles_done")
+    assert not daily.roll_over(user)
+    assert daily.get_daily(user, "daily_riddles_done") == 1
+
+
+def test_set_daily_on_a_stale_record_starts_from_zero():
+    user = {"last_active_day": "2000-01-01", "daily_riddles_done": 5, "hints_used_today": 3}
+    daily.add_daily(user, "daily_riddles_done", 2)
+    assert (user["daily_riddles_done"], user["hints_used_today"]) == (2, 0)
+
+
+def test_today_key_changes_at_utc_midnight(monkeypatch):
+    for name in ("_today", "_today_ordinal", "_today_expires"):
+        monkeypatch.setattr(daily, name, getattr(daily, name))  # restored afterwards
+    daily._today_expires = 0.0
+    _at(monkeypatch, "2026-10-16T23:59:59")
+    assert (daily.today_key(), daily.is_saturday()) == ("2026-10-16", False)
+    user = {"last_active_day": "2026-10-16", "daily_riddles_done": 4}
+    _at(monkeypatch, "2026-10-17T00:00:00")
+    assert (daily.today_key(), daily.is_saturday()) == ("2026-10-17", True)
+    assert daily.get_daily(user, "daily_riddles_done") == 0
+    assert daily.today_ordinal() - datetime(2026, 10, 16).toordinal() == 1
@@ -0,0 +1,48 @@
+import textwrap
+
+import app
+from conftest import run_python
+
+
+def test_dashboard_is_closed_without_a_token():
+    assert not app.DASHBOARD_TOKEN
+    client = app.app.test_client()
+    assert client.get("/api/leaderboard/free").status_code == 403
+    assert client.get("/api/profile/1").status_code == 403
+
+
+def test_workers_only_read_the_snapshot(data_env):
+    data_env["DASHBOARD_TOKEN"] = "secret"
+    out = run_python(textwrap.dedent("""
+        import threading, time
+        import app, snapshot
+        client = app.app.test_client()
+        headers = {"X-Dashboard-Token": "secret"}
+        first = client.get("/api/leaderboard/free", headers=headers).status_code
+        time.sleep(0.2)
+        builders = [t.name for t in threading.enumerate() if t.name == "snapshot-builder"]
+        still = client.get("/api/leaderboard/free", headers=headers).status_code
+        snapshot.build()  # what cron / `python snapshot.py build` does
+        snapshot._checked_at = 0.0
+        later = client.get("/api/leaderboard/free", headers=headers).status_code
+        print(first, still, later, len(builders))
+    """), data_env)[0]
+    assert out.split() == ["503", "503", "200", "0"]
+
+
+def test_designated_builder_makes_the_first_snapshot(data_env):
+    data_env.update(DASHBOARD_TOKEN="secret", SNAPSHOT_BUILDER="1")
+    out = run_python(textwrap.dedent("""
+        import time
+        import app
+        client = app.app.test_client()
+        headers = {"X-Dashboard-Token": "secret"}
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            status = client.get("/api/leaderboard/free", headers=headers).status_code
+            if status == 200:
+                break
+            time.sleep(0.05)
+        print(status)
+    """), data_env)[0]
+    assert out.strip() == "200"
@@ -0,0 +1,47 @@
+import json
+import textwrap
+
+from conftest import run_python
+
+USERS = {
+    "7": {"username": "ada", "section": "vip", "coins": 40, "has_paid_entry": True,
+          "referrals": [9], "daily_scores": {"free": 0, "vip": 12, "premium": 0, "saturday": 0},
+          "favourite_colour": "green"},
+    "9": {"username": "bob", "section": "free", "coins": 0, "chat_id": 900},
+}
+SCORES = {"free": {"9": {"username": "bob", "points": 30}}, "vip": {"7": {"username": "ada", "points": 12}},
+          "premium": {}, "saturday": {}}
+
+
+def test_import_json_round_trip(data_env, tmp_path):
+    (tmp_path / "users.json").write_text(json.dumps(USERS))
+    (tmp_path / "scores.json").write_text(json.dumps(SCORES))
+    out = run_python(textwrap.dedent("""
+        import json
+        import database
+        counts = database.import_json("users.json", "scores.json")
+        users = {uid: user for uid, user in database.iter_users()}
+        print(json.dumps({"counts": counts, "users": users, "scores": database.get_scores(),
+                          "vip": [uid for uid, _ in database.iter_users(section="vip")]}))
+    """), data_env)[0]
+    result = json.loads(out)
+    assert result["counts"] == {"users": 2, "scores": 2}
+    assert result["scores"] == SCORES
+    assert result["vip"] == ["7"]
+    ada, bob = result["users"]["7"], result["users"]["9"]
+    for key, value in USERS["7"].items():
+        assert ada[key] == value, key
+    assert (ada["id"], bob["id"], bob["has_paid_entry"]) == (7, 9, False)
+
+
+def test_update_user_compare_and_set(data_env):
+    out = run_python(textwrap.dedent("""
+        import database
+        database.save_user(1, {"username": "ada", "streak": 1, "streak_day": 10})
+        first = database.update_user(1, {"streak": 2, "streak_day": 11}, expected={"streak_day": 10})
+        stale = database.update_user(1, {"streak": 5, "streak_day": 11}, expected={"streak_day": 10})
+        missing = database.update_user(2, {"streak": 1})
+        user = database.load_user(1)
+        print(first, stale, missing, user["streak"], user["streak_day"], user["username"])
+    """), data_env)[0]
+    assert out.split() == ["True", "False", "False", "2", "11", "ada"]
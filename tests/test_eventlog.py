@@ -0,0 +1,60 @@
+import json
+import textwrap
+
+from conftest import run_python
+
+CRASH_THEN_RETRY = textwrap.dedent("""
+    import eventlog, filestore
+    for points in (10, 5):
+        eventlog.append("answer", 1, "free", riddle_id=1, points=points, username="ada")
+    eventlog.append("answer", 2, "free", riddle_id=1, points=7, username="bob")
+
+    real_write = filestore.write_json
+    def crash_on_checkpoint(path, data, indent=2):
+        if path == eventlog.CHECKPOINT_FILE:
+            raise SystemExit("killed between the scores and checkpoint writes")
+        real_write(path, data, indent)
+    filestore.write_json = crash_on_checkpoint
+    try:
+        eventlog.materialise()
+    except SystemExit:
+        pass
+    filestore.write_json = real_write
+
+    eventlog.append("answer", 1, "free", riddle_id=2, points=3, username="ada")
+    print(eventlog.materialise(), len(eventlog.audit()))
+""")
+
+
+def test_batch_is_not_counted_twice_after_a_crash(data_env, tmp_path):
+    data_env.update(STORAGE_BACKEND="json", EVENTLOG_MATERIALISE_INTERVAL="0")
+    out = run_python(CRASH_THEN_RETRY, data_env)[0]
+    applied, mismatches = map(int, out.split())
+    assert (applied, mismatches) == (4, 0)
+    scores = json.loads((tmp_path / "scores.json").read_text())["free"]
+    assert (scores["1"]["points"], scores["2"]["points"]) == (18, 7)
+
+
+def test_first_append_can_be_durable(data_env, tmp_path):
+    # Used to wait forever for an fsync thread that was only started afterwards.
+    run_python(
+        "import eventlog; eventlog.append('answer', 1, 'free', points=1, durable=True); print('done')",
+        data_env, timeout=10,
+    )
+    assert list((tmp_path / "events").glob("*.jsonl"))
+
+
+def test_window_totals_match_replay(data_env):
+    out = run_python(textwrap.dedent("""
+        import eventlog
+        for user_id, section, points in ((1, "free", 10), (2, "free", 4), (1, "free", 5), (1, "paid", 3)):
+            eventlog.append("answer", user_id, section, riddle_id=1, points=points)
+        eventlog.append("answer", 3, "free", riddle_id=1, points=0)
+        totals = sorted(eventlog.window_totals())
+        replayed = sorted(
+            (section, int(uid), entry["points"])
+            for section, users in eventlog.replay().items() for uid, entry in users.items()
+        )
+        print(totals == replayed, totals)
+    """), data_env)[0]
+    assert out.startswith("True [('free', 1, 15), ('free', 2, 4), ('paid', 1, 3)]")
@@ -0,0 +1,28 @@
+import random
+
+import leaderboard
+
+
+def test_index_matches_a_full_sort(monkeypatch):
+    monkeypatch.setattr(leaderboard, "CHUNK_SIZE", 4)  # force many chunk splits and removals
+    rng = random.Random(7)
+    scores = {str(uid): rng.randrange(50) for uid in range(1, 40)}
+    leaderboard.rebuild_index({"free": {uid: {"points": p, "username": uid} for uid, p in scores.items()}})
+    for _ in range(2000):
+        uid = str(rng.randrange(1, 120))
+        scores[uid] = rng.randrange(60)
+        leaderboard.record_score("free", uid, uid, scores[uid])
+
+        expected = sorted((-p, u) for u, p in scores.items())
+        assert [u for u, _ in leaderboard.top_entries("free")] == [u for _, u in expected[:leaderboard.TOP_N]]
+        higher = sum(1 for p in scores.values() if p > scores[uid])
+        assert leaderboard.user_rank("free", uid) == (higher + 1, scores[uid])
+    leaderboard.rebuild_index({})
+
+
+def test_leaderboard_text_follows_top_changes():
+    leaderboard.rebuild_index({"vip": {"1": {"points": 5, "username": "ada"}}})
+    assert "ada: 5 points" in leaderboard.leaderboard_text("vip")
+    leaderboard.record_score("vip", "2", "bob", 9)
+    assert leaderboard.leaderboard_text("vip").index("bob") < leaderboard.leaderboard_text("vip").index("ada")
+    leaderboard.rebuild_index({})
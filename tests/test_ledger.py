@@ -0,0 +1,31 @@
+import textwrap
+
+from conftest import run_python
+
+
+def test_replayed_keys_apply_once(data_env):
+    out = run_python(textwrap.dedent("""
+        import ledger, user_store
+        user_store.set_user(1, {"username": "ada", "coins": 20})
+        results = [
+            ledger.apply_entry(1, 10, "purchase:ref1", "purchase"),
+            ledger.apply_entry(1, 10, "purchase:ref1", "purchase"),  # webhook delivered twice
+            ledger.apply_entry(1, -25, "hint:1", "hint"),
+            ledger.apply_entry(1, -25, "hint:1", "hint"),  # retried tap
+            ledger.apply_entry(1, -50, "hint:2", "hint"),
+            ledger.apply_entry(2, 5, "purchase:ref2", "purchase"),
+        ]
+        print(*results, ledger.get_balance(1), len(ledger.history(1)))
+    """), data_env)[0]
+    assert out.split() == ["applied", "duplicate", "applied", "duplicate", "insufficient", "no_user", "5", "3"]
+
+
+def test_credit_and_debit_treat_a_replay_as_success(data_env):
+    out = run_python(textwrap.dedent("""
+        import ledger, user_store
+        user_store.set_user(1, {"username": "ada", "coins": 0})
+        print(ledger.credit(1, 30, "k1"), ledger.credit(1, 30, "k1"),
+              ledger.debit(1, 20, "k2"), ledger.debit(1, 20, "k2"), ledger.debit(1, 20, "k3"),
+              ledger.get_balance(1))
+    """), data_env)[0]
+    assert out.split() == ["True", "True", "True", "True", "False", "10"]
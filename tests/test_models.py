@@ -0,0 +1,68 @@
+from config import POINTS_CORRECT_ANSWER, POINTS_HINT_PENALTY
+from models import Progress, UserRecord, progress_of, riddle_mask
+
+FULL = {
+    "id": 42, "username": "ada", "coins": 120, "hints": 2, "section": "vip", "daily_riddles_done": 3,
+    "last_active_day": "2026-10-17",
+    "daily_scores": {"free": 0, "vip": 27, "premium": 0, "saturday": 0},
+    "streak": 4, "streak_day": 739906, "referrals": [7, 9], "referred_by": 3,
+    "has_paid_entry": True, "payment_reference": "ref-1", "waiting_for_answer": False,
+    "current_riddle_index": 5, "using_hint_for_current": True, "coins_spent_today": 10,
+    "hints_used_today": 1, "unlocked_all": False, "answered_riddles_count": 3,
+    "is_vip": True, "chat_id": 4200, "phone": "0800", "bank": "First Bank",
+    "progress": {"a": "16", "h": "4", "s": 27},
+    "favourite_colour": "green", "notes": {"tags": ["a"]},
+}
+
+
+def test_user_record_round_trip():
+    assert UserRecord.from_dict(FULL).to_dict() == FULL
+
+
+def test_new_user_round_trips_without_optional_fields():
+    data = UserRecord.from_dict({"username": "bob", "section": "free"}, user_id=7).to_dict()
+    assert data["id"] == 7 and data["section"] == "free" and data["coins"] == 0
+    assert not {"phone", "bank", "chat_id", "is_vip", "is_premium", "progress"} & set(data)
+    assert UserRecord.from_dict(data).to_dict() == data
+
+
+def test_extra_keys_are_copied_not_shared():
+    data = {"username": "ada", "notes": {"tags": ["a"]}}
+    record = UserRecord.from_dict(data, user_id=1)
+    data["notes"]["tags"].append("b")
+    out = record.to_dict()
+    assert out["notes"] == {"tags": ["a"]}
+    out["notes"]["tags"].append("c")
+    assert record.to_dict()["notes"] == {"tags": ["a"]}
+
+
+def test_legacy_answered_dict_becomes_progress():
+    legacy = {"username": "ada", "answered": {"1": {"score": 10}, "2": {"score": 7, "used_hint": True}}}
+    data = UserRecord.from_dict(legacy, user_id=1).to_dict()
+    assert "answered" not in data
+    assert data["progress"] == {"a": "6", "h": "4", "s": 17}
+
+
+def test_progress_score_over_a_mask():
+    progress = Progress()
+    assert progress.record(1) == POINTS_CORRECT_ANSWER
+    assert progress.record(2, used_hint=True) == POINTS_CORRECT_ANSWER - POINTS_HINT_PENALTY
+    assert progress.record(200) == POINTS_CORRECT_ANSWER  # ids beyond 64 bits
+    assert progress.record(1) == 0  # answering again earns nothing
+    assert progress.count() == 3 and progress.has_answered(200) and not progress.has_answered(3)
+
+    assert progress.score() == 3 * POINTS_CORRECT_ANSWER - POINTS_HINT_PENALTY
+    assert progress.score(riddle_mask([2, 3])) == POINTS_CORRECT_ANSWER - POINTS_HINT_PENALTY
+    assert progress.score(riddle_mask([1, 200])) == 2 * POINTS_CORRECT_ANSWER
+    assert progress.score(riddle_mask([])) == 0
+
+
+def test_progress_json_and_legacy_forms_agree():
+    progress = Progress()
+    progress.record(3)
+    progress.record(70, used_hint=True)
+    again = Progress.from_json(progress.to_json())
+    assert (again.answered, again.hinted, again.total) == (progress.answered, progress.hinted, progress.total)
+    legacy = Progress.from_answered(progress.to_answered())
+    assert (legacy.answered, legacy.hinted, legacy.total) == (progress.answered, progress.hinted, progress.total)
+    assert progress_of({"answered": progress.to_answered()}).score() == progress.total
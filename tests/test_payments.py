@@ -0,0 +1,60 @@
+import sqlite3
+import time
+
+import database
+import ledger
+import payments
+import user_store
+from config import COIN_PACKS
+
+
+def _event(reference, user_id, coins):
+    return {
+        "event": "charge.success",
+        "data": {
+            "reference": reference,
+            "amount": COIN_PACKS[coins] * 100,
+            "metadata": {"purpose": "coins", "user_id": user_id, "coins": coins},
+        },
+    }
+
+
+def _wait_for_status(reference, status, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if database.get_payment(reference)["status"] == status:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_failed_fulfilment_is_retried(monkeypatch):
+    user_store.set_user(501, {"username": "payer", "coins": 0})
+    real_fulfil = payments.fulfil
+    calls = []
+
+    def flaky(reference):
+        calls.append(reference)
+        if len(calls) == 1:
+            database.set_payment_status(reference, "fulfilling", expected="received")
+            raise sqlite3.OperationalError("database is locked")
+        return real_fulfil(reference)
+
+    monkeypatch.setattr(payments, "fulfil", flaky)
+    monkeypatch.setattr(payments, "RETRY_BASE_DELAY", 0.05)
+    coins = min(COIN_PACKS)
+    assert payments.ingest(_event("ref-retry", 501, coins)) == "queued"
+
+    assert _wait_for_status("ref-retry", "fulfilled")
+    assert len(calls) == 2
+    assert ledger.get_balance(501) == coins
+
+
+def test_entry_fulfilment_changes_only_its_fields(monkeypatch):
+    user_store.set_user(502, {"username": "entrant", "coins": 3, "hints": 2, "section": "free"})
+    database.add_payment("ref-entry", 502, 0, "received", "entry", {"section": "free"})
+    monkeypatch.setattr(payments, "ENTRY_FEES", {"free": 0})
+
+    assert payments.fulfil("ref-entry") == "fulfilled"
+    user = user_store.get_user(502)
+    assert (user["has_paid_entry"], user["payment_reference"], user["hints"]) == (True, "ref-entry", 2)
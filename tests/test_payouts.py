@@ -0,0 +1,43 @@
+import csv
+import json
+import os
+import textwrap
+from datetime import date, timedelta
+
+from conftest import run_python
+
+
+def _log(events_dir, day, *records):
+    os.makedirs(events_dir, exist_ok=True)
+    with open(os.path.join(events_dir, f"{day}.jsonl"), "a") as f:
+        for user_id, points in records:
+            f.write(json.dumps({"ts": 0, "k": "answer", "u": user_id, "s": "vip", "p": points}) + "\n")
+
+
+def _winners(path):
+    with open(path) as f:
+        return [(row["telegram_id"], row["total_score"], row["rank"]) for row in csv.DictReader(f)]
+
+
+def test_winners_ranked_by_points_since_last_payout(data_env, tmp_path):
+    today = date.today()
+    days = [(today - timedelta(days=n)).isoformat() for n in range(15)]
+    events = tmp_path / "events"
+    _log(events, days[12], (1, 500))  # veteran: big, but before the previous payout
+    _log(events, days[3], (1, 5), (2, 30))
+    _log(events, days[1], (3, 20), (4, 90))  # 4 never paid the entry fee
+    (tmp_path / "payouts.json").write_text(json.dumps({"first_day": days[14], "last_day": days[8]}))
+    run_python(textwrap.dedent("""
+        import user_store
+        for uid in (1, 2, 3, 4):
+            user_store.set_user(uid, {"username": f"p{uid}", "section": "vip", "has_paid_entry": uid != 4})
+    """), data_env)
+
+    run_python(f"import payouts; payouts.export_winners('winners.csv', ['vip'], {days[0]!r})", data_env)
+    assert _winners(tmp_path / "winners.csv") == [("2", "30", "1"), ("3", "20", "2"), ("1", "5", "3")]
+    state = json.loads((tmp_path / "payouts.json").read_text())
+    assert state == {"first_day": days[7], "last_day": days[0]}
+
+    # Exporting again the same day re-exports the same window.
+    run_python(f"import payouts; payouts.export_winners('again.csv', ['vip'], {days[0]!r})", data_env)
+    assert _winners(tmp_path / "again.csv") == _winners(tmp_path / "winners.csv")
@@ -0,0 +1,60 @@
+import pytest
+import requests
+
+import paystack
+
+
+class FakeSession:
+    def __init__(self, error=None, on_request=None):
+        self.error = error
+        self.on_request = on_request
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url))
+        if self.on_request:
+            self.on_request()
+        raise self.error
+
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setattr(paystack, "PAYSTACK_SECRET_KEY", "sk_test")
+    monkeypatch.setattr(paystack, "BACKOFF_BASE", 0)
+    monkeypatch.setattr(paystack, "_consecutive_failures", 0)
+    monkeypatch.setattr(paystack, "_open_until", 0.0)
+    fake = FakeSession(requests.ReadTimeout())
+    monkeypatch.setattr(paystack, "_get_session", lambda: fake)
+    return fake
+
+
+def test_timed_out_post_is_not_retried(session):
+    assert paystack.initialize_payment("a@b.c", 100, {}) is None
+    assert len(session.calls) == 1
+
+
+def test_timed_out_get_is_retried(session):
+    assert paystack.get_transaction("ref-timeout") is None
+    assert len(session.calls) == paystack.MAX_RETRIES + 1
+
+
+def test_post_is_retried_when_it_never_connected(session):
+    session.error = requests.ConnectTimeout()
+    assert paystack.initialize_payment("a@b.c", 100, {}) is None
+    assert len(session.calls) == paystack.MAX_RETRIES + 1
+
+
+def test_breaker_lets_one_probe_through(session, monkeypatch):
+    for _ in range(paystack.BREAKER_THRESHOLD):
+        paystack.initialize_payment("a@b.c", 100, {})
+    calls = len(session.calls)
+    assert paystack.initialize_payment("a@b.c", 100, {}) is None
+    assert len(session.calls) == calls  # open: rejected without a request
+
+    monkeypatch.setattr(paystack, "_open_until", 0.0)  # cooldown over
+    during_probe = []
+    session.on_request = lambda: during_probe.append(paystack._breaker_state())
+    assert paystack.get_transaction("ref-probe") is None
+    assert len(session.calls) == calls + 1  # a single attempt, no retries
+    assert during_probe == ["open"]  # others are turned away while it is out
+    assert paystack._breaker_state() == "open"  # the failed probe re-opened it
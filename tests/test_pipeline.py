@@ -0,0 +1,59 @@
+import textwrap
+
+from conftest import run_python
+
+SETUP = textwrap.dedent("""
+    import random, threading, time
+    import pipeline
+
+    def message(update_id, user_id):
+        return {"update_id": update_id, "message": {"from": {"id": user_id}, "text": str(update_id)}}
+""")
+
+
+def test_each_users_updates_run_in_order(data_env):
+    out = run_python(SETUP + textwrap.dedent("""
+        seen = {}
+        def handle(update):
+            time.sleep(random.random() / 500)
+            user_id = pipeline.update_user_key(update)
+            seen.setdefault(user_id, []).append(update["update_id"])
+        pipeline.start(handle, workers=4)
+        sent = {}
+        for update_id in range(200):
+            user_id = update_id % 7
+            assert pipeline.submit(message(update_id, user_id)) == "queued"
+            sent.setdefault(user_id, []).append(update_id)
+        assert pipeline.drain()
+        print(seen == sent, pipeline.metrics()["processed"])
+    """), data_env)[0]
+    assert out.split() == ["True", "200"]
+
+
+def test_redelivered_update_ids_are_dropped(data_env):
+    out = run_python(SETUP + textwrap.dedent("""
+        handled = []
+        pipeline.start(lambda update: handled.append(update["update_id"]), workers=2)
+        results = [pipeline.submit(message(1, 10)), pipeline.submit(message(1, 10)),
+                   pipeline.submit(message(2, 10))]
+        assert pipeline.drain()
+        counts = pipeline.metrics()
+        print(*results, sorted(handled), counts["received"], counts["duplicates"])
+    """), data_env)[0]
+    assert out.split() == ["queued", "duplicate", "queued", "[1,", "2]", "3", "1"]
+
+
+def test_full_queue_releases_the_update_id(data_env):
+    data_env["PIPELINE_QUEUE_SIZE"] = "1"
+    out = run_python(SETUP + textwrap.dedent("""
+        release = threading.Event()
+        pipeline.start(lambda update: release.wait(5), workers=1)
+        first = pipeline.submit(message(1, 10))
+        time.sleep(0.1)  # the worker is now blocked on update 1
+        results = [first, pipeline.submit(message(2, 10)), pipeline.submit(message(3, 10))]
+        release.set()
+        assert pipeline.drain()
+        results.append(pipeline.submit(message(3, 10)))  # Telegram redelivers it
+        print(*results)
+    """), data_env)[0]
+    assert out.split() == ["queued", "queued", "full", "queued"]
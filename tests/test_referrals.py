@@ -0,0 +1,39 @@
+import textwrap
+
+from conftest import run_python
+
+SETUP = textwrap.dedent("""
+    import atexit, referrals, user_store
+    atexit.unregister(referrals._flush_at_exit)  # leave the rewards pending for the flushers
+    user_store.set_user(1, {"username": "referrer", "coins": 10})
+    for referee in range(100, 160):
+        user_store.set_user(referee, {"username": f"r{referee}"})
+        referrals.record(referee, 1)
+        referrals.queue_reward(referee, f"purchase:{referee}", amount=1)
+""")
+
+FLUSH = textwrap.dedent("""
+    import referrals
+    start_together()
+    total = 0
+    while True:
+        applied = referrals.apply_pending(limit=7)
+        if not applied:
+            break
+        total += applied
+    print(total)
+""")
+
+
+def test_concurrent_flushes_credit_each_reward_once(data_env, run_together):
+    data_env["REFERRAL_REWARD_BATCH"] = "100000"  # queue_reward must not flush by itself
+    run_python(SETUP, data_env)
+    outputs = run_together(FLUSH, procs=4)
+
+    assert sum(int(out) for out in outputs) == 60
+    balance, pending, earned = run_python(textwrap.dedent("""
+        import database, ledger, referrals
+        pending = database.get_connection().execute("SELECT COUNT(*) FROM referral_rewards_pending").fetchone()[0]
+        print(ledger.get_balance(1), pending, referrals.coins_earned(1))
+    """), data_env)[0].split()
+    assert (int(balance), int(pending), int(earned)) == (10 + 60, 0, 60)
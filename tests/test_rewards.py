@@ -0,0 +1,67 @@
+import textwrap
+
+import pytest
+
+import config
+from conftest import run_python
+
+CHECK_IN = textwrap.dedent("""
+    import rewards
+    start_together()
+    print(rewards.check_in(1) is not None)
+""")
+
+BALANCE = "import ledger, user_store; print(ledger.get_balance(1), user_store.get_user(1)['streak'])"
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "json"])
+def test_concurrent_check_ins_pay_once(data_env, run_together, backend):
+    data_env["STORAGE_BACKEND"] = backend
+    run_python("import user_store; user_store.set_user(1, {'username': 'ada', 'coins': 0})", data_env)
+    outputs = run_together(CHECK_IN, procs=4)
+
+    assert sorted(out.strip() for out in outputs) == ["False", "False", "False", "True"]
+    balance, streak = run_python(BALANCE, data_env)[0].split()
+    assert (int(balance), int(streak)) == (config.DAILY_LOGIN_REWARD + config.STREAK_BONUSES.get(1, 0), 1)
+
+
+def test_check_in_reports_nothing_when_login_was_paid(data_env):
+    out = run_python(textwrap.dedent("""
+        import daily, ledger, rewards, user_store
+        user_store.set_user(1, {"username": "ada", "coins": 0})
+        ledger.credit(1, 5, f"login:1:{daily.today_ordinal()}", "daily_login")
+        print(rewards.check_in(1), ledger.get_balance(1))
+    """), data_env)[0]
+    assert out.split() == ["None", "5"]
+
+
+def test_json_crash_after_payment_keeps_the_coins(data_env):
+    data_env["STORAGE_BACKEND"] = "json"
+    out = run_python(textwrap.dedent("""
+        import daily, ledger, rewards, user_store
+        today = daily.today_ordinal()
+        user_store.set_user(1, {"username": "ada", "coins": 0, "streak": 2, "streak_day": today - 1})
+        user_store.flush()
+
+        real_update = user_store.update_user
+        def crash(*args, **kwargs):
+            raise SystemExit("killed before the streak was written")
+        user_store.update_user = crash
+        try:
+            rewards.check_in(1)
+        except SystemExit:
+            pass
+        user_store.update_user = real_update
+        rewards._checked.clear()
+
+        print(rewards.check_in(1), ledger.get_balance(1), user_store.get_user(1)["streak"])
+    """), data_env)[0]
+    assert out.split() == ["None", str(config.DAILY_LOGIN_REWARD + config.STREAK_BONUSES[3]), "3"]
+
+
+def test_streak_bonuses_do_not_repeat():
+    import rewards
+
+    assert [rewards.bonus_for(day) for day in range(1, 15)] == [
+        config.STREAK_BONUSES.get(day, 0) for day in range(1, 8)
+    ] + [0] * 7
@@ -0,0 +1,29 @@
+import json
+import logging
+import os
+
+import riddles
+from conftest import ROOT, run_python
+
+
+def test_default_file_is_found_from_any_directory(data_env):
+    del data_env["RIDDLES_FILE"]  # run_python starts in the data dir, not the repo
+    out = run_python("import riddles; print(riddles.RIDDLES_FILE, len(riddles.section_ids('free')))", data_env)[0]
+    path, count = out.split()
+    assert path == os.path.join(ROOT, "riddles.json") and int(count) > 0
+
+
+def test_every_section_fills_a_day():
+    catalogue = riddles.load(os.path.join(ROOT, "riddles.json"))
+    for section, ids in catalogue["section_ids"].items():
+        assert len(ids) >= riddles.daily_count(section), section
+    assert len(catalogue["by_id"]) == sum(len(ids) for ids in catalogue["section_ids"].values())
+
+
+def test_short_section_is_logged(tmp_path, caplog):
+    path = tmp_path / "riddles.json"
+    path.write_text(json.dumps({"saturday": [{"question": "?", "answer": "echo"}]}))
+    with caplog.at_level(logging.WARNING, logger="riddles"):
+        riddles.load(str(path))
+    riddles.load(os.path.join(ROOT, "riddles.json"))
+    assert "'saturday' has 1 riddles" in caplog.text
@@ -0,0 +1,109 @@
+import os
+import sys
+import textwrap
+
+import pytest
+
+import telegram_client as tc
+from conftest import ROOT, run_python
+
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+from fake_servers import FakeTelegram  # noqa: E402
+
+
+@pytest.fixture
+def fake_telegram(data_env):
+    """Start a FakeTelegram; returns (start(**options), env for the child)."""
+    servers = []
+
+    def start(**options):
+        fake = FakeTelegram(**options).start()
+        servers.append(fake)
+        data_env["TELEGRAM_API_URL"] = fake.url
+        return fake
+
+    yield start, data_env
+    for fake in servers:
+        fake.stop()
+
+
+def test_recently_used_chat_keeps_its_bucket(monkeypatch):
+    monkeypatch.setattr(tc, "_chat_buckets", tc.OrderedDict())
+    monkeypatch.setattr(tc, "MAX_CHAT_BUCKETS", 50)
+    with tc._cond:
+        busy = tc._chat_bucket("busy")
+        for _ in range(tc.PER_CHAT_BURST + 2):
+            busy.reserve()
+        for i in range(500):
+            tc._chat_bucket(f"other-{i}")
+            if i % 10 == 0:
+                assert tc._chat_bucket("busy") is busy
+        assert len(tc._chat_buckets) <= 50
+        assert tc._chat_bucket("busy").next_free() > 0  # still rate limited
+
+
+def test_idle_buckets_are_dropped(monkeypatch):
+    monkeypatch.setattr(tc, "_chat_buckets", tc.OrderedDict())
+    monkeypatch.setattr(tc, "_CHAT_IDLE_EXPIRY", 0.0)
+    with tc._cond:
+        for i in range(100):
+            tc._chat_bucket(i)
+        assert list(tc._chat_buckets) == [99]
+
+
+def _texts_by_chat(fake):
+    by_chat = {}
+    for _, _, data in fake.delivered():
+        by_chat.setdefault(data["chat_id"], []).append(data["text"])
+    return by_chat
+
+
+def test_rate_limited_message_is_retried_after_retry_after(fake_telegram):
+    start, env = fake_telegram
+    fake = start(rate_limit_every=2, retry_after=1)
+    run_python(textwrap.dedent("""
+        import telegram_client as tc
+        tc.send_message(1, "first", coalesce=False)
+        tc.send_message(1, "second", coalesce=False)
+        assert tc.drain(timeout=10)
+        assert tc.stats["rate_limited"] == 1, tc.stats
+    """), env)
+    statuses = [status for _, _, _, status in fake.requests]
+    assert statuses == [200, 429, 200]
+    assert _texts_by_chat(fake) == {"1": ["first", "second"]}
+    rejected, retried = fake.requests[1][0], fake.requests[2][0]
+    assert retried - rejected >= 0.9
+
+
+def test_queued_plain_messages_are_coalesced(fake_telegram):
+    start, env = fake_telegram
+    fake = start(latency=0.3)
+    run_python(textwrap.dedent("""
+        import time
+        import telegram_client as tc
+        tc.send_message(1, "in flight")
+        time.sleep(0.1)  # the first message is now being sent
+        tc.send_message(1, "a")
+        tc.send_message(1, "b")
+        tc.send_message(1, "keyboard", reply_markup={"inline_keyboard": []})
+        tc.send_message(1, "c")
+        assert tc.drain(timeout=10)
+    """), env)
+    assert _texts_by_chat(fake) == {"1": ["in flight", "a\n\nb", "keyboard", "c"]}
+
+
+def test_each_chat_is_delivered_in_order_under_the_global_bucket(fake_telegram):
+    start, env = fake_telegram
+    fake = start(latency=0.01)
+    env.update(TELEGRAM_GLOBAL_RATE="20", TELEGRAM_PER_CHAT_RATE="50")
+    run_python(textwrap.dedent("""
+        import telegram_client as tc
+        tc.global_bucket = tc.TokenBucket(tc.GLOBAL_RATE, 1)  # no initial burst
+        for i in range(8):
+            for chat_id in range(4):
+                tc.send_message(chat_id, f"{chat_id}:{i}", coalesce=False)
+        assert tc.drain(timeout=20)
+    """), env)
+    assert _texts_by_chat(fake) == {str(c): [f"{c}:{i}" for i in range(8)] for c in range(4)}
+    times = [t for t, _, _ in fake.delivered()]
+    assert times[-1] - times[0] >= (len(times) - 1) / 20 * 0.8
@@ -0,0 +1,53 @@
+import pytest
+
+import app
+import pipeline
+import throttle
+
+
+def _update(update_id, user_id=1, chat_id=1):
+    return {"update_id": update_id, "message": {"from": {"id": user_id}, "chat": {"id": chat_id}, "text": "hi"}}
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(throttle, "users", throttle.Limiter(0.001, 3))
+    monkeypatch.setattr(throttle, "chats", throttle.Limiter(0.001, 100))
+    monkeypatch.setattr(throttle, "global_limit", throttle.Limiter(0.001, 100, max_keys=1))
+    return throttle
+
+
+def _tokens(limiter, key):
+    return int(limiter.buckets[key][0])
+
+
+def test_busy_does_not_spend_user_tokens(limits, monkeypatch):
+    monkeypatch.setattr(throttle, "global_limit", throttle.Limiter(0.001, 1, max_keys=1))
+    assert throttle.check(_update(1))[0] == "ok"
+    assert throttle.check(_update(2))[0] == "busy"
+    assert _tokens(throttle.users, 1) == 2
+
+
+def test_throttled_update_gives_its_global_token_back(limits):
+    verdicts = [throttle.check(_update(i))[0] for i in range(5)]
+    assert verdicts == ["ok", "ok", "ok", "cooldown", "drop"]
+    assert _tokens(throttle.global_limit, None) == 97
+
+
+def test_redelivered_update_is_not_throttled_again(limits, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(pipeline, "submit", lambda update, claimed=False: submitted.append(update) or "queued")
+    client = app.app.test_client()
+    update = _update(90001, user_id=7, chat_id=7)
+    for _ in range(3):
+        assert client.post("/webhook", json=update).status_code == 200
+    assert len(submitted) == 1
+    assert _tokens(throttle.users, 7) == 2
+
+
+def test_busy_update_can_be_redelivered(limits, monkeypatch):
+    monkeypatch.setattr(throttle, "global_limit", throttle.Limiter(0.001, 0, max_keys=1))
+    client = app.app.test_client()
+    update = _update(90002, user_id=8, chat_id=8)
+    assert client.post("/webhook", json=update).status_code == 503
+    assert pipeline.remember(90002)  # released for Telegram's retry
@@ -0,0 +1,38 @@
+import json
+import textwrap
+
+from conftest import run_python
+
+EDIT = textwrap.dedent("""
+    import sys
+    import user_store
+    field, value = [("coins", 70), ("hints", 9)][int(sys.argv[1])]
+    start_together()
+    user = user_store.get_user(1)
+    user[field] = value
+    user_store.set_user(1, user)
+    start_together(0.5)  # both have edited before either flushes
+    user_store.flush()
+""")
+
+
+def test_flushes_from_two_workers_keep_both_fields(data_env, tmp_path, run_together):
+    data_env.update(STORAGE_BACKEND="json", USER_STORE_FLUSH_INTERVAL="3600")
+    (tmp_path / "users.json").write_text(json.dumps({"1": {"username": "ada", "coins": 5, "hints": 1}}))
+    run_together(EDIT, procs=2)
+
+    user = json.loads((tmp_path / "users.json").read_text())["1"]
+    assert (user["username"], user["coins"], user["hints"]) == ("ada", 70, 9)
+
+
+def test_update_user_compare_and_set(data_env, tmp_path):
+    data_env.update(STORAGE_BACKEND="json")
+    (tmp_path / "users.json").write_text(json.dumps({"1": {"username": "ada", "streak_day": 10}}))
+    outputs = run_python(textwrap.dedent("""
+        import user_store
+        print(user_store.update_user(1, {"streak_day": 11, "streak": 2}, expected={"streak_day": 10}),
+              user_store.update_user(1, {"streak_day": 11, "streak": 5}, expected={"streak_day": 10}))
+    """), data_env)
+    assert outputs[0].split() == ["True", "False"]
+    user = json.loads((tmp_path / "users.json").read_text())["1"]
+    assert (user["streak_day"], user["streak"]) == (11, 2)
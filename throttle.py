@@ -0,0 +1,139 @@
+# throttle.py
+#
+# Anti-spam throttling for /webhook. Every update is checked against token
+# buckets for its sender, its chat and the whole worker before anything else
+# happens (no storage read, no Telegram call), so a user hammering an answer
+# or a use_hint/choose_* button costs a dictionary lookup per tap.
+#
+# The global bucket is checked first, so an update turned away as "busy"
+# (and redelivered by Telegram later) costs its sender nothing; an update
+# refused by its user or chat bucket gives its global token back.
+#
+# A throttled user gets a single cooldown reply; further updates are dropped
+# silently until their bucket has a token again. Both are acked with 200, so
+# Telegram does not redeliver them. Updates over the global limit get a 503
+# instead, which makes Telegram back off and retry them later.
+#
+# Buckets live in an OrderedDict kept in last-use order. A bucket idle for
+# longer than it takes to refill is indistinguishable from a new one, so
+# stale ones are popped from the front as new keys arrive: each bucket is
+# created and dropped once, O(1) amortised, and memory follows the number
+# of recently active users (capped at MAX_KEYS).
+#
+# Limits are per process; with N gunicorn workers a user can get up to N
+# times the rate, since Telegram spreads a user's updates over the workers.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+USER_RATE = float(os.getenv("THROTTLE_USER_RATE", "1"))  # updates/second
+USER_BURST = float(os.getenv("THROTTLE_USER_BURST", "8"))
+CHAT_RATE = float(os.getenv("THROTTLE_CHAT_RATE", "3"))  # group chats carry many users
+CHAT_BURST = float(os.getenv("THROTTLE_CHAT_BURST", "20"))
+GLOBAL_RATE = float(os.getenv("THROTTLE_GLOBAL_RATE", "500"))
+GLOBAL_BURST = float(os.getenv("THROTTLE_GLOBAL_BURST", "1000"))
+MAX_KEYS = int(os.getenv("THROTTLE_MAX_KEYS", "100000"))
+
+COOLDOWN_TEXT = "⏳ Slow down! You're sending too fast. Try again in {seconds} s."
+
+
+class Limiter:
+    """Token buckets keyed by id, expiring idle keys in last-use order."""
+
+    def __init__(self, rate, burst, max_keys=MAX_KEYS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.idle_expiry = burst / rate  # seconds for an empty bucket to refill
+        self.buckets = OrderedDict()  # key -> [tokens, updated, notified]
+        self.lock = threading.Lock()
+
+    def _expire(self, now):
+        buckets = self.buckets
+        while buckets:
+            key, bucket = next(iter(buckets.items()))
+            if now - bucket[1] < self.idle_expiry and len(buckets) < self.max_keys:
+                break
+            buckets.popitem(last=False)
+
+    def hit(self, key, now=None):
+        """Take a token for key. Returns (allowed, first_refusal, retry_after):
+        first_refusal is True only for the first refusal since the key was
+        last allowed, so callers can answer it once."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                self._expire(now)
+                bucket = self.buckets[key] = [self.burst, now, False]
+            else:
+                self.buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                bucket[2] = False
+                return True, False, 0.0
+            first = not bucket[2]
+            bucket[2] = True
+            return False, first, (1 - bucket[0]) / self.rate
+
+    def refund(self, key):
+        """Give back a token taken by hit() for an update that was refused
+        further along."""
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket[0] = min(self.burst, bucket[0] + 1)
+
+    def __len__(self):
+        return len(self.buckets)
+
+
+users = Limiter(USER_RATE, USER_BURST)
+chats = Limiter(CHAT_RATE, CHAT_BURST)
+global_limit = Limiter(GLOBAL_RATE, GLOBAL_BURST, max_keys=1)
+
+
+def update_ids(update):
+    """(user_id, chat_id) of an update; either may be None."""
+    for kind in ("message", "edited_message", "callback_query"):
+        body = update.get(kind)
+        if body:
+            message = body.get("message", {}) if kind == "callback_query" else body
+            return (body.get("from") or {}).get("id"), (message.get("chat") or {}).get("id")
+    return None, None
+
+
+def check(update):
+    """Decide what to do with an update: "ok", "cooldown" (drop it and send
+    the one cooldown reply), "drop" (already told) or "busy" (global limit).
+    Returns (verdict, chat_id, retry_after seconds)."""
+    user_id, chat_id = update_ids(update)
+    now = time.monotonic()
+    allowed, _, retry_after = global_limit.hit(None, now)
+    if not allowed:
+        metrics.inc("webhook_throttled_total", limit="global")
+        return "busy", chat_id, retry_after
+    for name, limiter, key in (("user", users, user_id), ("chat", chats, chat_id)):
+        if key is None:
+            continue
+        allowed, first, retry_after = limiter.hit(key, now)
+        if not allowed:
+            global_limit.refund(None)
+            if name == "chat" and user_id is not None:
+                users.refund(user_id)
+            metrics.inc("webhook_throttled_total", limit=name)
+            return ("cooldown" if first else "drop"), chat_id, retry_after
+    return "ok", chat_id, 0.0
+
+
+def cooldown_text(retry_after):
+    return COOLDOWN_TEXT.format(seconds=max(1, round(retry_after)))
+
+
+metrics.gauge("throttle_tracked_users", lambda: len(users), "user buckets currently held")
@@ -0,0 +1,260 @@
+# user_store.py
+#
+# Shared, process-resident store for user records. Every module that used to
+# load and rewrite users.json on each call goes through here instead: reads
+# are served from memory, writes mark the record dirty, and dirty records are
+# flushed in batches (on a timer or once enough have piled up) with an atomic
+# temp-file-and-rename.
+#
+# Several gunicorn workers may share the same users.json. Each worker checks
+# the file's generation (filestore.generation) before serving a read and
+# reloads it when another worker has replaced it. A flush takes the file's
+# inter-process lock, re-reads the on-disk copy and lays only this worker's
+# changes over it before renaming the new file in, so concurrent flushes are
+# serialised and never drop each other's users. Changes are tracked per
+# field: set_user() diffs the new record against the cached one, and only
+# the fields that differ replace the on-disk values, so two workers editing
+# different fields of one user both keep their edit. Two workers changing
+# the same field still race (last flush wins); update_user() with `expected`
+# is the compare-and-set for fields where that matters.
+#
+# With STORAGE_BACKEND=sqlite (the default) records live in database.py
+# instead; SQLite gives point reads/writes and cross-process safety on its
+# own, so nothing is cached here and flush() is a no-op.
+#
+# Resident records are models.UserRecord objects rather than dicts to keep
+# the per-user memory small; callers still get and put plain dicts.
+
+import atexit
+import json
+import os
+import threading
+import time
+
+import database
+import filestore
+import metrics
+from models import UserRecord
+from config import DATA_DIR, STORAGE_BACKEND
+
+USERS_FILE = os.path.join(DATA_DIR, "users.json")
+
+FLUSH_INTERVAL = float(os.getenv("USER_STORE_FLUSH_INTERVAL", "2.0"))  # seconds
+FLUSH_THRESHOLD = int(os.getenv("USER_STORE_FLUSH_THRESHOLD", "100"))  # dirty records
+
+_lock = threading.RLock()
+_users = {}
+_dirty = {}  # uid -> set of changed fields, or None for a record new to this worker
+_loaded = False
+_loaded_generation = None
+_flusher = None
+
+
+def _use_sqlite():
+    return STORAGE_BACKEND == "sqlite"
+
+
+@metrics.timed("storage_io_seconds", op="users_reload")
+def _read_file():
+    if not os.path.exists(USERS_FILE):
+        return {}
+    with open(USERS_FILE, "r") as f:
+        raw = json.load(f)
+    return {uid: UserRecord.from_dict(data, uid) for uid, data in raw.items()}
+
+
+def _refresh_locked():
+    """Reload users.json if it changed on disk, keeping our unflushed edits."""
+    global _users, _loaded, _loaded_generation
+    generation = filestore.generation(USERS_FILE)
+    if _loaded and generation == _loaded_generation:
+        return
+    users = _read_file()
+    for uid, fields in _dirty.items():
+        users[uid] = _merge(users.get(uid), _users[uid], fields, uid)
+    _users = users
+    _loaded = True
+    _loaded_generation = generation
+
+
+def _merge(on_disk, ours, fields, uid):
+    """Our record's changed fields laid over the on-disk record."""
+    if on_disk is None or fields is None:
+        return ours
+    merged = on_disk.to_dict()
+    changed = ours.to_dict()
+    for field in fields:
+        if field in changed:
+            merged[field] = changed[field]
+        else:
+            merged.pop(field, None)
+    return UserRecord.from_dict(merged, uid)
+
+
+def _store_locked(uid, record):
+    """Replace a cached record and remember which fields changed."""
+    old = _users.get(uid)
+    _users[uid] = record
+    if old is None:
+        _dirty[uid] = None
+        return
+    if uid in _dirty and _dirty[uid] is None:
+        return
+    before, after = old.to_dict(), record.to_dict()
+    fields = {k for k in before.keys() | after.keys() if before.get(k) != after.get(k)}
+    if fields:
+        _dirty[uid] = _dirty.get(uid, set()) | fields
+
+
+@metrics.timed("storage_io_seconds", op="users_flush")
+def _write_atomic(users):
+    with filestore.atomic_write(USERS_FILE) as f:
+        # One record at a time, so a flush never holds a dict copy of everyone.
+        f.write("{")
+        for i, (uid, rec) in enumerate(users.items()):
+            body = json.dumps(rec.to_dict(), indent=2).replace("\n", "\n  ")
+            f.write(f'{"," if i else ""}\n  {json.dumps(uid)}: {body}')
+        f.write("\n}" if users else "}")
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    _flusher = threading.Thread(target=_flush_loop, name="user-store-flush", daemon=True)
+    _flusher.start()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+def flush():
+    """Write all dirty records to disk. Returns the number of records written."""
+    if _use_sqlite():
+        return 0
+    with _lock:
+        if not _dirty:
+            return 0
+        with filestore.locked(USERS_FILE):
+            _refresh_locked()
+            return _flush_locked()
+
+
+def _flush_locked():
+    """Write the cache out; caller holds _lock and the file lock, and has
+    just refreshed."""
+    global _loaded_generation
+    _write_atomic(_users)
+    _loaded_generation = filestore.generation(USERS_FILE)
+    written = len(_dirty)
+    _dirty.clear()
+    return written
+
+
+@metrics.timed("user_store_seconds", op="get")
+def get_user(user_id):
+    """Return a copy of the user's record, or None if the user is unknown."""
+    if _use_sqlite():
+        return database.load_user(user_id)
+    with _lock:
+        _refresh_locked()
+        user = _users.get(str(user_id))
+        return user.to_dict() if user is not None else None
+
+
+@metrics.timed("user_store_seconds", op="set")
+def set_user(user_id, user_data):
+    """Store a user's record; it reaches disk on the next flush."""
+    if _use_sqlite():
+        database.save_user(user_id, user_data)
+        return
+    uid = str(user_id)
+    with _lock:
+        _refresh_locked()
+        _store_locked(uid, UserRecord.from_dict(user_data, uid))
+        pending = len(_dirty)
+    if pending >= FLUSH_THRESHOLD:
+        flush()
+    else:
+        _ensure_flusher()
+
+
+def set_users(users):
+    """Store many {user_id: record} entries and write them out together."""
+    if not users:
+        return
+    if _use_sqlite():
+        database.save_users(users)
+        return
+    with _lock:
+        _refresh_locked()
+        for user_id, user_data in users.items():
+            uid = str(user_id)
+            _store_locked(uid, UserRecord.from_dict(user_data, uid))
+    flush()
+
+
+def update_user(user_id, changes, expected=None):
+    """Set only the given keys of a user's record. With `expected` (a dict of
+    key -> value) this is a compare-and-set across workers: the change is
+    made, and written out at once, only if those keys still hold those
+    values. Returns True if the record changed."""
+    if _use_sqlite():
+        return database.update_user(user_id, changes, expected)
+    uid = str(user_id)
+    with _lock:
+        if not expected:
+            _refresh_locked()
+            user = _users.get(uid)
+            if user is None:
+                return False
+            _store_locked(uid, UserRecord.from_dict({**user.to_dict(), **changes}, uid))
+            pending = len(_dirty)
+        else:
+            with filestore.locked(USERS_FILE):
+                _refresh_locked()
+                user = _users.get(uid)
+                if user is None:
+                    return False
+                data = user.to_dict()
+                if any(data.get(k) != v for k, v in expected.items()):
+                    return False
+                _store_locked(uid, UserRecord.from_dict({**data, **changes}, uid))
+                _flush_locked()
+            return True
+    if pending >= FLUSH_THRESHOLD:
+        flush()
+    else:
+        _ensure_flusher()
+    return True
+
+
+def iter_users(section=None, after_id=None):
+    """Yield (user_id, record copy) in user_id order, optionally one section only
+    and/or only ids greater than after_id (to resume an interrupted pass)."""
+    if _use_sqlite():
+        yield from database.iter_users(section=section, after_id=after_id)
+        return
+    with _lock:
+        _refresh_locked()
+        uids = sorted(_users, key=int)
+    if after_id is not None:
+        uids = [uid for uid in uids if int(uid) > int(after_id)]
+    for uid in uids:
+        user = get_user(uid)
+        if user is not None and (section is None or user.get("section") == section):
+            yield uid, user
+
+
+def count_users():
+    if _use_sqlite():
+        return database.count_users()
+    with _lock:
+        _refresh_locked()
+        return len(_users)
+
+
+atexit.register(flush)
@@ -1,39 +1,41 @@
 # webhook.py
 
-from flask import Blueprint, request, jsonify
-import hmac
-import hashlib
 import json
-from config import PAYSTACK_WEBHOOK_SECRET
+import threading
+
+from flask import Blueprint, request, jsonify
+
+import payments
 
 webhook_bp = Blueprint("webhook", __name__)
 
-@webhook_bp.route("/paystack-webhook", methods=["POST"])
-def paystack_webhook():
-    # Verify Paystack signature
-    paystack_signature = request.headers.get("x-paystack-signature")
-    payload = request.data
+_startup_done = False
+_startup_lock = threading.Lock()
 
-    computed_signature = hmac.new(
-        PAYSTACK_WEBHOOK_SECRET.encode("utf-8"),
-        payload,
-        hashlib.sha512
-    ).hexdigest()
 
-    if computed_signature != paystack_signature:
-        return jsonify({"error": "Invalid signature"}), 403
+def _requeue_once():
+    # Pick up payments a previous process received but did not fulfil.
+    global _startup_done
+    if _startup_done:
+        return
+    with _startup_lock:
+        if not _startup_done:
+            _startup_done = True
+            payments.requeue_pending()
 
-    # Parse the webhook event
-    event = json.loads(payload.decode("utf-8"))
-    event_type = event.get("event")
-    data = event.get("data", {})
 
-    # Example: Payment successful
-    if event_type == "charge.success":
-        customer_email = data.get("customer", {}).get("email")
-        amount_paid = data.get("amount") / 100  # convert kobo to naira
+@webhook_bp.route("/paystack-webhook", methods=["POST"])
+def paystack_webhook():
+    payload = request.get_data()
+    if not payments.verify_signature(payload, request.headers.get("x-paystack-signature")):
+        return jsonify({"error": "Invalid signature"}), 403
 
-        # TODO: Mark user as premium/VIP based on amount_paid
-        print(f"Payment received from {customer_email}: ₦{amount_paid}")
+    try:
+        event = json.loads(payload.decode("utf-8"))
+    except ValueError:
+        return jsonify({"error": "Invalid payload"}), 400
 
-    return jsonify({"status": "success"}), 200
+    # Record and ack now; fulfilment runs in the background (see payments.py).
+    _requeue_once()
+    result = payments.ingest(event)
+    return jsonify({"status": "success", "result": result}), 200